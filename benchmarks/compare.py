@@ -0,0 +1,49 @@
+import argparse
+import json
+from pathlib import Path
+from typing import *
+
+THRESHOLD = .1  # относительное замедление медианы, считающееся регрессией
+
+
+def load(path: Path) -> Dict[Tuple[str, Optional[int]], Dict[str, Any]]:
+    """
+    :return: результаты замеров по парам (название, размер журнала)
+    """
+    with path.open() as f:
+        return {(it['name'], it['rows']): it for it in json.load(f)['results']}
+
+
+def compare(old: Dict[Tuple[str, Optional[int]], Dict[str, Any]], new: Dict[Tuple[str, Optional[int]], Dict[str, Any]],
+            threshold: float = THRESHOLD) -> Iterator[Tuple[str, Optional[int], float, float, bool]]:
+    """
+    :return: для замеров, присутствующих в обоих результатах: название, размер журнала, медианы старого и нового
+             времени и является ли изменение регрессией
+    """
+    for key, it in new.items():
+        if key not in old:
+            continue
+
+        old_median, new_median = old[key]['median'], it['median']
+        yield key[0], key[1], old_median, new_median, new_median > old_median * (1 + threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнивает результаты замеров benchmarks/run.py')
+    parser.add_argument(dest='old', type=Path, help='результаты до изменений')
+    parser.add_argument(dest='new', type=Path, help='результаты после изменений')
+    parser.add_argument('--threshold', dest='threshold', type=float, default=THRESHOLD,
+                        help='относительное замедление, считающееся регрессией')
+    args = parser.parse_args()
+
+    regressions = 0
+    for name, rows, old_median, new_median, regression in compare(load(args.old), load(args.new), args.threshold):
+        regressions += regression
+        print(f'{name:<28} rows={rows!s:<10} {old_median:12.6f} -> {new_median:12.6f}  '
+              f'{new_median / old_median:6.2f}x{"  РЕГРЕССИЯ" if regression else ""}')
+
+    exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from sys import path
+from typing import *
+
+APP_ROOT: Path = Path(__file__).absolute().parent.parent
+path.append(str(APP_ROOT / 'wtc'))
+
+from sqlalchemy import create_engine  # noqa: E402
+from database.orm import Base, SCHEMA_VERSION, split_by_days  # noqa: E402
+
+TIMEZONE = 'Europe/Berlin'  # часовой пояс с переходом на летнее время
+MAX_DAYS = 30 * 365  # журнал длиннее 30 лет не удлиняется, а становится плотнее
+ROWS_PER_DAY = 8  # среднее количество записей за рабочий день в журнале до MAX_DAYS дней
+CHUNK = 100_000  # количество записей, добавляемых в базу за раз
+
+
+def set_timezone(tz: str):
+    """
+    Устанавливает часовой пояс процесса и запускаемых им программ. Сводки журнала зависят от часового пояса,
+    поэтому журнал должен генерироваться и использоваться в одном поясе
+    """
+    os.environ['TZ'] = tz
+    time.tzset()
+
+
+def day_weights(days: Sequence[date], rnd: random.Random) -> List[float]:
+    """
+    :return: относительное количество записей за каждый день: в выходные работают меньше, в отпуске не работают
+    """
+    weights = []
+    vacation = 0
+    for day in days:
+        if vacation == 0 and rnd.random() < 1 / 60:
+            vacation = rnd.randint(3, 14)
+
+        if vacation:
+            vacation -= 1
+            weights.append(0.)
+        else:
+            weights.append((.3 if day.weekday() >= 5 else 1.) * rnd.uniform(.5, 1.5))
+
+    return weights
+
+
+def day_counts(rows: int, days: Sequence[date], rnd: random.Random) -> List[int]:
+    """
+    :return: количество записей за каждый день, в сумме ровно rows
+    """
+    weights = day_weights(days, rnd)
+    total = sum(weights) or 1
+    counts = [int(rows * it / total) for it in weights]
+
+    working = [n for n, it in enumerate(weights) if it] or list(range(len(days)))
+    for n in range(rows - sum(counts)):
+        counts[working[n % len(working)]] += 1
+
+    return counts
+
+
+def is_dst_transition(day: date) -> bool:
+    """
+    :return: отличается ли длительность дня от 24 часов(переход на летнее время или обратно)
+    """
+    midnight = datetime.fromordinal(day.toordinal())
+    return (midnight + timedelta(days=1)).timestamp() - midnight.timestamp() != 24 * 60 * 60
+
+
+def day_periods(day: date, count: int, rnd: random.Random, overnight: bool) -> List[Tuple[int, int]]:
+    """
+    Записи журнала за день: работа с перерывами, продолжающаяся иногда после полуночи, а в дни перехода на летнее
+    время и обратно - ночная запись через момент перехода.
+
+    :param overnight: может ли последняя запись закончиться после полуночи
+    :return: count непересекающихся промежутков (начало, конец) в секундах от начала эпохи по возрастанию
+    """
+    if count == 0:
+        return []
+
+    midnight = datetime.fromordinal(day.toordinal())
+    res = []
+    if is_dst_transition(day):
+        # с 01:00 до 04:00 по местному времени, в эти часы обычная работа не ведется
+        res.append((int(midnight.timestamp()) + 60 * 60, int((midnight + timedelta(hours=4)).timestamp())))
+        count -= 1
+
+    if count:
+        # рабочее окно начинается в 7-9 часов и при большом количестве записей растягивается до 23:30
+        window_begin = int((midnight + timedelta(hours=7, seconds=rnd.randint(0, 2 * 60 * 60))).timestamp())
+        window_end = int((midnight + timedelta(hours=23, minutes=30)).timestamp())
+        window = min(max(9 * 60 * 60 + rnd.randint(0, 2 * 60 * 60), 2 * count * 60), window_end - window_begin)
+
+        points = sorted(rnd.sample(range(window_begin, window_begin + window), 2 * count))
+        res.extend(zip(points[::2], points[1::2]))
+
+        if overnight and rnd.random() < .1:
+            # засиделся после полуночи: запись заканчивается до 01:00 следующего дня
+            next_midnight = int((midnight + timedelta(days=1)).timestamp())
+            res[-1] = (res[-1][0], next_midnight + rnd.randint(10 * 60, 50 * 60))
+
+    return res
+
+
+def generate(database: Path, rows: int, seed: int = 0, end: Optional[date] = None) -> int:
+    """
+    Создает базу со сгенерированным журналом и сводками
+
+    :param rows: количество записей журнала
+    :param end: день, до которого(не включительно) генерируется журнал, по умолчанию - сегодня
+    :return: количество записей журнала
+    """
+    assert rows > 0 and not database.exists()
+
+    rnd = random.Random(seed)
+    end = end or date.today()
+    days = [end - timedelta(days=n) for n in range(min(max(rows // ROWS_PER_DAY, 1), MAX_DAYS), 0, -1)]
+    counts = day_counts(rows, days, rnd)
+
+    # схема создается по моделям orm, чтобы не расходиться с приложением
+    engine = create_engine('sqlite:///' + str(database))
+    engine.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    Base.metadata.create_all(engine)
+    engine.dispose()
+
+    day_seconds: Dict[date, float] = {}
+    month_seconds: Dict[date, float] = {}
+    connection = sqlite3.connect(str(database))
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+
+        chunk = []
+        written = 0
+        for n, (day, count) in enumerate(zip(days, counts)):
+            next_midnight = datetime.fromordinal(day.toordinal() + 1).timestamp()
+            for begin, period_end in day_periods(day, count, rnd, overnight=n + 1 < len(days)):
+                if period_end <= next_midnight:
+                    day_seconds[day] = day_seconds.get(day, 0) + period_end - begin
+                else:
+                    for it, seconds in split_by_days(datetime.fromtimestamp(begin), datetime.fromtimestamp(period_end)):
+                        day_seconds[it] = day_seconds.get(it, 0) + seconds
+
+                chunk.append((begin, period_end))
+
+            if len(chunk) >= CHUNK:
+                connection.executemany('INSERT INTO work_periods ("begin", "end") VALUES (?, ?)', chunk)
+                written += len(chunk)
+                chunk = []
+
+        connection.executemany('INSERT INTO work_periods ("begin", "end") VALUES (?, ?)', chunk)
+        written += len(chunk)
+
+        for day, seconds in day_seconds.items():
+            month = day.replace(day=1)
+            month_seconds[month] = month_seconds.get(month, 0) + seconds
+
+        connection.executemany('INSERT INTO work_days (day, seconds) VALUES (?, ?)',
+                               ((it.isoformat(), seconds) for it, seconds in day_seconds.items()))
+        connection.executemany('INSERT INTO work_months (month, seconds) VALUES (?, ?)',
+                               ((it.isoformat(), seconds) for it, seconds in month_seconds.items()))
+        connection.commit()
+    finally:
+        connection.close()
+
+    assert written == rows
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерирует базу с синтетическим журналом для бенчмарков')
+    parser.add_argument(dest='database', type=Path, help='создаваемый файл базы')
+    parser.add_argument('--rows', dest='rows', type=int, default=100_000, help='количество записей журнала')
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    parser.add_argument('--tz', dest='tz', default=TIMEZONE, help='часовой пояс журнала')
+    args = parser.parse_args()
+
+    if args.database.exists():
+        print("Ошибка! Файл базы уже существует!")
+        return
+
+    set_timezone(args.tz)
+    begin = time.perf_counter()
+    generate(args.database, args.rows, args.seed)
+    print(f"Сгенерировано записей: {args.rows} за {time.perf_counter() - begin:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
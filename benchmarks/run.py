@@ -0,0 +1,240 @@
+import argparse
+import json
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+from typing import *
+
+from generate import APP_ROOT, TIMEZONE, set_timezone, generate
+
+import sqlalchemy  # noqa: E402
+from database import Period, new_session, add_to_rollups, init  # noqa: E402
+from work_statistics import WorkStatistics  # noqa: E402
+
+DATA_DIR = APP_ROOT / 'benchmarks' / 'data'  # сгенерированные журналы переиспользуются между запусками
+FROM_STRING_CALLS = 10_000  # количество разборов периода в одном замере Period.from_string
+DAEMON_COMMITS = 100  # количество сбросов в базу в одном замере пропускной способности демона
+
+
+class Runner:
+    """
+    Запуск замеров для одного журнала. Каждый замер повторяется repeat раз, в результат попадают все времена
+    """
+
+    __slots__ = ('_journal', '_rows', '_repeat', '_workdir', 'results')
+
+    def __init__(self, journal: Optional[Path], rows: Optional[int], repeat: int, workdir: Path):
+        """
+        :param journal: сгенерированная база, None - для замеров, не зависящих от журнала
+        """
+        self._journal = journal
+        self._rows = rows
+        self._repeat = repeat
+        self._workdir = workdir
+        self.results: List[Dict[str, Any]] = []
+
+    def measure(self, name: str, func: Callable[[], Any], setup: Optional[Callable[[], Any]] = None,
+                unit: str = 's'):
+        """
+        Замеряет время выполнения func, setup выполняется перед каждым повтором и не учитывается
+        """
+        times = []
+        for _ in range(self._repeat):
+            if setup is not None:
+                setup()
+            begin = perf_counter()
+            func()
+            times.append(perf_counter() - begin)
+
+        self.results.append({
+            'name': name,
+            'rows': self._rows,
+            'unit': unit,
+            'min': min(times),
+            'median': median(times),
+            'times': times
+        })
+        print(f'{name:<28} rows={self._rows!s:<10} median={median(times):.6f}{unit}  min={min(times):.6f}{unit}')
+
+    def fresh_database(self) -> Path:
+        """
+        :return: копия журнала, которую замеры могут изменять. Подключается к orm
+        """
+        database = self._workdir / 'stats.sqlite'
+        shutil.copyfile(self._journal, database)
+        init('sqlite:///' + str(database))
+        return database
+
+    def run_statistics(self):
+        """
+        Замеры подсчета статистики: WorkStatistics.from_db (в том числе со снимком), update, period_stat
+        """
+        database = self.fresh_database()
+        self.measure('from_db', WorkStatistics.from_db)
+        self.measure('from_db_index', lambda: WorkStatistics.from_db(index=True))
+
+        # запуск монитора stat -f: снимок, сохраненный предыдущим запуском, избавляет от просмотра журнала за год
+        snapshot = self._workdir / 'stats.snapshot'
+        WorkStatistics.from_db(snapshot=snapshot)
+        self.measure('from_db_snapshot', lambda: WorkStatistics.from_db(snapshot=snapshot))
+
+        # update подгружает одну новую запись, добавленную вне замера. Журнал заканчивается вчера
+        stats = WorkStatistics.from_db()
+        new_periods = iter(range(self._repeat, 0, -1))
+
+        def add_period():
+            begin = int(datetime.now().timestamp()) - next(new_periods) * 60 - 60
+            with sqlite3.connect(str(database)) as connection:
+                connection.execute('INSERT INTO work_periods ("begin", "end") VALUES (?, ?)', (begin, begin + 30))
+
+        self.measure('update', stats.update, setup=add_period)
+
+        today = date.today()
+        last_year = today.year - 1
+        periods = {
+            'day': Period.from_string(f'{today - timedelta(days=3):%d.%m.%Y}'),
+            'month': Period.from_string(f'{today.month:02}.{today.year}'),
+            'year': Period.from_string(str(last_year)),
+            'all': Period(datetime(1970, 1, 2), datetime.now())
+        }
+        for name, p in periods.items():
+            self.measure(f'period_stat_{name}', lambda: WorkStatistics.period_stat(p))
+
+    def run_daemon(self):
+        """
+        Пропускная способность записи демона: продление текущей записи, обновление сводок и commit, как в
+        daemon.main_loop
+        """
+        self.fresh_database()
+        begin = datetime.now().replace(microsecond=0) - timedelta(seconds=30 * DAEMON_COMMITS * self._repeat)
+        end = begin + timedelta(seconds=1)
+
+        with new_session() as session:
+            session.add(Period(begin, end))
+            session.commit()
+
+            def commits():
+                nonlocal end
+                for _ in range(DAEMON_COMMITS):
+                    new_end = end + timedelta(seconds=30)
+                    session.query(Period).filter(Period.begin == begin).update({'end': new_end})
+                    add_to_rollups(session, end, new_end)
+                    session.commit()
+                    end = new_end
+
+            self.measure(f'daemon_commit_x{DAEMON_COMMITS}', commits)
+
+    def run_cli(self):
+        """
+        Время выполнения команд wtc.py с запуском интерпретатора, как их вызывает пользователь
+        """
+        app_root = self._workdir / 'app'
+        if app_root.exists():
+            shutil.rmtree(app_root)
+        shutil.copytree(APP_ROOT / 'wtc', app_root / 'wtc', ignore=shutil.ignore_patterns('__pycache__'))
+        shutil.copyfile(self._journal, app_root / 'stats.sqlite')
+
+        def wtc(*args: str) -> Callable[[], None]:
+            return lambda: subprocess.run([sys.executable, str(app_root / 'wtc' / 'wtc.py'), *args],
+                                          check=True, stdout=subprocess.DEVNULL)
+
+        wtc('about')()  # создает файл настроек и компилирует модули
+
+        self.measure('cli_stat', wtc('stat'))  # снимок статистики не используется, см. fast_stat
+        self.measure('cli_stat_year', wtc('stat', str(date.today().year - 1)))
+        self.measure('cli_stat_by_month', wtc('stat', str(date.today().year - 1), '--by', 'month'))
+
+    def run_parsing(self):
+        """
+        Разбор периодов командной строки
+        """
+        strings = ('2019', '07.2019', '10.07.2019', '01.01.2019-01.01.2020', '01.2019-01.2020', '01.01.2019-now')
+
+        def parse():
+            for n in range(FROM_STRING_CALLS):
+                Period.from_string(strings[n % len(strings)])
+
+        self.measure(f'period_from_string_x{FROM_STRING_CALLS}', parse)
+
+
+def journal(rows: int, seed: int, tz: str) -> Path:
+    """
+    :return: сгенерированный журнал, при отсутствии он создается
+    """
+    database = DATA_DIR / f'journal-{rows}-{seed}-{tz.replace("/", "_")}-{date.today().isoformat()}.sqlite'
+    if not database.exists():
+        DATA_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = database.with_name(database.name + '.tmp')
+        if tmp.exists():
+            tmp.unlink()
+
+        print(f'генерация журнала из {rows} записей...')
+        generate(tmp, rows, seed)
+        tmp.rename(database)
+
+    return database
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=str(APP_ROOT), check=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности подсчета статистики и записи журнала')
+    parser.add_argument('--rows', dest='rows', type=int, nargs='+', default=[10_000, 100_000],
+                        help='размеры журналов, на которых выполняются замеры')
+    parser.add_argument('--repeat', dest='repeat', type=int, default=5, help='количество повторов каждого замера')
+    parser.add_argument('--seed', dest='seed', type=int, default=0)
+    parser.add_argument('--tz', dest='tz', default=TIMEZONE, help='часовой пояс журнала')
+    parser.add_argument('--skip-cli', dest='skip_cli', action='store_true', help='не замерять запуск wtc.py')
+    parser.add_argument('-o', '--output', dest='output', type=Path, default=None,
+                        help='файл результатов, по умолчанию benchmarks/results-<ревизия>.json')
+    args = parser.parse_args()
+
+    set_timezone(args.tz)
+    revision = git_revision()
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        runner = Runner(None, None, args.repeat, Path(workdir))
+        runner.run_parsing()
+        results.extend(runner.results)
+
+        for rows in args.rows:
+            runner = Runner(journal(rows, args.seed, args.tz), rows, args.repeat, Path(workdir))
+            runner.run_statistics()
+            runner.run_daemon()
+            if not args.skip_cli:
+                runner.run_cli()
+            results.extend(runner.results)
+
+    output = args.output or APP_ROOT / 'benchmarks' / f'results-{(revision or "unknown")[:10]}.json'
+    with output.open('w') as f:
+        json.dump({
+            'revision': revision,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'platform': platform.platform(),
+            'timezone': args.tz,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'results': results
+        }, f, indent=2)
+
+    print(f'результаты записаны в {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,3 +3,7 @@ from os import chdir
 
 chdir('./tests')
 path.append('../wtc')
+
+# numpy загружается при первом обращении, а импорт внутри freeze_time ломает freezegun
+import numpy_engine
+numpy_engine.available()
@@ -1,2 +1,2 @@
-from .db_menenger import DatabaseManager
+from .db_menenger import DatabaseManager, patch_new_session
 from .functions import get_max_end_time
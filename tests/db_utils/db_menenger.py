@@ -1,5 +1,6 @@
 from contextlib import contextmanager
 from datetime import datetime
+from unittest.mock import patch
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from typing import *
@@ -34,8 +35,17 @@ class DatabaseManager:
 
         return sum(
             (min(it.end, p.end) - max(it.begin, p.begin)).total_seconds()
-            for it in self.session.query(Period).filter(
-                    # str по тому что в sqlite datetime хранится как строка
-                    (Period.end > str(p.begin)) & (Period.begin < str(p.end))
-                )
+            for it in self.session.query(Period).filter((Period.end > p.begin) & (Period.begin < p.end))
         )
+
+
+def patch_new_session(session: Session, target: str = 'work_statistics.new_session'):
+    """
+    :return: patch, после которого new_session в target отдает session, например сессию
+             DatabaseManager.new_session_context, чтобы тест видел свои изменения в бд
+    """
+    @contextmanager
+    def session_context():
+        yield session
+
+    return patch(target, side_effect=session_context)
@@ -0,0 +1,42 @@
+import os
+import time
+from datetime import date, datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.generate import generate, set_timezone, is_dst_transition
+from database import Period, DayRollup, MonthRollup, rebuild_rollups
+
+
+def test_generate(tmp_path):
+    tz = os.environ.get('TZ')
+    set_timezone('Europe/Berlin')
+    try:
+        database = tmp_path / 'journal.sqlite'
+        assert generate(database, 2000, end=date(2019, 11, 1)) == 2000
+
+        session = sessionmaker(bind=create_engine('sqlite:///' + str(database)))()
+        periods = session.query(Period.begin, Period.end).order_by(Period.begin).all()
+        assert len(periods) == 2000
+        assert all(begin < end for begin, end in periods)
+        assert all(prev[1] <= it[0] for prev, it in zip(periods, periods[1:]))
+        assert periods[-1][1] < datetime(2019, 11, 1)
+
+        # в журнал попадают переходы на летнее время и обратно
+        transitions = [datetime(2019, 3, 31, 3).timestamp() - 1, datetime(2019, 10, 27, 3).timestamp()]
+        assert all(is_dst_transition(datetime.fromtimestamp(it).date()) for it in transitions)
+        assert all(any(begin.timestamp() < it < end.timestamp() for begin, end in periods) for it in transitions)
+
+        # сводки совпадают с пересчитанными приложением
+        days = dict(session.query(DayRollup.day, DayRollup.seconds))
+        months = dict(session.query(MonthRollup.month, MonthRollup.seconds))
+        rebuild_rollups(session)
+        assert days == dict(session.query(DayRollup.day, DayRollup.seconds))
+        assert months == dict(session.query(MonthRollup.month, MonthRollup.seconds))
+        session.close()
+    finally:
+        if tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = tz
+        time.tzset()
@@ -0,0 +1,178 @@
+from unittest.mock import patch
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from math import isclose
+from pathlib import Path
+from shutil import copyfile
+from pytest import raises
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from binlog import BinLog, BinLogWriter, from_sqlite, to_sqlite
+from database import Period, DayRollup, MonthRollup
+from merge import union
+from heartbeat import Heartbeat
+from period_parser import parse_period
+from reports import grouped_stat
+from work_statistics import WorkStatistics
+import daemon
+import fast_stat
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def test_writer(tmp_path):
+    path = tmp_path / 'stats.binlog'
+    begin = datetime(2019, 9, 1, 10)
+
+    with BinLogWriter(path) as writer:
+        assert writer.last is None
+        writer.append(begin, begin + timedelta(minutes=5))
+        writer.append(begin + timedelta(hours=1), begin + timedelta(hours=2))
+        writer.update_last(begin + timedelta(hours=3))
+
+    expected = [(int(begin.timestamp()), int(begin.timestamp()) + 5 * 60),
+                (int(begin.timestamp()) + 3600, int(begin.timestamp()) + 3 * 3600)]
+    for use_numpy in (False, True):
+        with BinLog(path, use_numpy) as journal:
+            assert list(journal.rows()) == expected
+            assert journal.last_end == expected[-1][1]
+            assert journal.period_stat(Period(begin, begin + timedelta(hours=2))) == timedelta(minutes=65)
+
+    # оборванная при аварийном завершении запись отбрасывается
+    with path.open('ab') as f:
+        f.write(b'\x01\x02\x03')
+    with BinLog(path) as journal:
+        assert list(journal.rows()) == expected
+    with BinLogWriter(path) as writer:
+        assert writer.last == expected[-1]
+        writer.append(begin + timedelta(hours=4), begin + timedelta(hours=5))
+    with BinLog(path) as journal:
+        assert len(journal) == 3
+
+    # пересекающаяся с последней запись не добавляется
+    with BinLogWriter(path) as writer:
+        with raises(ValueError):
+            writer.append(begin + timedelta(hours=4, minutes=30), begin + timedelta(hours=6))
+        with raises(ValueError):
+            writer.extend([(expected[-1][1] + 7200, expected[-1][1] + 9000), (expected[-1][1] + 8000, 0)])
+        assert writer.last == (expected[-1][1] + 7200, expected[-1][1] + 9000)
+    with BinLog(path) as journal:
+        assert len(journal) == 4
+
+    with raises(FileNotFoundError):
+        BinLog(tmp_path / 'missing.binlog')
+    (tmp_path / 'garbage').write_bytes(b'garbage' * 10)
+    with raises(ValueError):
+        BinLog(tmp_path / 'garbage')
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestBinLog:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_convert(self, tmp_path):
+        path = tmp_path / 'stats.binlog'
+        rows = [(int(it.begin.timestamp()), int(it.end.timestamp()))
+                for it in self.database_manager.session.query(Period).order_by(Period.begin)]
+        assert from_sqlite(DATABASE, path) == len(rows)
+
+        with BinLog(path) as journal:
+            assert list(journal.rows()) == rows
+
+        # обратное преобразование восстанавливает записи и сводки
+        database = 'sqlite:///' + str(tmp_path / 'stats.sqlite')
+        assert to_sqlite(path, database) == len(rows)
+        session = sessionmaker(bind=create_engine(database))()
+        assert [(int(it.begin.timestamp()), int(it.end.timestamp()))
+                for it in session.query(Period).order_by(Period.begin)] == rows
+        for table in DayRollup, MonthRollup:
+            assert session.query(table).count() == self.database_manager.session.query(table).count()
+        session.close()
+
+    def test_convert_overlapping(self, tmp_path):
+        copyfile('testdb.sqlite', str(tmp_path / 'stats.sqlite'))
+        database = 'sqlite:///' + str(tmp_path / 'stats.sqlite')
+        engine = create_engine(database)
+        last = self.database_manager.session.query(Period).order_by(Period.begin.desc()).first()
+        engine.execute('INSERT INTO work_periods VALUES (?, ?)', int(last.begin.timestamp()) - 60,
+                       int(last.begin.timestamp()) + 60)
+        rows = engine.execute('SELECT "begin", "end" FROM work_periods ORDER BY "begin"').fetchall()
+        engine.dispose()
+
+        # пересекающиеся записи базы объединяются
+        path = tmp_path / 'stats.binlog'
+        assert from_sqlite(database, path) == len(rows) - 1
+        with BinLog(path) as journal:
+            assert list(journal.rows()) == list(union([rows]))
+
+        with raises(FileExistsError):
+            from_sqlite(database, path)
+        with raises(FileExistsError):
+            to_sqlite(path, database)
+
+    def test_statistics(self, tmp_path):
+        path = tmp_path / 'stats.binlog'
+        from_sqlite(DATABASE, path)
+        assert all(isclose(a, b) for a, b in zip(fast_stat.work_statistics(path),
+                                                 fast_stat.work_statistics(Path('testdb.sqlite'))))
+
+        p = parse_period('01.08.2019-15.10.2019')
+        assert isclose(fast_stat.period_seconds(path, p.begin, p.end), WorkStatistics.period_stat(p).total_seconds())
+
+        with BinLog(path) as journal:
+            assert list(journal.grouped_stat(p, 'week')) == list(grouped_stat(p, 'week'))
+
+            ws = WorkStatistics.from_db()
+            from_periods = WorkStatistics.from_periods(journal.rows(), index=True)
+            assert (from_periods.year, from_periods.month, from_periods.week, from_periods.day) \
+                == (ws.year, ws.month, ws.week, ws.day)
+            assert from_periods.index.period_stat(p) == WorkStatistics.period_stat(p)
+
+    def test_daemon(self, tmp_path):
+        path = tmp_path / 'stats.binlog'
+        from_sqlite(DATABASE, path)
+        clock = [datetime.now().timestamp() + 60 * 60]
+        begin = datetime.fromtimestamp(clock[0])
+        sleeps = []
+
+        def sleep(seconds: float):
+            sleeps.append(seconds)
+            clock[0] += seconds
+            if len(sleeps) == 12:
+                raise KeyboardInterrupt
+
+        # база не используется, каждое обновление перезаписывает конец последней записи журнала
+        with patch('daemon.BINLOG_FILE', path), patch('daemon.HEARTBEAT_FILE', None), \
+                patch('daemon.UPDATE_DELAY', 30), patch('daemon.MINIMUM_ACTIVE_TIME', 60), \
+                patch('daemon.sleep', sleep), patch('daemon.time', lambda: clock[0]), \
+                patch('daemon._now', lambda: datetime.fromtimestamp(clock[0])), \
+                patch('database.orm.SessionType.commit') as commit:
+            with raises(KeyboardInterrupt):
+                daemon.main_loop()
+            commit.assert_not_called()
+
+        rows = self.database_manager.session.query(Period).count()
+        with BinLog(path) as journal:
+            assert len(journal) == rows + 1
+            assert list(journal.rows())[-1] == (int(begin.timestamp()), int(begin.timestamp()) + 60 + 11 * 30)
+
+        # восстановление периода из heartbeat после аварийного завершения
+        heartbeat = tmp_path / 'stats.heartbeat'
+        with Heartbeat(heartbeat) as hb:
+            hb.write(begin, begin + timedelta(hours=1))
+        with patch('daemon.BINLOG_FILE', path), patch('daemon.HEARTBEAT_FILE', heartbeat):
+            daemon.recover()
+
+        with BinLog(path) as journal:
+            assert len(journal) == rows + 1
+            assert journal.last_end == int(begin.timestamp()) + 3600
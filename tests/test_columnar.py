@@ -0,0 +1,107 @@
+import json
+from datetime import datetime, timedelta
+from freezegun import freeze_time
+from math import isclose
+from pytest import importorskip, raises
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from columnar import ColumnarJournal, HEADER_FILE, BEGIN_FILE, write
+from database import Period
+from export import export_columnar
+from merge import union
+from period_parser import parse_period
+from reports import grouped_stat
+from work_statistics import WorkStatistics
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestColumnar:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def periods(self):
+        now = datetime.now()
+        return [
+            parse_period('2019'),
+            parse_period('09.2019'),
+            parse_period('01.08.2019-15.10.2019'),
+            Period(now - timedelta(days=45, hours=5), now - timedelta(hours=3)),
+            Period(now - timedelta(hours=30), None),
+        ]
+
+    def test_export(self, tmp_path):
+        rows = self.database_manager.session.query(Period).order_by(Period.begin).all()
+        assert export_columnar(tmp_path) == len(rows)
+
+        with (tmp_path / HEADER_FILE).open() as f:
+            assert json.load(f)['rows'] == len(rows)
+
+        np = importorskip('numpy')
+        begins = np.load(str(tmp_path / BEGIN_FILE))
+        assert begins.dtype == np.int64
+        assert begins.tolist() == [int(it.begin.timestamp()) for it in rows]
+
+    def test_period_stat(self, tmp_path):
+        export_columnar(tmp_path)
+
+        for use_numpy in (False, True):
+            with ColumnarJournal(tmp_path, use_numpy) as journal:
+                assert len(journal) == self.database_manager.session.query(Period).count()
+                for p, res in zip(self.periods(), journal.period_stats(self.periods())):
+                    assert isclose(res.total_seconds(), WorkStatistics.period_stat(p).total_seconds())
+                    assert journal.period_stat(p) == res
+
+    def test_grouped_stat(self, tmp_path):
+        export_columnar(tmp_path)
+
+        for use_numpy in (False, True):
+            with ColumnarJournal(tmp_path, use_numpy) as journal:
+                for p in parse_period('2019'), parse_period('15.09.2019-now'):
+                    for unit in 'day', 'week', 'month':
+                        expected = list(grouped_stat(p, unit))
+                        res = list(journal.grouped_stat(p, unit))
+                        assert [it[:2] for it in res] == [it[:2] for it in expected]
+                        assert all(isclose(a[2].total_seconds(), b[2].total_seconds()) for a, b in zip(res, expected))
+
+    def test_partial_export(self, tmp_path):
+        p = parse_period('09.2019')
+        n = export_columnar(tmp_path, p)
+
+        with ColumnarJournal(tmp_path, use_numpy=False) as journal:
+            assert 0 < n == len(journal)
+            assert journal.header['begin'] == int(p.begin.timestamp())
+            assert journal.period_stat(p) == WorkStatistics.period_stat(p)
+
+        assert export_columnar(tmp_path, parse_period('2000')) == 0
+        with ColumnarJournal(tmp_path, use_numpy=False) as journal:
+            assert len(journal) == 0
+            assert journal.period_stat(parse_period('2019')) == timedelta()
+
+    def test_overlapping_rows(self, tmp_path):
+        # запись внутри другой, пересекающиеся и касающиеся записи
+        rows = [(100, 200), (120, 150), (180, 260), (260, 300), (400, 500), (450, 460)]
+        assert write(rows, tmp_path) == len(list(union([rows]))) == 2
+
+        lower, upper = datetime.fromtimestamp(140), datetime.fromtimestamp(455)
+        for use_numpy in (False, True):
+            with ColumnarJournal(tmp_path, use_numpy) as journal:
+                assert list(journal.rows()) == list(union([rows]))
+                assert list(journal.rows(250, 420)) == list(union([rows]))
+                assert journal.period_stat(Period(lower, upper)) == timedelta(seconds=300 - 140 + 455 - 400)
+
+    def test_invalid(self, tmp_path):
+        export_columnar(tmp_path)
+        with (tmp_path / HEADER_FILE).open('w') as f:
+            json.dump({'format': 'other'}, f)
+
+        with raises(ValueError):
+            ColumnarJournal(tmp_path)
@@ -0,0 +1,97 @@
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from math import isclose
+from pytest import raises
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from binlog import BinLog, BinLogWriter
+from compaction import compact_database, compact_binlog
+from database import Period, DayRollup, MonthRollup, add_to_rollups, rebuild_rollups, begin_seconds, end_seconds
+from merge import union
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def fragments(t: datetime):
+    # промежутки между записями 30 сек, пересечение, касание, большой перерыв и последняя запись через 10 сек
+    return [(t, t + timedelta(minutes=10)), (t + timedelta(seconds=630), t + timedelta(minutes=20)),
+            (t + timedelta(minutes=18), t + timedelta(minutes=25)),
+            (t + timedelta(minutes=25), t + timedelta(minutes=26)),
+            (t + timedelta(hours=2), t + timedelta(hours=3)),
+            (t + timedelta(hours=3, seconds=10), t + timedelta(hours=4))]
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestCompaction:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def rows(self):
+        return self.database_manager.session.query(begin_seconds, end_seconds).order_by(Period.begin).all()
+
+    def rollups(self):
+        session = self.database_manager.session
+        return {it.day: it.seconds for it in session.query(DayRollup)}, \
+            {it.month: it.seconds for it in session.query(MonthRollup)}
+
+    def test_compact(self):
+        session = self.database_manager.session
+        # фрагменты через полночь, чтобы объединение затрагивало сводки двух дней
+        for begin, end in fragments(datetime.now().replace(hour=23, minute=50, second=0, microsecond=0)):
+            session.add(Period(begin, end))
+            add_to_rollups(session, begin, end)
+        session.flush()
+
+        rows = self.rows()
+        expected = list(union([rows[:-1]], 60)) + rows[-1:]
+        assert compact_database(session, 60) == len(rows) - len(expected)
+        assert self.rows() == expected
+        assert expected[-3:] == [(rows[-6][0], rows[-3][1]), rows[-2], rows[-1]]
+
+        # сводки совпадают с пересчитанными по сжатому журналу
+        days, months = self.rollups()
+        rebuild_rollups(session)
+        session.flush()
+        rebuilt_days, rebuilt_months = self.rollups()
+        assert days.keys() == rebuilt_days.keys() and months.keys() == rebuilt_months.keys()
+        assert all(isclose(days[it], rebuilt_days[it]) for it in days)
+        assert all(isclose(months[it], rebuilt_months[it]) for it in months)
+
+        assert compact_database(session, 60) == 0
+
+    def test_no_gap(self):
+        session = self.database_manager.session
+        rows = self.rows()
+        # без допустимого промежутка объединяются только касающиеся и пересекающиеся записи
+        assert compact_database(session, 0) == len(rows) - len(list(union([rows[:-1]]))) - 1
+        assert sum(end - begin for begin, end in self.rows()) == sum(end - begin for begin, end in union([rows]))
+
+
+def test_binlog(tmp_path):
+    path = tmp_path / 'stats.binlog'
+    rows = fragments(datetime(2019, 9, 1, 23, 50))
+    with BinLogWriter(path) as writer:
+        for begin, end in rows[:2] + rows[4:]:
+            writer.append(begin, end)
+
+        # журнал, открытый демоном, не сжимается
+        with raises(BlockingIOError):
+            compact_binlog(path, 60)
+
+    with BinLog(path) as journal:
+        expected = list(union([journal.rows()], 60))
+    assert compact_binlog(path, 60) == 2
+    with BinLog(path) as journal:
+        assert list(journal.rows()) == expected
+        assert len(journal) == 2
+
+    with BinLogWriter(path) as writer:
+        assert writer.last == expected[-1]
+    assert not path.with_name(path.name + '.compact').exists()
@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import os
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, datetime
+from freezegun import freeze_time
+from unittest.mock import patch
+from pytest import raises
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from benchmarks.generate import generate
+from database import Period
+from export import export, read_binary
+from period_parser import parse_period
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestExport:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def expected(self, p=None):
+        query = self.database_manager.session.query(Period).order_by(Period.begin)
+        if p is not None:
+            query = query.filter((Period.end > p.begin) & (Period.begin < (p.end or datetime.now())))
+        return [(int(it.begin.timestamp()), int(it.end.timestamp())) for it in query]
+
+    def test_binary(self):
+        f = io.BytesIO()
+        assert export(f, 'bin') == len(self.expected())
+        f.seek(0)
+        assert list(read_binary(f)) == self.expected()
+
+        with raises(ValueError):
+            list(read_binary(io.BytesIO(b'not an export')))
+
+    def test_csv(self):
+        p = parse_period('09.2019')
+        f = io.BytesIO()
+        n = export(f, 'csv', p)
+        rows = list(csv.DictReader(io.StringIO(f.getvalue().decode())))
+
+        assert 0 < n == len(rows) < len(self.expected())
+        assert [(int(datetime.fromisoformat(it['begin']).timestamp()), int(datetime.fromisoformat(it['end']).timestamp()))
+                for it in rows] == self.expected(p)
+        assert all(int(it['seconds']) > 0 for it in rows)
+
+    def test_jsonl(self):
+        p = parse_period('01.09.2019-now')
+        f = io.BytesIO()
+        export(f, 'jsonl', p)
+        rows = [json.loads(it) for it in f.getvalue().decode().splitlines()]
+
+        assert [(int(datetime.fromisoformat(it['begin']).timestamp()), int(datetime.fromisoformat(it['end']).timestamp()))
+                for it in rows] == self.expected(p)
+
+
+def test_constant_memory(tmp_path):
+    # расход памяти не должен расти вместе с количеством выгружаемых записей
+    def peak(rows: int) -> int:
+        database = tmp_path / f'{rows}.sqlite'
+        generate(database, rows, end=date(2019, 11, 1))
+        engine = create_engine('sqlite:///' + str(database))
+
+        @contextmanager
+        def session_context():
+            session = sessionmaker(bind=engine)()
+            try:
+                yield session
+            finally:
+                session.close()
+
+        with patch('export.new_session', side_effect=session_context), open(os.devnull, 'wb') as f:
+            export(f, 'csv')  # прогрев кэшей sqlalchemy
+            tracemalloc.start()
+            try:
+                assert export(f, 'csv') == rows
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+                engine.dispose()
+
+    small, large = peak(2000), peak(20000)
+    assert large < small * 2
@@ -0,0 +1,100 @@
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from math import isclose
+from pathlib import Path
+from pytest import raises
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period, SCHEMA_VERSION, SchemaVersionError, init as init_db
+from heartbeat import Heartbeat
+from period_parser import parse_period
+from work_statistics import WorkStatistics
+import fast_stat
+
+DATABASE = 'sqlite:///testdb.sqlite'
+DATABASE_PATH = Path('testdb.sqlite')
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestFastStat:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_schema_version(self, tmp_path):
+        path = tmp_path / 'old.sqlite'
+        path.write_bytes(DATABASE_PATH.read_bytes())
+        with closing(sqlite3.connect(str(path))) as connection:
+            connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION - 1}')
+
+        with raises(SchemaVersionError):
+            fast_stat.work_statistics(path)
+        with raises(SchemaVersionError):
+            init_db(f'sqlite:///{path}')
+        init_db(DATABASE)
+
+    def test_work_statistics(self):
+        ws = WorkStatistics.from_db()
+        expected = ws.year, ws.month, ws.week, ws.day
+
+        res = fast_stat.work_statistics(DATABASE_PATH)
+        assert all(isclose(a, b.total_seconds()) for a, b in zip(res, expected))
+
+    def test_heartbeat(self, tmp_path):
+        before = fast_stat.work_statistics(DATABASE_PATH)
+        now = datetime.now()
+
+        with Heartbeat(tmp_path / 'heartbeat') as hb:
+            # период, уже записанный в базу, не учитывается повторно
+            hb.write(now - timedelta(minutes=10), now - timedelta(minutes=5))
+            assert fast_stat.work_statistics(DATABASE_PATH, heartbeat_file=tmp_path / 'heartbeat') == before
+
+            hb.write(now + timedelta(minutes=1), now + timedelta(minutes=2))
+            res = fast_stat.work_statistics(DATABASE_PATH, heartbeat_file=tmp_path / 'heartbeat')
+            assert all(isclose(a, b + 60) for a, b in zip(res, before))
+
+    def test_period_seconds(self):
+        now = datetime.now()
+        periods = [
+            Period.from_string('2019'),
+            Period.from_string('09.2019'),
+            Period.from_string('01.08.2019-15.10.2019'),
+            Period(now - timedelta(days=45, hours=5), now - timedelta(hours=3)),
+            Period(now - timedelta(hours=30), None),
+        ]
+
+        for p in periods:
+            assert isclose(fast_stat.period_seconds(DATABASE_PATH, p.begin, p.end),
+                           WorkStatistics.period_stat(p).total_seconds())
+
+    def test_missing_database(self, tmp_path):
+        with raises(FileNotFoundError):
+            fast_stat.work_statistics(tmp_path / 'missing.sqlite')
+        assert not (tmp_path / 'missing.sqlite').exists()
+
+
+def test_parse_period():
+    for s in ('2019', '09.2019', '2019.09', '15.09.2019', '2019.09.15', '01.08.2019-15.10.2019', '01.09.2019-now'):
+        assert tuple(parse_period(s)) == (Period.from_string(s).begin, Period.from_string(s).end)
+        assert repr(parse_period(s)) == repr(Period.from_string(s))
+
+    with raises(ValueError):
+        parse_period('2019-2018')
+
+
+def test_lean_imports():
+    # быстрый путь stat не должен загружать тяжелые модули
+    code = 'import sys, wtc, fast_stat; print(" ".join(sorted(sys.modules)))'
+    modules = subprocess.run([sys.executable, '-c', code], cwd='../wtc', check=True, stdout=subprocess.PIPE,
+                             universal_newlines=True).stdout.split()
+    assert not {'sqlalchemy', 'curses', 'numpy', 'database', 'work_statistics'} & set(modules)
@@ -0,0 +1,40 @@
+from unittest.mock import patch
+from threading import Timer
+from time import monotonic
+
+from file_watcher import FileWatcher
+
+
+class TestFileWatcher:
+    def test_inotify(self, tmp_path):
+        database = tmp_path / 'stats.sqlite'
+        database.write_bytes(b'')
+
+        with FileWatcher([database, tmp_path / 'stats.sqlite-wal']) as watcher:
+            if not watcher.uses_inotify:
+                return
+
+            assert not watcher.wait(.05)
+
+            # изменения других файлов в директории не учитываются
+            (tmp_path / 'other').write_bytes(b'1')
+            assert not watcher.wait(.05)
+
+            database.write_bytes(b'1')
+            assert watcher.wait(1)
+
+            # создание журнала sqlite во время ожидания прерывает его сразу
+            Timer(.05, (tmp_path / 'stats.sqlite-wal').write_bytes, (b'1', )).start()
+            begin = monotonic()
+            assert watcher.wait(5)
+            assert monotonic() - begin < 1
+
+        assert not watcher.uses_inotify
+
+    def test_fallback(self, tmp_path):
+        with patch('ctypes.CDLL', side_effect=OSError):
+            with FileWatcher([tmp_path / 'stats.sqlite']) as watcher:
+                assert not watcher.uses_inotify
+                begin = monotonic()
+                assert watcher.wait(.05)
+                assert monotonic() - begin >= .05
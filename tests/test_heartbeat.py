@@ -0,0 +1,145 @@
+from unittest.mock import patch
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from pytest import raises
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period, DayRollup
+from heartbeat import Heartbeat, read
+from work_statistics import WorkStatistics
+import daemon
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def test_heartbeat(tmp_path):
+    path = tmp_path / 'stats.heartbeat'
+    assert read(path) is None
+
+    begin = datetime(2019, 9, 1, 10)
+    with Heartbeat(path) as heartbeat:
+        heartbeat.write(begin, begin + timedelta(minutes=5))
+        assert read(path) == (int(begin.timestamp()), int(begin.timestamp()) + 5 * 60)
+
+        heartbeat.clear()
+        assert read(path) is None
+
+        heartbeat.write(begin, begin + timedelta(minutes=10))
+
+    # записанное сохраняется после закрытия файла
+    assert read(path) == (int(begin.timestamp()), int(begin.timestamp()) + 10 * 60)
+
+    path.write_bytes(b'garbage' * 10)
+    assert read(path) is None
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestDaemonHeartbeat:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def day_rollup(self, day: datetime) -> float:
+        return self.database_manager.session.query(DayRollup.seconds).filter(DayRollup.day == day.date()).scalar()
+
+    def test_recover(self, tmp_path):
+        now = datetime.now()
+        path = tmp_path / 'stats.heartbeat'
+        session = self.database_manager.session
+        last = session.query(Period).filter(Period.end == now).one()
+        rollup = self.day_rollup(now)
+
+        with patch('daemon.HEARTBEAT_FILE', path):
+            daemon.recover()  # файла нет - ничего не происходит
+
+            # продление записи, которая уже есть в базе
+            with Heartbeat(path) as heartbeat:
+                heartbeat.write(last.begin, now + timedelta(minutes=5))
+            daemon.recover()
+            session.expire_all()
+            assert last.end == now + timedelta(minutes=5)
+            assert self.day_rollup(now) == rollup + 5 * 60
+            assert read(path) is None
+
+            # запись, которую демон не успел добавить в базу
+            begin = now + timedelta(minutes=10)
+            with Heartbeat(path) as heartbeat:
+                heartbeat.write(begin, begin + timedelta(minutes=5))
+            daemon.recover()
+            assert session.query(Period).filter(Period.begin == begin).one().end == begin + timedelta(minutes=5)
+
+    def test_coalescing(self, tmp_path):
+        heartbeat_writes, rows, commits = daemon.HEARTBEAT_WRITES.value, daemon.ROWS_WRITTEN.value, \
+            daemon.COMMIT_SECONDS.count
+        self.check_main_loop(tmp_path / 'stats.heartbeat', flush_delay=100, expected_flushes=1 + 11 // 4 + 1)
+
+        # начальная запись и ее продления при каждом сбросе, остальные обновления - только в heartbeat
+        assert daemon.ROWS_WRITTEN.value - rows == 1 + 11 // 4 + 1
+        assert daemon.COMMIT_SECONDS.count - commits == 1 + 11 // 4 + 1
+        assert daemon.HEARTBEAT_WRITES.value - heartbeat_writes == 11 - 11 // 4
+
+    def test_no_heartbeat(self):
+        # без heartbeat каждое обновление сразу записывается в базу
+        self.check_main_loop(None, flush_delay=100, expected_flushes=1 + 11)
+
+    def test_no_flush_delay(self, tmp_path):
+        self.check_main_loop(tmp_path / 'stats.heartbeat', flush_delay=0, expected_flushes=1 + 11)
+        assert not (tmp_path / 'stats.heartbeat').exists()
+
+    def check_main_loop(self, path, flush_delay: float, expected_flushes: int):
+        clock = [datetime.now().timestamp() + 60 * 60]
+        begin = datetime.fromtimestamp(clock[0])
+        sleeps = []
+        flushes = []
+
+        def sleep(seconds: float):
+            if len(sleeps) == 1:
+                assert len(flushes) == 1  # начальная запись зафиксирована до первого обновления
+            sleeps.append(seconds)
+            clock[0] += seconds
+            if len(sleeps) == 12:
+                raise KeyboardInterrupt
+
+        def periods():
+            session = self.database_manager.session
+            session.expire_all()
+            return session.query(Period).filter(Period.begin == begin).all()
+
+        with patch('daemon.HEARTBEAT_FILE', path), patch('daemon.FLUSH_DELAY', flush_delay), \
+                patch('daemon.UPDATE_DELAY', 30), patch('daemon.MINIMUM_ACTIVE_TIME', 60), \
+                patch('daemon.sleep', sleep), patch('daemon.time', lambda: clock[0]), \
+                patch('daemon._now', lambda: datetime.fromtimestamp(clock[0])), \
+                patch('database.orm.SessionType.commit', autospec=True, side_effect=flushes.append):
+            with raises(KeyboardInterrupt):
+                daemon.main_loop()
+
+        # начальная запись и 11 обновлений по 30 секунд: в базу попадает каждое четвертое, остальные только в heartbeat
+        # последний сброс происходит при завершении работы, после него heartbeat очищается
+        assert len(flushes) == expected_flushes
+        assert [it.end for it in periods()] == [begin + timedelta(seconds=60 + 11 * 30)]
+        assert path is None or read(path) is None
+
+    def test_update_from_heartbeat(self, tmp_path):
+        now = datetime.now()
+        path = tmp_path / 'stats.heartbeat'
+        ws = WorkStatistics.from_db()
+        day = ws.day
+
+        with patch('work_statistics.HEARTBEAT_FILE', path):
+            with Heartbeat(path) as heartbeat:
+                heartbeat.write(now - timedelta(hours=1), now + timedelta(minutes=5))
+
+            with freeze_time(now + timedelta(minutes=6)):
+                ws.update()
+                assert ws.day - day == timedelta(minutes=5)
+                assert ws._last_update == now + timedelta(minutes=5)
+
+                # повторный учет того же периода ничего не добавляет
+                ws.update_from_heartbeat()
+                assert ws.day - day == timedelta(minutes=5)
@@ -0,0 +1,121 @@
+import shutil
+import sqlite3
+from datetime import datetime, timedelta
+from freezegun import freeze_time
+from itertools import islice
+from pathlib import Path
+from random import Random
+from pytest import raises
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from binlog import from_sqlite
+from merge import MergedJournal, union, active_before
+from period_parser import parse_period
+from reports import grouped_stat
+from work_statistics import WorkStatistics
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def random_journal(rnd: Random, n: int):
+    res, t = [], 0
+    for _ in range(n):
+        t += rnd.randint(0, 50)
+        res.append((t, t + rnd.randint(1, 40)))
+        t = res[-1][1]
+    return res
+
+
+def test_union():
+    rnd = Random(0)
+    for _ in range(50):
+        sources = [random_journal(rnd, rnd.randint(0, 20)) for _ in range(rnd.randint(1, 4))]
+        merged = list(union(sources))
+
+        assert all(begin < end for begin, end in merged)
+        assert all(prev[1] < it[0] for prev, it in zip(merged, merged[1:]))
+        assert {t for b, e in merged for t in range(b, e)} == {t for s in sources for b, e in s for t in range(b, e)}
+
+        moments = [rnd.randint(-10, 1500) for _ in range(10)]
+        covered = {t for b, e in merged for t in range(b, e)}
+        assert active_before(merged, moments) == [len([t for t in covered if t < it]) for it in moments]
+
+
+def test_streaming():
+    # слияние читает из каждого журнала не больше одной записи вперед
+    pulled = [0, 0, 0]
+
+    def source(i: int):
+        t = i * 10
+        while True:
+            pulled[i] += 1
+            yield t, t + 5
+            t += 30
+
+    merged = union(source(i) for i in range(3))
+    assert list(islice(merged, 30)) == [(t + i * 10, t + i * 10 + 5) for t in range(0, 300, 30) for i in range(3)]
+    assert sum(pulled) <= 30 + 3
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestMergedJournal:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_same_journal(self, tmp_path):
+        # один и тот же журнал в нескольких источниках учитывается один раз
+        binlog = tmp_path / 'stats.binlog'
+        from_sqlite(DATABASE, binlog)
+        journal = MergedJournal([Path('testdb.sqlite'), binlog, Path('testdb.sqlite')])
+
+        now = datetime.now()
+        periods = [parse_period('2019'), parse_period('09.2019'), parse_period('15.09.2019-now'),
+                   parse_period(now.strftime('%d.%m.%Y'))]
+        assert journal.period_stats(periods) == WorkStatistics.period_stats(periods)
+        assert journal.period_stat(periods[1]) == WorkStatistics.period_stat(periods[1])
+        assert list(journal.grouped_stat(periods[0], 'week')) == list(grouped_stat(periods[0], 'week'))
+
+    def test_overlapping(self, tmp_path):
+        shifted = tmp_path / 'shifted.sqlite'
+        shutil.copy('testdb.sqlite', str(shifted))
+        connection = sqlite3.connect(str(shifted))
+        connection.execute('UPDATE work_periods SET "begin" = "begin" + 1800, "end" = "end" + 1800')
+        connection.commit()
+
+        def rows(path: Path):
+            connection = sqlite3.connect(str(path))
+            try:
+                return connection.execute('SELECT "begin", "end" FROM work_periods ORDER BY "begin"').fetchall()
+            finally:
+                connection.close()
+
+        a, b = rows(Path('testdb.sqlite')), rows(shifted)
+        connection.close()
+
+        # время без двойного учета - объединение промежутков обоих журналов
+        p = parse_period('2019')
+        lower, upper = p.begin.timestamp(), p.end.timestamp()
+        events = sorted([(x, 1) for x, _ in a + b] + [(y, -1) for _, y in a + b])
+        expected, depth, last = 0, 0, None
+        for t, delta in events:
+            if depth > 0:
+                expected += max(min(t, upper) - max(last, lower), 0)
+            depth += delta
+            last = t
+
+        journal = MergedJournal([Path('testdb.sqlite'), shifted])
+        total = journal.period_stat(p)
+        assert total == timedelta(seconds=expected)
+        assert WorkStatistics.period_stat(p) < total < 2 * WorkStatistics.period_stat(p)
+        assert sum((it[2] for it in journal.grouped_stat(p, 'month')), timedelta()) == total
+
+    def test_missing(self, tmp_path):
+        with raises(FileNotFoundError):
+            MergedJournal([Path('testdb.sqlite'), tmp_path / 'missing.sqlite'])
@@ -0,0 +1,135 @@
+from unittest.mock import patch
+from urllib.request import urlopen
+from urllib.error import HTTPError
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from pytest import raises
+from threading import Thread
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period
+from metrics import Histogram, Registry, MetricsServer, written_bytes
+from storage import open_storage
+from work_statistics import WorkStatistics, FROM_DB_SECONDS, UPDATE_SECONDS, ROWS_SCANNED
+import daemon
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def test_registry():
+    registry = Registry()
+    counter = registry.counter('test_total', 'счетчик')
+    histogram = registry.histogram('test_seconds', 'гистограмма', (.1, 1))
+
+    assert registry.counter('test_total', 'счетчик') is counter
+    with raises(AssertionError):
+        registry.histogram('test_total', 'счетчик')
+
+    counter.inc()
+    counter.inc(2)
+    histogram.observe(.05)
+    histogram.observe(.5)
+    histogram.observe(5)
+    with histogram.time():
+        pass
+
+    assert counter.value == 3
+    assert histogram.count == 4
+    assert registry.render() == \
+        '# HELP test_total счетчик\n' \
+        '# TYPE test_total counter\n' \
+        'test_total 3\n' \
+        '# HELP test_seconds гистограмма\n' \
+        '# TYPE test_seconds histogram\n' \
+        'test_seconds_bucket{le="0.1"} 2\n' \
+        'test_seconds_bucket{le="1"} 3\n' \
+        'test_seconds_bucket{le="+Inf"} 4\n' \
+        f'test_seconds_sum {histogram.sum!r}\n' \
+        'test_seconds_count 4\n'
+
+
+def test_server():
+    registry = Registry()
+    registry.counter('test_total', 'счетчик').inc()
+
+    with MetricsServer(0, registry) as server:
+        with urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert response.read().decode() == registry.render()
+
+        with raises(HTTPError):
+            urlopen(f'http://127.0.0.1:{server.port}/other')
+
+
+def test_written_bytes(tmp_path):
+    before = written_bytes()
+    if before is None:
+        return  # нет /proc/self/io
+
+    (tmp_path / 'data').write_bytes(b'0' * 4096)
+    assert written_bytes() - before >= 4096
+
+    # запись других потоков, например http сервера метрик, не учитывается
+    before = written_bytes()
+    thread = Thread(target=(tmp_path / 'other').write_bytes, args=(b'0' * 4096, ))
+    thread.start()
+    thread.join()
+    assert written_bytes() - before < 4096
+
+
+def test_daemon_metrics(tmp_path):
+    histogram = Histogram('test_seconds', 'гистограмма', (1, 10))
+    histogram.observe(5)
+    histogram.reset((1, 2, 3))
+    assert histogram.bounds == (1, 2, 3) and histogram.counts == [0] * 4 and histogram.sum == 0
+
+    with patch('daemon.MAX_COUNTED_SLEEP', 30 * 60):
+        daemon.configure_metrics()
+    assert daemon.SLEEP_DRIFT_SECONDS.bounds == (.01, .1, 1, 10, 60, 10 * 60, 30 * 60)
+    daemon.configure_metrics()
+    assert daemon.SLEEP_DRIFT_SECONDS.bounds[-1] == daemon.MAX_COUNTED_SLEEP
+
+    if written_bytes() is None:
+        return  # нет /proc/thread-self/io
+
+    # учитывается и изменение журнала binlog, который пишется сразу, а не при фиксации
+    with open_storage(tmp_path / 'stats.binlog') as storage:
+        before = daemon.BYTES_WRITTEN.value
+        with daemon._flushing(storage):
+            storage.add(datetime(2019, 9, 1, 10), datetime(2019, 9, 1, 11))
+        assert 0 < daemon.BYTES_WRITTEN.value - before < 4096
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestInstrumentation:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_work_statistics(self):
+        from_db_count, update_count, rows = FROM_DB_SECONDS.count, UPDATE_SECONDS.count, ROWS_SCANNED.value
+
+        ws = WorkStatistics.from_db(index=True)
+        assert FROM_DB_SECONDS.count == from_db_count + 1
+        scanned = ROWS_SCANNED.value - rows
+        assert scanned > len(ws.index)  # записи текущего года и весь журнал для индекса
+
+        # новых записей нет - ничего не просматривается
+        ws.update()
+        assert UPDATE_SECONDS.count == update_count + 1
+        assert ROWS_SCANNED.value - rows == scanned
+
+        # новая запись учитывается в просмотренных
+        now = datetime.now()
+        session = self.database_manager.session
+        session.add(Period(now + timedelta(minutes=1), now + timedelta(minutes=5)))
+        session.flush()
+        with freeze_time(now + timedelta(minutes=10)):
+            ws.update()
+        assert ROWS_SCANNED.value - rows == scanned + 1
@@ -2,6 +2,7 @@ from pytest import raises
 from datetime import datetime, date, timedelta
 from random import randint, choice, random
 from database import Period
+from database.orm import Timestamp
 from typing import *
 
 
@@ -110,3 +111,15 @@ class TestPeriod:
                     Period.from_string(arg)
             else:
                 assert Period.from_string(arg) == res
+
+
+def test_timestamp():
+    # время хранится в базе как целое количество секунд, а отдается в виде datetime
+    t = Timestamp()
+    now = datetime.now().replace(microsecond=0)
+    for value in (now, now.timestamp(), int(now.timestamp())):
+        assert t.process_bind_param(value, None) == int(now.timestamp())
+        assert t.process_result_value(t.process_bind_param(value, None), None) == now
+
+    assert t.process_bind_param(now.date(), None) == int(datetime.fromordinal(now.toordinal()).timestamp())
+    assert t.process_bind_param(None, None) is None and t.process_result_value(None, None) is None
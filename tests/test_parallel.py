@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+from math import isclose
+from pathlib import Path
+from random import Random
+from shutil import copyfile
+
+from binlog import BinLogWriter
+from database import Period, add_to_rollups, init as init_db, new_session
+from merge import MergedJournal, active_before
+from parallel import ParallelJournal, ParallelDatabase, shards, shard_active_before
+from period_parser import parse_period
+from reports import grouped_stat
+from work_statistics import WorkStatistics
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def test_shards():
+    assert shards(0, 10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert shards(0, 2, 4) == [(0, 1), (1, 2)]
+    parts = shards(1567000000.5, 1569000000.25, 7)
+    assert parts[0][0] == 1567000000.5 and parts[-1][1] == 1569000000.25
+    assert all(a[1] == b[0] for a, b in zip(parts, parts[1:]))
+
+
+def test_shard_clipping(tmp_path):
+    path = tmp_path / 'stats.binlog'
+    rnd = Random(0)
+    t, rows = 0, []
+    with BinLogWriter(path) as writer:
+        for _ in range(200):
+            t += rnd.randint(0, 50)
+            rows.append((t, t + rnd.randint(1, 200)))
+            writer.append(*map(datetime.fromtimestamp, rows[-1]))
+            t = rows[-1][1]
+
+    # записи, пересекающие границы отрезков, делятся между ними без потерь и двойного учета
+    moments = sorted(rnd.randint(-10, t + 10) for _ in range(50))
+    expected = active_before(rows, moments)
+    for n in (1, 2, 7, 33):
+        totals = [0.] * len(moments)
+        for lower, upper in shards(min(moments), max(moments), n):
+            totals = [a + b for a, b in zip(totals, shard_active_before([path], lower, upper, moments))]
+        assert totals == [it - expected[0] for it in expected]
+
+
+def test_parallel_journal():
+    journal = Path('testdb.sqlite')
+    p = parse_period('26.08.2019-25.09.2019')
+    periods = [parse_period(it) for it in ('2019', '09.2019', '01.09.2019-15.09.2019', '10.09.2019')]
+
+    with MergedJournal([journal]) as merged, ParallelJournal([journal, journal], 2) as parallel:
+        assert parallel.period_stats(periods) == merged.period_stats(periods)
+        assert list(parallel.grouped_stat(p, 'day')) == list(merged.grouped_stat(p, 'day'))
+        assert sum((it[2] for it in parallel.grouped_stat(p, 'week')), timedelta()) == merged.period_stat(p)
+
+
+def test_parallel_database(tmp_path):
+    path = tmp_path / 'stats.sqlite'
+    copyfile('testdb.sqlite', str(path))
+    p = parse_period('26.08.2019-25.09.2019')
+    periods = [parse_period(it) for it in ('2019', '09.2019', '01.09.2019-15.09.2019', '10.09.2019', '11.09.2019')]
+
+    init_db(f'sqlite:///{path}')
+    try:
+        # пересекающиеся записи, переходящие через полночь, записываются вместе со сводками, как это делает демон
+        day = datetime(2019, 9, 10)
+        with new_session() as session:
+            for begin, end in ((20, 26), (22, 25), (30, 31)):
+                begin, end = day + timedelta(hours=begin, seconds=7), day + timedelta(hours=end, seconds=7)
+                session.add(Period(begin, end))
+                add_to_rollups(session, begin, end)
+            session.commit()
+
+        # последовательный подсчет stat --batch и stat --by без --workers
+        serial_totals = WorkStatistics.period_stats(periods)
+        serial_groups = list(grouped_stat(p, 'day'))
+    finally:
+        init_db(DATABASE)
+
+    with ParallelDatabase(path, 2) as parallel, MergedJournal([path]) as merged:
+        totals = parallel.period_stats(periods)
+        assert all(isclose(a.total_seconds(), b.total_seconds()) for a, b in zip(totals, serial_totals))
+        assert totals[0] - merged.period_stats(periods)[0] == timedelta(hours=3)  # пересечения учитываются дважды
+
+        groups = list(parallel.grouped_stat(p, 'day'))
+        assert [it[:2] for it in groups] == [it[:2] for it in serial_groups]
+        assert all(isclose(a[2].total_seconds(), b[2].total_seconds()) for a, b in zip(groups, serial_groups))
@@ -0,0 +1,45 @@
+from freezegun import freeze_time
+from pytest import importorskip
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period
+from period_array import PeriodArray, iter_periods
+from period_parser import parse_period
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestPeriodArray:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_load(self):
+        session = self.database_manager.session
+        expected = [(int(it.begin.timestamp()), int(it.end.timestamp()))
+                    for it in session.query(Period).order_by(Period.begin)]
+
+        periods = PeriodArray.load(session)
+        assert list(periods) == expected and len(periods) == len(expected)
+        assert periods.begins.itemsize == 8 and periods.begins.typecode == 'q'
+
+        # границы отбирают записи, пересекающиеся с промежутком
+        p = parse_period('10.09.2019-20.09.2019')
+        lower, upper = p.begin.timestamp(), p.end.timestamp()
+        assert list(iter_periods(session, lower, upper)) == [it for it in expected if it[1] > lower and it[0] < upper]
+        assert list(PeriodArray.load(session, upper=expected[0][0])) == []
+
+    def test_to_numpy(self):
+        np = importorskip('numpy')
+        periods = PeriodArray.load(self.database_manager.session)
+        begins, ends = periods.to_numpy()
+        assert begins.dtype == np.int64 and list(begins) == list(periods.begins) and list(ends) == list(periods.ends)
+        assert np.shares_memory(begins, np.frombuffer(periods.begins, dtype=np.int64))
+        assert len(PeriodArray().to_numpy()[0]) == 0
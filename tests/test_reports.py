@@ -0,0 +1,123 @@
+from unittest.mock import patch
+from pytest import importorskip
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from random import randint, choice
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period
+from reports import buckets, group_periods, grouped_stat, hours, heatmap_periods, heatmap
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+def test_buckets():
+    assert list(buckets(datetime(2019, 12, 30, 12), datetime(2020, 1, 2), 'day')) == [
+        (datetime(2019, 12, 30, 12), datetime(2019, 12, 31)),
+        (datetime(2019, 12, 31), datetime(2020, 1, 1)),
+        (datetime(2020, 1, 1), datetime(2020, 1, 2))
+    ]
+    assert list(buckets(datetime(2019, 12, 25), datetime(2020, 1, 8), 'week')) == [
+        (datetime(2019, 12, 25), datetime(2019, 12, 30)),
+        (datetime(2019, 12, 30), datetime(2020, 1, 6)),
+        (datetime(2020, 1, 6), datetime(2020, 1, 8))
+    ]
+    assert list(buckets(datetime(2019, 11, 1), datetime(2020, 2, 1), 'month')) == [
+        (datetime(2019, 11, 1), datetime(2019, 12, 1)),
+        (datetime(2019, 12, 1), datetime(2020, 1, 1)),
+        (datetime(2020, 1, 1), datetime(2020, 2, 1))
+    ]
+    assert list(buckets(datetime(2019, 6, 1), datetime(2020, 6, 1), 'year')) == [
+        (datetime(2019, 6, 1), datetime(2020, 1, 1)),
+        (datetime(2020, 1, 1), datetime(2020, 6, 1))
+    ]
+
+
+def test_group_periods():
+    # записи, разрезанные по границам групп, должны в сумме давать то же, что и подсчет по каждой группе отдельно
+    begin = datetime(2019, 1, 1)
+    end = datetime(2020, 1, 1)
+    disjoint, overlapping = [], []
+    t = begin.timestamp() - randint(0, 10**5)
+    while t < end.timestamp():
+        length = randint(1, 3 * 24 * 60 * 60)
+        disjoint.append((t, t + length))
+        t += length + randint(1, 24 * 60 * 60)
+
+    # записи, пересекающиеся друг с другом и с границами дней, учитываются каждая отдельно
+    t = begin.timestamp() - randint(0, 10**5)
+    while t < end.timestamp():
+        overlapping.append((t, t + randint(1, 3 * 24 * 60 * 60)))
+        t += randint(0, 24 * 60 * 60)
+
+    for periods in disjoint, overlapping:
+        for unit in ('day', 'week', 'month', 'year'):
+            groups = list(group_periods(iter(periods), begin, end, unit))
+            assert [it[:2] for it in groups] == list(buckets(begin, end, unit))
+            for group_begin, group_end, seconds in groups:
+                assert seconds == sum(
+                    max(min(e, group_end.timestamp()) - max(b, group_begin.timestamp()), 0) for b, e in periods
+                )
+
+    # запись, начавшаяся внутри уже пройденного дня, попадает в этот день
+    day = datetime(2026, 3, 10)
+    periods = [(day + timedelta(hours=b), day + timedelta(hours=e)) for b, e in ((20, 26), (22, 25), (30, 31))]
+    groups = list(group_periods(((b.timestamp(), e.timestamp()) for b, e in periods), day, day + timedelta(days=3),
+                                'day'))
+    assert [it[2] for it in groups] == [6 * 60 * 60, 4 * 60 * 60, 0]
+
+
+def test_hours():
+    begin = datetime(2019, 3, 5, 10, 30).timestamp()
+    end = datetime(2019, 3, 5, 13, 15).timestamp()
+    assert [(b, e, h.hour) for b, e, h in hours(begin, end)] == [
+        (begin, datetime(2019, 3, 5, 11).timestamp(), 10),
+        (datetime(2019, 3, 5, 11).timestamp(), datetime(2019, 3, 5, 12).timestamp(), 11),
+        (datetime(2019, 3, 5, 12).timestamp(), datetime(2019, 3, 5, 13).timestamp(), 12),
+        (datetime(2019, 3, 5, 13).timestamp(), end, 13)
+    ]
+
+
+def test_heatmap_periods():
+    begin = datetime(2019, 3, 4)  # понедельник
+    periods = [
+        ((begin + timedelta(hours=9, minutes=30)).timestamp(), (begin + timedelta(hours=11)).timestamp()),
+        ((begin + timedelta(days=8, hours=23)).timestamp(), (begin + timedelta(days=9, hours=1)).timestamp())
+    ]
+    matrix = heatmap_periods(periods, begin + timedelta(hours=10), begin + timedelta(days=14))
+    assert len(matrix) == 7 and all(len(it) == 24 for it in matrix)
+    assert matrix[0][10] == 60 * 60
+    assert matrix[1][23] == matrix[2][0] == 60 * 60
+    assert sum(map(sum, matrix)) == 3 * 60 * 60
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestGroupedStat:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_grouped_stat(self):
+        now = datetime.now()
+        for _ in range(10):
+            begin = now - timedelta(seconds=randint(1, 60*24*60*60))
+            unit = choice(('day', 'week', 'month', 'year'))
+            for group_begin, group_end, active in grouped_stat(Period(begin, None), unit):
+                assert active.total_seconds() == \
+                    self.database_manager.get_work_time_in_period(Period(group_begin, group_end))
+
+    def test_heatmap(self):
+        now = datetime.now()
+        p = Period(now - timedelta(days=60), None)
+        matrix = heatmap(p)
+        assert sum(map(sum, matrix)) == self.database_manager.get_work_time_in_period(p)
+
+        importorskip('numpy')
+        with patch('work_statistics.USE_NUMPY', True):
+            assert heatmap(p) == matrix
@@ -0,0 +1,73 @@
+from unittest.mock import patch
+from freezegun import freeze_time
+from datetime import datetime
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period, DayRollup, begin_seconds, end_seconds
+from period_parser import parse_period
+from reports import grouped_stat
+from retention import fold_periods
+from work_statistics import WorkStatistics
+import daemon
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestRetention:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def rows(self):
+        return self.database_manager.session.query(begin_seconds, end_seconds).order_by(Period.begin).all()
+
+    def statistics(self):
+        periods = [parse_period(it) for it in ('2019', '09.2019', '01.09.2019-15.09.2019', '10.09.2019', '26.08.2019')]
+        ws = WorkStatistics.from_db()
+        return [WorkStatistics.period_stat(it) for it in periods], WorkStatistics.period_stats(periods), \
+            list(grouped_stat(parse_period('2019'), 'day')), (ws.year, ws.month, ws.week, ws.day), \
+            [(it.day, it.seconds) for it in self.database_manager.session.query(DayRollup).order_by(DayRollup.day)]
+
+    def test_fold(self):
+        session = self.database_manager.session
+        before = datetime(2019, 9, 20)
+        rows = self.rows()
+        statistics = self.statistics()
+
+        assert fold_periods(session, before) == len(rows) - len(self.rows())
+        assert len(self.rows()) < len(rows)
+
+        # итоги за целые дни не изменились
+        assert self.statistics() == statistics
+
+        # старые дни сведены к одной записи с полуночи, новые записи не изменились
+        old = [it for it in self.rows() if it[1] <= before.timestamp()]
+        assert len({datetime.fromtimestamp(begin).date() for begin, _ in old}) == len(old)
+        assert all(datetime.fromtimestamp(begin) == datetime.fromtimestamp(begin).replace(hour=0, minute=0, second=0)
+                   for begin, _ in old)
+        assert [it for it in self.rows() if it[1] > before.timestamp()] \
+            == [it for it in rows if it[1] > before.timestamp()]
+
+        assert fold_periods(session, before) == 0
+
+    def test_daemon(self):
+        rows = self.rows()
+        with patch('daemon.KEEP_RAW_DAYS', 3):
+            daemon.apply_retention()
+
+        # записи последних трех дней хранятся без изменений
+        bound = datetime(2019, 9, 22).timestamp()
+        assert len(self.rows()) < len(rows)
+        assert [it for it in self.rows() if it[0] >= bound] == [it for it in rows if it[0] >= bound]
+
+        with patch('daemon.KEEP_RAW_DAYS', 0):
+            rows = self.rows()
+            daemon.apply_retention()
+            assert self.rows() == rows
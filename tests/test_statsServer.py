@@ -0,0 +1,167 @@
+from unittest.mock import patch
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from math import isclose
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from database import Period, add_to_rollups
+from reports import grouped_stat
+from stats_client import CLIENT_TIMEOUT, query
+from stats_server import StatsServer, answer, remote_statistics, remote_period_stat, remote_grouped_stat
+from work_statistics import WorkStatistics
+import daemon
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestStatsServer:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_answer(self):
+        stats = WorkStatistics.from_db(index=True)
+        assert answer(stats, {'query': 'stat'}) == WorkStatistics.from_db().to_dict()
+
+        p = Period.from_string('01.08.2019-now')
+        assert answer(stats, {'query': 'period', 'begin': p.begin.timestamp(), 'end': None}) \
+            == {'seconds': WorkStatistics.period_stat(p).total_seconds()}
+
+        rows = answer(stats, {'query': 'grouped', 'begin': p.begin.timestamp(), 'end': None, 'unit': 'week'})['rows']
+        assert rows == [[begin.timestamp(), end.timestamp(), active.total_seconds()]
+                        for begin, end, active in grouped_stat(p, 'week')]
+
+    def test_server(self, tmp_path):
+        path = tmp_path / 'stats.sock'
+        assert remote_statistics(path) is None  # демон не запущен
+
+        now = datetime.now()
+        last = self.database_manager.session.query(Period).filter(Period.end == now).one()
+        p = Period.from_string('01.08.2019-now')
+        expected = WorkStatistics.from_db()
+        expected_period = WorkStatistics.period_stat(p)
+        expected_month = list(grouped_stat(p, 'month'))[-1][2]
+
+        with StatsServer(path, WorkStatistics.from_db(index=True)) as server, \
+                patch('work_statistics.new_session') as mock:
+            assert remote_statistics(path).to_dict() == expected.to_dict()
+            assert remote_period_stat(path, p) == expected_period
+            assert remote_grouped_stat(path, p, 'month')[-1][2] == expected_month
+
+            # демон продлевает запись - ответы меняются без обращения к бд
+            server.record(last.begin, now + timedelta(minutes=5))
+            with freeze_time(now + timedelta(minutes=6)):
+                assert remote_statistics(path).day - expected.day == timedelta(minutes=5)
+                assert remote_period_stat(path, p) - expected_period == timedelta(minutes=5)
+
+            # неверный запрос - клиент обращается к бд сам
+            assert remote_grouped_stat(path, p, 'century') is None
+
+            mock.assert_not_called()
+
+        assert not path.exists()
+
+    def test_daemon(self, tmp_path):
+        path = tmp_path / 'stats.sock'
+        session = self.database_manager.session
+        p = Period.from_string('01.08.2019-now')
+
+        # пересекающиеся записи, например оставленные старой версией демона, учитываются каждая отдельно
+        last = session.query(Period).order_by(Period.begin.desc()).first()
+        session.add(Period(last.begin - timedelta(minutes=1), last.begin + timedelta(minutes=1)))
+        session.flush()
+        rows = [(int(it.begin.timestamp()), int(it.end.timestamp()))
+                for it in session.query(Period).order_by(Period.begin)]
+        lower, upper = p.begin.timestamp(), datetime.now().timestamp()
+        expected = sum(max(min(end, upper) - max(begin, lower), 0) for begin, end in rows)
+
+        with patch('daemon.SOCKET_FILE', path):
+            server = daemon._start_stats_server()
+            assert server is not None
+            try:
+                assert remote_period_stat(path, p) == timedelta(seconds=expected)
+            finally:
+                server.close()
+
+            # демон продолжает работу без сервера статистики
+            with patch('work_statistics.WorkStatistics.from_db', side_effect=RuntimeError):
+                assert daemon._start_stats_server() is None
+            assert not path.exists()
+
+    def test_reload(self, tmp_path):
+        path = tmp_path / 'stats.sock'
+        p = Period.from_string('01.08.2019-now')
+        begin = p.begin.timestamp()
+        journals = [[(begin, begin + 3600)], [(begin, begin + 3600), (begin + 7200, begin + 9000)]]
+
+        def reload():
+            if not journals:
+                raise RuntimeError('журнал недоступен')
+            return WorkStatistics.from_periods(journals.pop(0), index=True)
+
+        with StatsServer(path, WorkStatistics.from_periods((), index=True), reload):
+            assert remote_period_stat(path, p) == timedelta()
+            assert query(path, {'query': 'reload'}) == {'rows': 1}
+            assert remote_period_stat(path, p) == timedelta(hours=1)
+
+            # например, после сжатия журнала командой compact
+            assert query(path, {'query': 'reload'}) == {'rows': 2}
+            assert remote_period_stat(path, p) == timedelta(hours=1, minutes=30)
+
+            # при ошибке остается прежняя статистика
+            assert query(path, {'query': 'reload'}) is None
+            assert remote_period_stat(path, p) == timedelta(hours=1, minutes=30)
+
+        with StatsServer(path, WorkStatistics.from_periods((), index=True)):
+            assert query(path, {'query': 'reload'}) is None
+
+        # пока статистика строится заново, сервер отвечает по прежней
+        building, release = Event(), Event()
+
+        def slow_reload():
+            building.set()
+            release.wait(CLIENT_TIMEOUT)
+            return WorkStatistics.from_periods([(begin, begin + 60)], index=True)
+
+        with StatsServer(path, WorkStatistics.from_periods((), index=True), slow_reload), \
+                ThreadPoolExecutor(1) as executor:
+            reloaded = executor.submit(query, path, {'query': 'reload'})
+            assert building.wait(CLIENT_TIMEOUT)
+            assert remote_period_stat(path, p) == timedelta()
+            release.set()
+            assert reloaded.result() == {'rows': 1}
+            assert remote_period_stat(path, p) == timedelta(minutes=1)
+
+    def test_overlaps(self):
+        # ответы демона считаются по тому же правилу, что и без него: каждая запись обрезается отдельно
+        session = self.database_manager.session
+        last = session.query(Period).order_by(Period.begin.desc()).first()
+        begin, end = last.begin - timedelta(minutes=1), last.begin + timedelta(minutes=1)
+        session.add(Period(begin, end))
+        add_to_rollups(session, begin, end)
+        session.flush()
+
+        stats = WorkStatistics.from_db(index=True)
+        now = datetime.now()
+        year = Period(datetime(now.year, 1, 1), None)
+        p = Period.from_string('01.08.2019-now')
+        assert isclose(answer(stats, {'query': 'stat'})['year'], WorkStatistics.period_stat(year).total_seconds())
+        assert isclose(remote_seconds(stats, year), WorkStatistics.period_stat(year).total_seconds())
+        assert isclose(remote_seconds(stats, p), WorkStatistics.period_stat(p).total_seconds())
+
+        rows = answer(stats, {'query': 'grouped', 'begin': p.begin.timestamp(), 'end': None, 'unit': 'day'})['rows']
+        assert all(isclose(seconds, active.total_seconds())
+                   for (_, _, seconds), (_, _, active) in zip(rows, grouped_stat(p, 'day')))
+
+
+def remote_seconds(stats: WorkStatistics, p: Period) -> float:
+    return answer(stats, {'query': 'period', 'begin': p.begin.timestamp(), 'end': None})['seconds']
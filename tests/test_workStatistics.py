@@ -1,16 +1,17 @@
 from unittest.mock import patch, MagicMock
+from pytest import importorskip
 from freezegun import freeze_time
 from datetime import datetime, timedelta
 from random import randint, random
 from math import isclose
 from pickle import dumps
-from contextlib import contextmanager
 from copy import deepcopy
 from typing import *
 
-from tests.db_utils import DatabaseManager, get_max_end_time
-from database import Period
-from work_statistics import WorkStatistics
+from tests.db_utils import DatabaseManager, get_max_end_time, patch_new_session
+from database import Period, DayRollup, MonthRollup, add_to_rollups, rebuild_rollups
+from period_array import PeriodArray
+from work_statistics import WorkStatistics, RangeStatistics, get_ymwd_begins_timestamps
 
 DATABASE = 'sqlite:///testdb.sqlite'
 
@@ -46,6 +47,102 @@ class TestWorkStatistics:
             and isclose(ws._month, ws.month.total_seconds()) \
             and isclose(ws._year, ws.year.total_seconds())
 
+    def test_snapshot(self, tmp_path):
+        snapshot = tmp_path / 'stats.snapshot'
+        ws = WorkStatistics.from_db(snapshot=snapshot)
+        assert snapshot.is_file()
+
+        def stats(it: WorkStatistics) -> Tuple:
+            return it._last_update, it._year, it._month, it._week, it._day
+
+        # действительный снимок используется без пересчета
+        with patch('work_statistics._scan_db') as mock:
+            assert stats(WorkStatistics.from_db(snapshot=snapshot)) == stats(ws)
+            mock.assert_not_called()
+
+        # новые записи подгружаются через update
+        with self.database_manager.new_session_context() as session, patch_new_session(session):
+            session.add(Period(ws._last_update + timedelta(minutes=1), ws._last_update + timedelta(minutes=2)))
+            with freeze_time(ws._last_update + timedelta(minutes=3)):
+                assert isclose(WorkStatistics.from_db(snapshot=snapshot)._day, ws._day + 60)
+
+        def assert_rescanned():
+            with patch('work_statistics._scan_db', return_value=WorkStatistics()) as mock:
+                WorkStatistics.from_db(snapshot=snapshot)
+                mock.assert_called_once()
+
+        WorkStatistics.from_db(snapshot=snapshot)
+        with freeze_time(datetime.now() + timedelta(days=1)):
+            assert_rescanned()  # сменились границы дня
+        with patch('work_statistics.database_identity', return_value=(0, 0)):
+            assert_rescanned()  # другой файл базы
+        with patch('work_statistics.SCHEMA_VERSION', -1):
+            assert_rescanned()
+        snapshot.write_text('{')
+        assert_rescanned()
+
+    def test_sql_aggregation(self):
+        # суммы, посчитанные в sql, должны в точности совпадать с подсчетом по записям журнала в python
+        periods = [(it.begin.timestamp(), it.end.timestamp()) for it in self.database_manager.session.query(Period)]
+
+        def python_sum(lower: float, upper: float) -> float:
+            return sum(max(min(end, upper) - max(begin, lower), 0) for begin, end in periods)
+
+        now = datetime.now()
+        ws = WorkStatistics.from_db()
+        assert ws._last_update == now
+        assert [ws._year, ws._month, ws._week, ws._day] == \
+            [python_sum(it, now.timestamp()) for it in get_ymwd_begins_timestamps()]
+
+        for _ in range(100):
+            begin = now - timedelta(seconds=randint(1, 60*24*60*60))
+            end = begin + timedelta(seconds=randint(1, int((now - begin).total_seconds())))
+            assert WorkStatistics.period_stat(Period(begin, end)).total_seconds() == \
+                python_sum(begin.timestamp(), end.timestamp())
+
+    def test_numpy_engine(self):
+        importorskip('numpy')
+        now = datetime.now()
+        periods = [Period(now - timedelta(seconds=randint(1, 60*24*60*60)), None) for _ in range(100)]
+        periods = [Period(it.begin, it.begin + timedelta(seconds=randint(1, int((now - it.begin).total_seconds()))))
+                   for it in periods]
+
+        ws = WorkStatistics.from_db()
+        stats = WorkStatistics.period_stats(periods)
+        with patch('work_statistics.USE_NUMPY', True), \
+                patch('period_array.PeriodArray.to_numpy', autospec=True, side_effect=PeriodArray.to_numpy) as mock:
+            numpy_ws = WorkStatistics.from_db()
+            numpy_stats = WorkStatistics.period_stats(periods)
+            assert mock.call_count == 2
+
+        assert (numpy_ws._last_update, numpy_ws._year, numpy_ws._month, numpy_ws._week, numpy_ws._day) == \
+            (ws._last_update, ws._year, ws._month, ws._week, ws._day)
+        assert numpy_stats == stats
+
+        # без numpy используется обычный подсчет
+        with patch('work_statistics.USE_NUMPY', True), patch('numpy_engine.np', None), \
+                patch('period_array.PeriodArray.to_numpy') as mock:
+            assert WorkStatistics.from_db()._year == ws._year
+            mock.assert_not_called()
+
+    def test_numpy_overlaps(self):
+        importorskip('numpy')
+        now = datetime.now()
+        first = now - timedelta(days=2, seconds=13)
+        periods = [Period(now - timedelta(days=3, hours=randint(0, 48)), None) for _ in range(50)]
+        periods = [Period(it.begin, it.begin + timedelta(minutes=randint(1, 600))) for it in periods]
+        periods.append(Period(first - timedelta(hours=1), first + timedelta(minutes=90)))
+
+        with self.database_manager.new_session_context() as session, patch_new_session(session):
+            # записи, пересекающиеся между собой и с записями журнала
+            for begin, end in ((0, 120), (60, 180), (10, 20)):
+                session.add(Period(first + timedelta(minutes=begin), first + timedelta(minutes=end)))
+
+            stats = WorkStatistics.period_stats(periods)
+            assert stats[-1] >= timedelta(minutes=100)  # пересечения учитываются дважды
+            with patch('work_statistics.USE_NUMPY', True):
+                assert WorkStatistics.period_stats(periods) == stats
+
     def test_period_stat(self):
         now = datetime.now()
 
@@ -68,6 +165,43 @@ class TestWorkStatistics:
 
         check_for(WorkStatistics.from_db())
 
+    def test_period_stats(self):
+        now = datetime.now()
+        periods = []
+        for _ in range(100):
+            begin = now - timedelta(seconds=randint(1, 60*24*60*60))
+            end = None if random() < .1 else begin + timedelta(seconds=randint(1, int((now - begin).total_seconds())))
+            periods.append(Period(begin, end))
+
+        assert WorkStatistics.period_stats([]) == []
+        for period, res in zip(periods, WorkStatistics.period_stats(periods)):
+            assert isclose(res.total_seconds(), self.database_manager.get_work_time_in_period(period))
+
+    def test_index(self):
+        now = datetime.now()
+        ws = WorkStatistics.from_db(index=True)
+        assert ws.index is not None and ws.index.last_end == now
+        assert WorkStatistics.from_db().index is None
+
+        for _ in range(100):
+            begin = now - timedelta(seconds=randint(1, 60*24*60*60))
+            end = None if random() < .1 else begin + timedelta(seconds=randint(1, int((now - begin).total_seconds())))
+            assert isclose(
+                ws.index.period_stat(Period(begin, end)).total_seconds(),
+                self.database_manager.get_work_time_in_period(Period(begin, end)),
+                abs_tol=1e-6
+            )
+
+        with self.database_manager.new_session_context() as session, patch_new_session(session):
+            # продление последней записи демоном и новая запись должны попасть в индекс
+            length = len(ws.index)
+            session.query(Period).filter(Period.end == now).update({'end': now + timedelta(minutes=10)})
+            session.add(Period(now + timedelta(hours=1), now + timedelta(hours=2)))
+            with freeze_time(now + timedelta(hours=3)):
+                ws.update()
+                assert len(ws.index) == length + 1
+                assert isclose(ws.index.period_stat(Period(now, None)).total_seconds(), 70 * 60)
+
     def test_update(self):
         now = datetime.now()
         day_end = datetime.fromordinal(now.toordinal()) + timedelta(days=1)
@@ -83,64 +217,60 @@ class TestWorkStatistics:
             "year": ws._year
         }
 
-        with self.database_manager.new_session_context() as session:
-            @contextmanager
-            def session_context(): yield session
-
-            with patch('work_statistics.new_session', side_effect=session_context) as mock:
-                with freeze_time(day_end):
+        with self.database_manager.new_session_context() as session, patch_new_session(session) as mock:
+            with freeze_time(day_end):
+                ws.update()
+                mock.assert_called()
+
+            # хоть обновление было и позже, последяя запись в бд произошла в now тк время в тестах заморожено
+            assert ws._last_update == now
+
+            assert ws.day.total_seconds() == ws._day == 0
+            if day_end < week_end:
+                assert isclose(ws.week.total_seconds(), ws._week) and isclose(ws._week, last_cache['week'])
+            if day_end < month_end:
+                assert isclose(ws.month.total_seconds(), ws._month) and isclose(ws._month, last_cache['month'])
+                assert isclose(ws.year.total_seconds(), ws._year) and isclose(ws._year, last_cache['year'])
+
+            now = day_end + timedelta(hours=12)
+            with freeze_time(now):
+                # проводим добавление данных в базу и проверяем
+                begin = randint(int(day_end.timestamp()), int(day_end.timestamp()) + 10000)
+                end = randint(begin, int(now.timestamp()))
+                length = end - begin
+                last_ws = deepcopy(ws)
+
+                t = session.begin_nested()
+                try:
+                    session.add(Period(begin, end))
                     ws.update()
-                    mock.assert_called()
+                finally:
+                    t.rollback()
+
+                assert ws._last_update == datetime.fromtimestamp(end)
+                assert isclose(ws.day.total_seconds(), length)
 
-                # хоть обновление было и позже, последяя запись в бд произошла в now тк время в тестах заморожено
-                assert ws._last_update == now
+                ws = last_ws
 
+            with freeze_time(week_end):
+                ws.update()
                 assert ws.day.total_seconds() == ws._day == 0
-                if day_end < week_end:
-                    assert isclose(ws.week.total_seconds(), ws._week) and isclose(ws._week, last_cache['week'])
-                if day_end < month_end:
+                assert ws.week.total_seconds() == ws._week == 0
+                if week_end < month_end:
                     assert isclose(ws.month.total_seconds(), ws._month) and isclose(ws._month, last_cache['month'])
                     assert isclose(ws.year.total_seconds(), ws._year) and isclose(ws._year, last_cache['year'])
 
-                now = day_end + timedelta(hours=12)
-                with freeze_time(now):
-                    # проводим добавление данных в базу и проверяем
-                    begin = randint(int(day_end.timestamp()), int(day_end.timestamp()) + 10000)
-                    end = randint(begin, int(now.timestamp()))
-                    length = end - begin
-                    last_ws = deepcopy(ws)
-
-                    t = session.begin_nested()
-                    try:
-                        session.add(Period(begin, end))
-                        ws.update()
-                    finally:
-                        t.rollback()
-
-                    assert ws._last_update == datetime.fromtimestamp(end)
-                    assert isclose(ws.day.total_seconds(), length)
-
-                    ws = last_ws
-
-                with freeze_time(week_end):
-                    ws.update()
-                    assert ws.day.total_seconds() == ws._day == 0
-                    assert ws.week.total_seconds() == ws._week == 0
-                    if week_end < month_end:
-                        assert isclose(ws.month.total_seconds(), ws._month) and isclose(ws._month, last_cache['month'])
-                        assert isclose(ws.year.total_seconds(), ws._year) and isclose(ws._year, last_cache['year'])
-
-                with freeze_time(month_end):
-                    ws.update()
-                    assert ws.day.total_seconds() == ws._day == 0
-                    assert ws.week.total_seconds() == ws._week == 0
-                    assert ws.month.total_seconds() == ws._month == 0
+            with freeze_time(month_end):
+                ws.update()
+                assert ws.day.total_seconds() == ws._day == 0
+                assert ws.week.total_seconds() == ws._week == 0
+                assert ws.month.total_seconds() == ws._month == 0
 
-                with freeze_time(year_end):
-                    ws.update()
-                    assert ws.day.total_seconds() == ws._day == 0
-                    assert ws.month.total_seconds() == ws._month == 0
-                    assert ws.year.total_seconds() == ws._year == 0
+            with freeze_time(year_end):
+                ws.update()
+                assert ws.day.total_seconds() == ws._day == 0
+                assert ws.month.total_seconds() == ws._month == 0
+                assert ws.year.total_seconds() == ws._year == 0
 
         with patch('work_statistics.new_session', MagicMock):
             # проверяем, что в новый год не сбрасывается инфа за не законченую неделю
@@ -167,6 +297,67 @@ class TestWorkStatistics:
             mock.assert_not_called()
             assert last == dumps(ws, protocol=4)
 
+    def test_projected(self):
+        now = datetime.now()
+        ws = WorkStatistics.from_db()
+        last = deepcopy(ws)
+
+        def totals(it: WorkStatistics) -> List[float]:
+            return [it.year.total_seconds(), it.month.total_seconds(), it.week.total_seconds(), it.day.total_seconds()]
+
+        # демон недавно обновлял запись - она продлевается до текущего момента
+        with freeze_time(now + timedelta(seconds=10)):
+            projected = ws.projected(heartbeat=60)
+            assert totals(projected) == [it + 10 for it in totals(ws)]
+            assert projected._last_update == datetime.now()
+
+        # запись давно не обновлялась - демон не работает
+        with freeze_time(now + timedelta(seconds=100)):
+            assert totals(ws.projected(heartbeat=60)) == totals(ws)
+
+        # после полуночи время за прошлый день не учитывается
+        day_end = datetime.fromordinal(now.toordinal()) + timedelta(days=1)
+        with freeze_time(day_end + timedelta(seconds=10)):
+            ws._last_update = day_end - timedelta(seconds=20)
+            projected = ws.projected(heartbeat=60)
+            assert projected.day.total_seconds() == 10
+            assert projected.week.total_seconds() in (10, ws.week.total_seconds() + 30)
+
+        ws._last_update = last._last_update
+        assert totals(ws) == totals(last)  # исходная статистика не меняется
+
+    def test_range_statistics(self):
+        now = datetime.now()
+        closed = Period(now - timedelta(days=20), now + timedelta(hours=2))
+        opened = Period(now - timedelta(days=10), None)
+        closed_stats = RangeStatistics.from_db(closed)
+        opened_stats = RangeStatistics.from_db(opened)
+        assert closed_stats.total.total_seconds() == self.database_manager.get_work_time_in_period(closed)
+        assert opened_stats.total.total_seconds() == self.database_manager.get_work_time_in_period(opened)
+
+        with self.database_manager.new_session_context() as session, patch_new_session(session) as mock:
+            # без новых записей ничего не меняется
+            last = closed_stats.total
+            closed_stats.update()
+            assert closed_stats.total == last
+
+            # учитываются только новые записи и только в пределах периода
+            session.query(Period).filter(Period.end == now).update({'end': now + timedelta(minutes=10)})
+            session.add(Period(now + timedelta(hours=1), now + timedelta(hours=3)))
+            closed_stats.update()
+            opened_stats.update()
+            mock.assert_called()
+
+            with freeze_time(now + timedelta(hours=3)):
+                assert closed_stats.total.total_seconds() - last.total_seconds() == 70 * 60
+                assert opened_stats.total.total_seconds() == self.database_manager.get_work_time_in_period(opened)
+
+                # пока демон продлевает запись, время растет без обращения к бд
+                with freeze_time(now + timedelta(hours=3, seconds=10)):
+                    assert (opened_stats.projected(60) - opened_stats.total).total_seconds() == 10
+                    assert closed_stats.projected(60) == closed_stats.total
+                    assert opened_stats.projected(5) == opened_stats.total
+
     def test_ymwd(self):
         now = datetime.now()
         day_begin = datetime.fromordinal(now.toordinal())
@@ -191,3 +382,54 @@ class TestWorkStatistics:
                 ws.year.total_seconds(),
                 self.database_manager.get_work_time_in_period(Period(year_begin, now))
             )
+
+    def test_rollups(self):
+        session = self.database_manager.session
+
+        def rollups() -> Tuple[Dict, Dict]:
+            return dict(session.query(DayRollup.day, DayRollup.seconds)), \
+                dict(session.query(MonthRollup.month, MonthRollup.seconds))
+
+        days, months = rollups()
+        for day, seconds in days.items():
+            begin = datetime.fromordinal(day.toordinal())
+            assert isclose(seconds, self.database_manager.get_work_time_in_period(Period(begin, begin + timedelta(1))))
+        for month, seconds in months.items():
+            assert isclose(seconds, sum(v for k, v in days.items() if k.replace(day=1) == month))
+
+        # сводки, набранные по кусочкам как это делает демон, должны совпадать с пересчитанными
+        session.query(DayRollup).delete()
+        session.query(MonthRollup).delete()
+        for it in session.query(Period).all():
+            step = timedelta(seconds=randint(1, 60*60))
+            t = it.begin
+            while t < it.end:
+                add_to_rollups(session, t, min(t + step, it.end))
+                t += step
+
+        incremental_days, incremental_months = rollups()
+        rebuild_rollups(session)
+        assert incremental_days.keys() == days.keys() and incremental_months.keys() == months.keys()
+        assert all(isclose(incremental_days[k], v) for k, v in days.items())
+        assert all(isclose(incremental_months[k], v) for k, v in months.items())
+
+
+def test_index_overlaps():
+    from period_index import PeriodIndex
+
+    # как и в WorkStatistics.period_stat, каждая запись обрезается отдельно, пересечения учитываются дважды
+    rows = [(1000, 1010), (1005, 1020), (1020, 1030), (1030, 1030), (1040, 1050), (1045, 1048), (1001, 1003)]
+    index = PeriodIndex()
+    index.extend(rows)
+    assert len(index) == 6 and index.last_end == datetime.fromtimestamp(1050)
+    assert index.seconds(1000, 1100) == 50
+    assert index.seconds(1008, 1042) == 26
+
+    index.extend([(1045, 1060)])  # демон продлевает последнюю запись
+    rows[-2] = (1045, 1060)
+    assert len(index) == 6 and index.seconds(1000, 1100) == 62
+
+    for _ in range(100):
+        lower = randint(990, 1070)
+        upper = lower + randint(1, 80)
+        assert index.seconds(lower, upper) == sum(max(min(e, upper) - max(b, lower), 0) for b, e in rows)
@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock, patch
+from freezegun import freeze_time
+from datetime import datetime, timedelta
+
+from tests.db_utils import DatabaseManager, get_max_end_time
+from work_statistics_monitor import WorkStatisticsMonitor
+
+DATABASE = 'sqlite:///testdb.sqlite'
+
+
+@freeze_time(get_max_end_time(DATABASE))
+class TestWorkStatisticsMonitor:
+    __slots__ = ("database_manager", )
+
+    def setup(self):
+        import database.orm as db
+        self.database_manager = DatabaseManager(DATABASE)
+        db.Session = self.database_manager.Session
+
+    def teardown(self):
+        self.database_manager.close_connection()
+
+    def test_draw(self):
+        monitor = WorkStatisticsMonitor(heartbeat=60 * 60)
+        monitor._scr = scr = MagicMock()
+
+        monitor.tick()
+        assert scr.addstr.call_count == 4  # первая отрисовка выводит все строки
+        drawn = list(monitor._lines)
+
+        # без изменений ничего не перерисовывается и экран не очищается
+        scr.reset_mock()
+        monitor.tick()
+        scr.addstr.assert_not_called()
+        scr.clear.assert_not_called()
+
+        # пока демон ведет запись, счетчики растут без обращения к бд
+        with freeze_time(datetime.now() + timedelta(minutes=30)), \
+                patch('work_statistics.new_session') as mock:
+            monitor.tick()
+            mock.assert_not_called()
+        assert scr.addstr.call_count == 4
+        assert monitor._lines != drawn
+
+        # перерисовываются только изменившиеся строки
+        scr.reset_mock()
+        monitor._lines[1] = ''
+        with freeze_time(datetime.now() + timedelta(minutes=30)):
+            monitor.tick()
+        scr.addstr.assert_called_once_with(1, 0, monitor._lines[1])
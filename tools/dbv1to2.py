@@ -0,0 +1,70 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from sys import argv
+
+APP_ROOT: Path = Path(__file__).absolute().parent.parent
+DATABASE = Path(argv[1]) if len(argv) > 1 else APP_ROOT / 'stats.sqlite'
+PERIODS_TABLE = 'work_periods'
+ROLLUP_TABLES = ('work_days', 'work_months')
+SCHEMA_VERSION = 2
+
+
+def to_timestamp(value: str) -> int:
+    """
+    Переводит время в формате, в котором его хранил sqlalchemy.DateTime, в секунды от начала эпохи
+    """
+    return int(datetime.fromisoformat(value).timestamp())
+
+
+def main():
+    if not DATABASE.is_file():
+        print("Ошибка! База не найдена!")
+        return
+
+    # isolation_level=None: транзакцией управляем сами, чтобы изменение схемы было атомарным
+    connection = sqlite3.connect(str(DATABASE), isolation_level=None)
+    try:
+        if not connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                                  (PERIODS_TABLE, )).fetchone():
+            print("Ошибка! Таблица периодов не найдена!")
+            return
+
+        if connection.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            print("Ошибка! База уже имеет новую схему!")
+            return
+
+        connection.execute('BEGIN')
+        rows = [
+            (to_timestamp(begin), to_timestamp(end) if end is not None else None)
+            for begin, end in connection.execute(f'SELECT "begin", "end" FROM {PERIODS_TABLE}')
+        ]
+
+        connection.execute(f'DROP TABLE {PERIODS_TABLE}')
+        connection.execute(f'''
+            CREATE TABLE {PERIODS_TABLE} (
+                "begin" INTEGER NOT NULL,
+                "end" INTEGER,
+                PRIMARY KEY ("begin")
+            )''')
+        connection.execute(f'CREATE INDEX ix_{PERIODS_TABLE}_end_begin ON {PERIODS_TABLE} ("end", "begin")')
+        connection.executemany(f'INSERT INTO {PERIODS_TABLE} ("begin", "end") VALUES (?, ?)', rows)
+
+        # сводки будут пересчитаны демоном при следующем запуске
+        for table in ROLLUP_TABLES:
+            connection.execute(f'DROP TABLE IF EXISTS {table}')
+
+        connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        connection.execute('COMMIT')
+    except BaseException:
+        if connection.in_transaction:
+            connection.execute('ROLLBACK')
+        raise
+    finally:
+        connection.close()
+
+    print(f"Перенесено записей: {len(rows)}")
+
+
+if __name__ == '__main__':
+    main()
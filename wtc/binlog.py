@@ -0,0 +1,276 @@
+"""
+Журнал в виде файла записей фиксированного размера: сигнатура и затем для каждого периода начало и конец в секундах
+от начала эпохи (int64 в порядке байт little-endian). Записи только добавляются в конец, а продление текущего
+периода перезаписывает на месте конец последней записи, поэтому обновление журнала демоном - один системный вызов
+без транзакций. Читатели отображают файл в память и находят записи бинарным поиском
+"""
+import fcntl
+import os
+import struct
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import *
+
+import numpy_engine
+from columnar import MappedJournal
+
+MAGIC = b'wtcbin\x00\x01'
+_HEADER = struct.Struct('<8s')
+_RECORD = struct.Struct('<qq')  # начало и конец периода в секундах от начала эпохи
+_END = struct.Struct('<q')
+_END_OFFSET = _RECORD.size - _END.size  # смещение конца периода от начала записи
+
+
+def is_binlog(path: Path) -> bool:
+    """
+    :return: является ли path файлом журнала этого формата
+    """
+    try:
+        with path.open('rb') as f:
+            return f.read(_HEADER.size) == MAGIC
+    except OSError:
+        return False
+
+
+class BinLogWriter:
+    """
+    Дописывает записи в журнал (используется как контекстный мененджер). Файл создается при отсутствии, а оборванная
+    при аварийном завершении запись отбрасывается. Изменения не синхронизируются с диском (fsync), поэтому переживают
+    аварийное завершение процесса, но не системы. Пока журнал открыт, на файл установлена исключительная блокировка
+    (flock), поэтому писатель у журнала один
+    """
+
+    __slots__ = ('_path', '_wait', '_fd', '_size', '_last')
+
+    def __init__(self, path: Path, wait: bool = True):
+        """
+        :param wait: ждать ли освобождения журнала другим писателем
+        """
+        self._path = path
+        self._wait = wait
+        self._fd: Optional[int] = None
+        self._size = 0  # размер файла без оборванной записи
+        self._last: Optional[Tuple[int, int]] = None  # последняя запись журнала
+
+    def __enter__(self) -> 'BinLogWriter':
+        """
+        :raise BlockingIOError: если журнал открыт другим писателем, а wait не указан
+        """
+        while True:
+            self._fd = os.open(str(self._path), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | (0 if self._wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                os.close(self._fd)
+                raise BlockingIOError(f'журнал {self._path} открыт другим процессом, например демоном')
+
+            # пока ждали блокировку, журнал мог быть заменен (см. compaction), тогда открываем новый файл
+            if os.fstat(self._fd).st_ino == os.stat(str(self._path)).st_ino:
+                break
+            os.close(self._fd)
+
+        try:
+            size = os.fstat(self._fd).st_size
+            if size == 0:
+                os.write(self._fd, _HEADER.pack(MAGIC))
+                size = _HEADER.size
+            elif os.pread(self._fd, _HEADER.size, 0) != MAGIC:
+                raise ValueError(f'{self._path} не является журналом wtc')
+
+            self._size = size - (size - _HEADER.size) % _RECORD.size
+            if self._size < size:
+                os.ftruncate(self._fd, self._size)
+            if self._size > _HEADER.size:
+                self._last = _RECORD.unpack(os.pread(self._fd, _RECORD.size, self._size - _RECORD.size))
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        os.close(self._fd)
+        self._fd = None
+
+    @property
+    def last(self) -> Optional[Tuple[int, int]]:
+        """
+        :return: начало и конец последней записи (сек от начала эпохи) или None, если журнал пуст
+        """
+        return self._last
+
+    def append(self, begin: datetime, end: datetime):
+        """
+        Добавляет запись в конец журнала
+
+        :raise ValueError: если запись пуста или пересекается с последней
+        """
+        record = int(begin.timestamp()), int(end.timestamp())
+        self._check(record)
+
+        os.pwrite(self._fd, _RECORD.pack(*record), self._size)
+        self._size += _RECORD.size
+        self._last = record
+
+    def extend(self, rows: Iterable[Tuple[int, int]]):
+        """
+        Добавляет в конец журнала записи (сек от начала эпохи), отсортированные по началу и не пересекающиеся.
+        Записи пишутся порциями, поэтому подходит для переноса журнала целиком
+
+        :raise ValueError: если запись пуста или пересекается с предыдущей. Записанные до нее записи остаются в журнале
+        """
+        chunk = bytearray()
+        for record in rows:
+            try:
+                self._check(record)
+            except ValueError:
+                os.pwrite(self._fd, chunk, self._size)
+                self._size += len(chunk)
+                raise
+            chunk += _RECORD.pack(*record)
+            self._last = record
+            if len(chunk) >= 1000 * _RECORD.size:
+                os.pwrite(self._fd, chunk, self._size)
+                self._size += len(chunk)
+                chunk = bytearray()
+
+        os.pwrite(self._fd, chunk, self._size)
+        self._size += len(chunk)
+
+    def update_last(self, end: datetime):
+        """
+        Продлевает последнюю запись журнала до end
+        """
+        assert self._last is not None and end.timestamp() > self._last[0]
+
+        os.pwrite(self._fd, _END.pack(int(end.timestamp())), self._size - _END_OFFSET)
+        self._last = self._last[0], int(end.timestamp())
+
+    def sync(self):
+        """
+        Синхронизирует журнал с диском
+        """
+        os.fsync(self._fd)
+
+    def _check(self, record: Tuple[int, int]):
+        """
+        :raise ValueError: если запись не может быть добавлена в конец журнала
+        """
+        if record[1] <= record[0]:
+            raise ValueError(f'запись {record} пуста')
+        if self._last is not None and self._last[1] > record[0]:
+            raise ValueError(f'запись {record} пересекается с последней записью журнала {self._last}')
+
+
+class BinLog(MappedJournal):
+    """
+    Журнал, отображенный в память на момент открытия. Если numpy доступен и use_numpy, массивы begins и ends -
+    срезы numpy.memmap, иначе - срезы memoryview с элементами int64
+    """
+
+    __slots__ = ()
+
+    def __init__(self, path: Path, use_numpy: bool = False):
+        """
+        :raise FileNotFoundError: если журнала нет
+        :raise ValueError: если файл не является журналом
+        """
+        super().__init__(use_numpy)
+        if not is_binlog(path):
+            if not path.is_file():
+                raise FileNotFoundError(f'журнал {path} не найден, журнал ведется командой daemon')
+            raise ValueError(f'{path} не является журналом wtc')
+
+        # оборванная при аварийном завершении демона запись не учитывается
+        n = (path.stat().st_size - _HEADER.size) // _RECORD.size
+        if not n:
+            return
+
+        if self._numpy:
+            records = numpy_engine.np.memmap(str(path), dtype='<i8', mode='r', offset=_HEADER.size, shape=(n, 2))
+            self.begins, self.ends = records[:, 0], records[:, 1]
+        else:
+            import mmap
+
+            with path.open('rb') as f:
+                self._mmaps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+            records = memoryview(self._mmaps[-1])[_HEADER.size:_HEADER.size + n * _RECORD.size].cast('q')
+            self.begins, self.ends = records[0::2], records[1::2]
+            records.release()
+
+    @property
+    def last_end(self) -> Optional[int]:
+        """
+        :return: конец последней записи (сек от начала эпохи) или None, если журнал пуст
+        """
+        return int(self.ends[-1]) if len(self.ends) else None
+
+
+def from_sqlite(database: str, path: Path) -> int:
+    """
+    Переносит записи журнала из базы sqlite в новый файл журнала. Пересекающиеся и касающиеся записи базы
+    объединяются, тк записи журнала не пересекаются
+
+    :param database: url базы
+    :return: количество записей в новом журнале
+    :raise FileExistsError: если файл журнала уже существует
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Period, begin_seconds, end_seconds
+    from merge import union
+
+    if path.exists():
+        raise FileExistsError(f'{path} уже существует')
+
+    engine = create_engine(database)
+    try:
+        with closing(sessionmaker(bind=engine)()) as session, BinLogWriter(path) as writer:
+            writer.extend(union([session.query(begin_seconds, end_seconds).filter(Period.end.isnot(None))
+                                 .order_by(Period.begin).yield_per(1000)]))
+    finally:
+        engine.dispose()
+
+    with BinLog(path) as journal:
+        return len(journal)
+
+
+def to_sqlite(path: Path, database: str) -> int:
+    """
+    Переносит записи журнала в новую базу sqlite и рассчитывает по ним сводки
+
+    :param database: url базы
+    :return: количество перенесенных записей
+    :raise FileExistsError: если в базе уже есть журнал
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from database import Period, SCHEMA_VERSION, rebuild_rollups
+    from database.orm import Base
+
+    engine = create_engine(database)
+    try:
+        if engine.dialect.has_table(engine, Period.__tablename__):
+            raise FileExistsError(f'база {database} уже содержит журнал')
+        engine.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        Base.metadata.create_all(engine)
+
+        n = 0
+        with closing(sessionmaker(bind=engine)()) as session, BinLog(path) as journal:
+            chunk = []
+            for n, row in enumerate(journal.rows(), 1):
+                chunk.append({'begin': row[0], 'end': row[1]})
+                if len(chunk) == 1000:
+                    session.execute(Period.__table__.insert(), chunk)
+                    chunk = []
+            if chunk:
+                session.execute(Period.__table__.insert(), chunk)
+
+            rebuild_rollups(session)
+            session.commit()
+    finally:
+        engine.dispose()
+
+    return n
@@ -0,0 +1,234 @@
+"""
+Колоночный снимок журнала для анализа: начала и концы записей хранятся в отдельных файлах begin.npy и end.npy
+(непрерывные массивы int64 в формате numpy .npy), а в header.json - количество записей и выгруженный промежуток.
+Снимок отображается в память без копирования, поэтому его размер ограничен только диском
+"""
+import ast
+import json
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import *
+
+import numpy_engine
+
+FORMAT = 'wtc-columnar'
+VERSION = 1
+HEADER_FILE = 'header.json'
+BEGIN_FILE = 'begin.npy'
+END_FILE = 'end.npy'
+CHUNK_SIZE = 4096  # количество записей, накапливаемых перед записью в файлы
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128  # размер заголовка .npy вместе с сигнатурой, кратен 64 как требует формат
+_DESCR = ('<' if sys.byteorder == 'little' else '>') + 'i8'  # int64 в порядке байт платформы
+
+
+def write(rows: Iterable[Tuple[int, int]], directory: Path, begin: Optional[datetime] = None,
+          end: Optional[datetime] = None) -> int:
+    """
+    Записывает снимок в каталог directory(создается при отсутствии). Записи обрабатываются порциями,
+    поэтому расход памяти не зависит от их количества. Пересекающиеся и касающиеся записи объединяются (см.
+    merge.union), поэтому в снимке концы записей тоже отсортированы, а пересечения учитываются один раз
+
+    :param rows: пары (начало, конец) в секундах от начала эпохи, отсортированные по началу
+    :param begin: начало выгруженного промежутка, сохраняется в заголовке
+    :param end: конец выгруженного промежутка, сохраняется в заголовке
+    :return: количество записанных записей
+    """
+    from merge import union
+
+    directory.mkdir(parents=True, exist_ok=True)
+    n = 0
+
+    with (directory / BEGIN_FILE).open('wb') as begin_file, (directory / END_FILE).open('wb') as end_file:
+        # размер массивов заранее неизвестен, поэтому заголовки .npy перезаписываются в конце
+        begin_file.write(_npy_header(0))
+        end_file.write(_npy_header(0))
+
+        begins, ends = array('q'), array('q')
+        for row_begin, row_end in union([rows]):
+            begins.append(row_begin)
+            ends.append(row_end)
+            if len(begins) == CHUNK_SIZE:
+                begins.tofile(begin_file)
+                ends.tofile(end_file)
+                n += len(begins)
+                begins, ends = array('q'), array('q')
+
+        begins.tofile(begin_file)
+        ends.tofile(end_file)
+        n += len(begins)
+
+        for f in begin_file, end_file:
+            f.seek(0)
+            f.write(_npy_header(n))
+
+    with (directory / HEADER_FILE).open('w') as f:
+        json.dump({
+            'format': FORMAT,
+            'version': VERSION,
+            'rows': n,
+            'begin': int(begin.timestamp()) if begin is not None else None,
+            'end': int(end.timestamp()) if end is not None else None
+        }, f)
+
+    return n
+
+
+class MappedJournal:
+    """
+    Записи журнала, отображенные в память (можно использовать как контекстный мененджер): массивы begins и ends -
+    numpy.memmap или memoryview с элементами int64 непересекающихся записей, отсортированные по началу. Подсчет
+    ведется по срезам массивов без копирования
+    """
+
+    __slots__ = ('begins', 'ends', '_mmaps', '_numpy')
+
+    def __init__(self, use_numpy: bool):
+        self._mmaps: List[mmap.mmap] = []
+        self._numpy = use_numpy and numpy_engine.available()
+        self.begins: Sequence[int] = memoryview(array('q'))
+        self.ends: Sequence[int] = memoryview(array('q'))
+
+    def __enter__(self) -> 'MappedJournal':
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.begins)
+
+    def close(self):
+        if not self._numpy:
+            self.begins.release()
+            self.ends.release()
+        for it in self._mmaps:
+            it.close()
+        self._mmaps.clear()
+
+    def period_stat(self, p) -> timedelta:
+        """
+        :param p: промежуток с атрибутами begin и end, например database.Period
+        :return: активное время за промежуток, см. WorkStatistics.period_stat
+        """
+        return self.period_stats((p, ))[0]
+
+    def period_stats(self, periods: Iterable) -> List[timedelta]:
+        """
+        :return: активное время за каждый из промежутков в порядке их передачи, см. WorkStatistics.period_stats
+        """
+        now = datetime.now()
+        ranges = [(p.begin.timestamp(), (p.end if p.end is not None else now).timestamp()) for p in periods]
+        assert all(end > begin for begin, end in ranges)
+        if not ranges:
+            return []
+
+        begins, ends = self._slice(min(it[0] for it in ranges), max(it[1] for it in ranges))
+        if self._numpy:
+            totals = numpy_engine.bucket_totals(begins, ends, [it[0] for it in ranges], [it[1] for it in ranges])
+            return [timedelta(seconds=int(it)) for it in totals]
+
+        return [timedelta(seconds=sum(max(min(e, upper) - max(b, lower), 0) for b, e in zip(begins, ends)))
+                for lower, upper in ranges]
+
+    def grouped_stat(self, p, unit: str) -> Iterator[Tuple[datetime, datetime, timedelta]]:
+        """
+        :return: активное время за каждый год, месяц, неделю или день промежутка, см. reports.grouped_stat
+        """
+        from reports import buckets, group_periods
+
+        end = p.end if p.end is not None else datetime.now()
+        assert end > p.begin
+
+        begins, ends = self._slice(p.begin.timestamp(), end.timestamp())
+        if self._numpy:
+            groups = list(buckets(p.begin, end, unit))
+            totals = numpy_engine.bucket_totals(begins, ends, [it[0].timestamp() for it in groups],
+                                                [it[1].timestamp() for it in groups])
+            for (group_begin, group_end), seconds in zip(groups, totals):
+                yield group_begin, group_end, timedelta(seconds=int(seconds))
+        else:
+            for group_begin, group_end, seconds in group_periods(zip(begins, ends), p.begin, end, unit):
+                yield group_begin, group_end, timedelta(seconds=seconds)
+
+    def rows(self, lower: Optional[float] = None, upper: Optional[float] = None) -> Iterator[Tuple[int, int]]:
+        """
+        :return: пары (начало, конец) в секундах от начала эпохи для записей, пересекающихся с промежутком
+                 [lower, upper) (без ограничения, если граница не указана)
+        """
+        begins, ends = self._slice(lower if lower is not None else float('-inf'),
+                                   upper if upper is not None else float('inf'))
+        for begin, end in zip(begins, ends):
+            yield int(begin), int(end)
+
+    def _slice(self, lower: float, upper: float) -> Tuple[Sequence[int], Sequence[int]]:
+        """
+        :return: начала и концы записей, пересекающихся с промежутком [lower, upper), без копирования
+        """
+        first = bisect_right(self.ends, lower)  # записи не пересекаются, поэтому концы тоже отсортированы
+        last = bisect_left(self.begins, upper)
+        return self.begins[first:last], self.ends[first:last]
+
+
+class ColumnarJournal(MappedJournal):
+    """
+    Колоночный снимок журнала, отображенный в память. Если numpy доступен, массивы begins и ends - numpy.memmap,
+    иначе - memoryview с элементами int64
+    """
+
+    __slots__ = ('header', )
+
+    def __init__(self, directory: Path, use_numpy: bool = True):
+        """
+        :raise ValueError: если каталог не содержит снимок поддерживаемой версии
+        """
+        super().__init__(use_numpy)
+        with (directory / HEADER_FILE).open() as f:
+            self.header: Dict[str, Any] = json.load(f)
+        if self.header.get('format') != FORMAT or self.header.get('version') != VERSION:
+            raise ValueError(f'{directory} не является колоночным снимком журнала версии {VERSION}')
+
+        if self._numpy:
+            np = numpy_engine.np
+            self.begins = np.load(str(directory / BEGIN_FILE), mmap_mode='r')
+            self.ends = np.load(str(directory / END_FILE), mmap_mode='r')
+        else:
+            self.begins = self._map(directory / BEGIN_FILE)
+            self.ends = self._map(directory / END_FILE)
+
+        if not len(self.begins) == len(self.ends) == self.header['rows']:
+            self.close()
+            raise ValueError(f'размеры массивов снимка {directory} не совпадают с заголовком')
+
+    def _map(self, path: Path) -> memoryview:
+        with path.open('rb') as f:
+            prefix = f.read(len(NPY_MAGIC) + 2)
+            if len(prefix) < len(NPY_MAGIC) + 2 or prefix[:len(NPY_MAGIC)] != NPY_MAGIC:
+                raise ValueError(f'{path} не является файлом .npy версии 1.0')
+
+            meta_size = struct.unpack('<H', prefix[len(NPY_MAGIC):])[0]
+            header_size = len(prefix) + meta_size
+            meta = ast.literal_eval(f.read(meta_size).decode('latin1'))
+            if meta['descr'] != _DESCR or meta['fortran_order'] or len(meta['shape']) != 1:
+                raise ValueError(f'{path} не является одномерным массивом int64')
+
+            if not meta['shape'][0]:
+                return memoryview(array('q'))
+
+            self._mmaps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        return memoryview(self._mmaps[-1])[header_size:header_size + 8 * meta['shape'][0]].cast('q')
+
+
+def _npy_header(n: int) -> bytes:
+    """
+    :return: заголовок .npy версии 1.0 для одномерного массива из n элементов int64
+    """
+    meta = f"{{'descr': '{_DESCR}', 'fortran_order': False, 'shape': ({n},), }}"
+    size = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+    return NPY_MAGIC + struct.pack('<H', size) + meta.ljust(size - 1).encode('latin1') + b'\n'
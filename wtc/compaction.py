@@ -0,0 +1,121 @@
+"""
+Сжатие журнала: записи, между которыми не больше заданного промежутка (например, после перезапуска демона), и
+пересекающиеся записи объединяются в одну. Промежуток между объединенными записями становится активным временем,
+а пересечения учитываются один раз, поэтому статистика и сводки меняются вместе с записями. База читается за один
+проход порциями в порядке начала записей внутри одной транзакции, а сводки исправляются в конце прохода
+на накопленное по дням время объединенных промежутков и пересечений, без полного пересчета
+"""
+import os
+from datetime import datetime, date
+from pathlib import Path
+from typing import *
+
+PAGE_SIZE = 500  # записей в порции, удаляемые записи порции передаются одним запросом
+
+
+def compact_database(session, max_gap: float) -> int:
+    """
+    Объединяет записи базы. Последняя запись не изменяется, тк ее может продлевать демон, который находит ее по
+    началу. Изменения не фиксируются, транзакцию завершает вызывающий код
+
+    :param session: сессия orm
+    :param max_gap: наибольший промежуток между объединяемыми записями (сек)
+    :return: количество удаленных записей
+    """
+    from database import Period, rollups_available, begin_seconds, end_seconds
+    from database.orm import adjust_rollups, split_by_days
+    from sqlalchemy import func
+
+    last_begin = session.query(func.max(begin_seconds)).scalar()
+    if last_begin is None:
+        return 0
+
+    days: Dict[date, float] = {}  # изменение дневной сводки
+    removed = 0
+    current: Optional[List[int]] = None  # начало, конец после объединения и конец в базе текущей записи
+    after: Optional[int] = None  # начало последней прочитанной записи
+
+    while True:
+        # порции выбираются по началу записи, поэтому удаление прочитанных записей не влияет на следующие запросы
+        query = session.query(begin_seconds, end_seconds).filter(Period.end.isnot(None), begin_seconds < last_begin)
+        if after is not None:
+            query = query.filter(begin_seconds > after)
+        page = query.order_by(Period.begin).limit(PAGE_SIZE).all()
+        if not page:
+            break
+
+        after = page[-1][0]
+        absorbed = []
+        extended = []  # начало и новый конец записей, поглотивших следующие
+        for begin, end in page:
+            if current is None or begin - current[1] > max_gap:
+                if current is not None and current[1] != current[2]:
+                    extended.append({'old_begin': current[0], 'new_end': current[1]})
+                current = [begin, end, end]
+                continue
+
+            if begin > current[1]:
+                for day, seconds in split_by_days(datetime.fromtimestamp(current[1]), datetime.fromtimestamp(begin)):
+                    days[day] = days.get(day, 0) + seconds
+            elif begin < current[1]:
+                # пересечение учтено в сводках дважды
+                for day, seconds in split_by_days(datetime.fromtimestamp(begin),
+                                                  datetime.fromtimestamp(min(end, current[1]))):
+                    days[day] = days.get(day, 0) - seconds
+
+            current[1] = max(current[1], end)
+            absorbed.append(begin)
+
+        if absorbed:
+            session.query(Period).filter(begin_seconds.in_(absorbed)).delete(synchronize_session=False)
+            removed += len(absorbed)
+        _extend(session, extended)
+
+    if current is not None and current[1] != current[2]:
+        _extend(session, [{'old_begin': current[0], 'new_end': current[1]}])
+    if rollups_available():
+        adjust_rollups(session, ((day, seconds) for day, seconds in days.items() if seconds))
+    return removed
+
+
+def _extend(session, extended: List[Dict[str, int]]):
+    """
+    Записывает в базу новые концы записей одним запросом с набором параметров
+    """
+    from database import Period
+    from sqlalchemy import Integer, bindparam
+
+    if extended:
+        table = Period.__table__
+        session.execute(table.update().where(table.c.begin == bindparam('old_begin', type_=Integer))
+                        .values(end=bindparam('new_end', type_=Integer)), extended)
+
+
+def compact_binlog(path: Path, max_gap: float) -> int:
+    """
+    Объединяет записи журнала binlog. Сжатый журнал записывается во временный файл, который затем заменяет журнал
+
+    :param max_gap: наибольший промежуток между объединяемыми записями (сек)
+    :return: количество удаленных записей
+    :raise BlockingIOError: если журнал ведет запущенный демон
+    """
+    from binlog import BinLog, BinLogWriter
+    from merge import union
+
+    compacted = path.with_name(path.name + '.compact')
+    with BinLogWriter(path, wait=False), BinLog(path) as journal:
+        if compacted.exists():
+            compacted.unlink()  # остался от прерванного сжатия
+
+        with BinLogWriter(compacted) as writer:
+            writer.extend(union([journal.rows()], max_gap))
+            writer.sync()
+
+        removed = len(journal)
+        with BinLog(compacted) as result:
+            removed -= len(result)
+
+        # блокировка журнала снимается после замены, ожидающий ее демон откроет уже новый файл
+        os.replace(str(compacted), str(path))
+
+    return removed
@@ -1,6 +1,11 @@
-from database import new_session, Period
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import date, datetime
+from heartbeat import Heartbeat, read as read_heartbeat
+from pathlib import Path
+from storage import open_storage
+import metrics
 from time import sleep, time
+from typing import *
 import logging
 
 logger = logging.getLogger('wtc.daemon')
@@ -8,43 +13,260 @@ logger = logging.getLogger('wtc.daemon')
 MINIMUM_ACTIVE_TIME = 5 * 60  # 5m
 MAX_COUNTED_SLEEP = 3 * 60 * 60  # 3h
 UPDATE_DELAY = 30
+FLUSH_DELAY = 0  # пауза между сбросами текущего периода в базу, если больше UPDATE_DELAY - используется HEARTBEAT_FILE
+HEARTBEAT_FILE: Optional[Path] = None  # файл с еще не сброшенным в базу текущим периодом
+SOCKET_FILE: Optional[Path] = None  # unix сокет, через который демон отдает статистику, см. stats_server
+BINLOG_FILE: Optional[Path] = None  # если указан, журнал ведется в этом файле вместо базы sqlite, см. binlog
+KEEP_RAW_DAYS = 0  # записи старше стольких дней сворачиваются в записи по дням, 0 - хранить все, см. retention
+METRICS_PORT = 0  # порт на localhost, на котором отдаются метрики в формате prometheus, 0 - не отдавать
 
+COMMIT_SECONDS = metrics.histogram('wtc_daemon_commit_seconds', 'Длительность записи изменений в базу')
+SLEEP_DRIFT_BUCKETS = (.01, .1, 1, 10, 60, 10 * 60, 60 * 60)  # границы ниже MAX_COUNTED_SLEEP, см. configure_metrics
+SLEEP_DRIFT_SECONDS = metrics.histogram(
+    'wtc_daemon_sleep_drift_seconds', 'Превышение фактической паузы между обновлениями записи над update_delay',
+    (*SLEEP_DRIFT_BUCKETS, MAX_COUNTED_SLEEP)
+)
+RESTARTS = metrics.counter('wtc_daemon_restarts_total', 'Перезапуски главного цикла после сна дольше max_counted_sleep')
+ROWS_WRITTEN = metrics.counter('wtc_daemon_rows_written_total', 'Добавленные и обновленные записи журнала')
+BYTES_WRITTEN = metrics.counter('wtc_daemon_written_bytes_total', 'Байты, записанные демоном при сбросах в базу')
+HEARTBEAT_WRITES = metrics.counter('wtc_daemon_heartbeat_writes_total',
+                                   'Обновления записи, сохраненные только в heartbeat')
 
-def main_loop() -> bool:
+
+def configure_metrics():
+    """
+    Задает границы метрик, зависящие от настроек демона (MAX_COUNTED_SLEEP), вызывается после чтения настроек
+    """
+    SLEEP_DRIFT_SECONDS.reset((*(it for it in SLEEP_DRIFT_BUCKETS if it < MAX_COUNTED_SLEEP), MAX_COUNTED_SLEEP))
+
+
+def _now() -> datetime:
+    """
+    :return: текущее время с точностью до секунды, с которой время хранится в базе
+    """
+    return datetime.now().replace(microsecond=0)
+
+
+def recover():
+    """
+    Переносит в базу период, оставшийся в HEARTBEAT_FILE после аварийного завершения демона
+    """
+    if HEARTBEAT_FILE is None:
+        return
+
+    pending = read_heartbeat(HEARTBEAT_FILE)
+    if pending is None:
+        return
+
+    begin, end = map(datetime.fromtimestamp, pending)
+    with open_storage(BINLOG_FILE) as storage:
+        with _flushing(storage):
+            storage.restore(begin, end)
+        ROWS_WRITTEN.inc()
+
+    with Heartbeat(HEARTBEAT_FILE) as heartbeat:
+        heartbeat.clear()
+
+    logger.info('recovered an unflushed entry')
+
+
+def apply_retention():
+    """
+    Сворачивает записи старше KEEP_RAW_DAYS дней в записи по дням. Журнал binlog не сворачивается
+    """
+    if not KEEP_RAW_DAYS or BINLOG_FILE is not None:
+        return
+
+    from database import new_session
+    from retention import fold_periods
+
+    with new_session() as session:
+        removed = fold_periods(session, datetime.fromordinal(date.today().toordinal() - KEEP_RAW_DAYS))
+        session.commit()
+
+    if removed:
+        logger.info(f'old entries folded into daily entries, removed {removed} rows')
+
+
+def main_loop(server=None) -> bool:
     """
     Главный цикл программы
 
+    :param server: StatsServer, которому передается каждое обновление записи
+
     :return: True если требуется перезапуск(например, если пользователь оставил комплютер на ночь в режиме сна.
             Время в режиме сна более MAX_COUNTED_SLEEP секунд не учитывается)
     """
-
-    begin = datetime.now()
+    begin = _now()
     sleep(MINIMUM_ACTIVE_TIME)
 
-    with new_session() as session:
-        session.add(Period(begin, datetime.now()))
+    # при редких сбросах в базу текущий период между ними хранится в HEARTBEAT_FILE
+    coalesce = HEARTBEAT_FILE is not None and FLUSH_DELAY > UPDATE_DELAY
+
+    with open_storage(BINLOG_FILE) as storage, Heartbeat(HEARTBEAT_FILE) if coalesce else _NoHeartbeat() as heartbeat:
+        end = _now()
+        # не держим транзакцию записи открытой до первого сброса, она блокирует других писателей
+        with _flushing(storage):
+            storage.add(begin, end)
+        ROWS_WRITTEN.inc()
+        flushed_end = end  # конец периода, уже переданный в хранилище
         last_update = time()
+        last_flush = last_update
+        if server is not None:
+            server.record(begin, end)
         logger.info('written new entry')
 
-        while True:
-            try:
-                sleep(UPDATE_DELAY)
-            finally:
-                if last_update + MAX_COUNTED_SLEEP < time():
-                    return True  # нужен перезапуск тк мы не должны учитывать длительный сон
+        def flush():
+            nonlocal flushed_end, last_flush
+            with _flushing(storage):
+                if end > flushed_end:
+                    storage.extend(begin, flushed_end, end)
+                    ROWS_WRITTEN.inc()
+                    flushed_end = end
+            heartbeat.clear()
+            last_flush = time()
+
+        try:
+            while True:
+                sleep_begin = time()
+                try:
+                    sleep(UPDATE_DELAY)
+                finally:
+                    drift = time() - sleep_begin - UPDATE_DELAY
+                    if drift >= 0:  # отрицательное значение - пауза прервана
+                        SLEEP_DRIFT_SECONDS.observe(drift)
+
+                    if last_update + MAX_COUNTED_SLEEP < time():
+                        RESTARTS.inc()
+                        return True  # нужен перезапуск тк мы не должны учитывать длительный сон
+
+                    end = _now()
+                    last_update = time()
+                    if server is not None:
+                        server.record(begin, end)
+
+                    if not coalesce or last_update - last_flush >= FLUSH_DELAY:
+                        flush()
+                        logger.info('entry updated')
+                    else:
+                        heartbeat.write(begin, end)
+                        HEARTBEAT_WRITES.inc()
+        finally:
+            if coalesce:
+                flush()  # при завершении и перезапуске сбрасываем в базу все, что накопилось
+
+
+@contextmanager
+def _flushing(storage):
+    """
+    Изменения хранилища внутри блока with записываются при выходе из него. В метриках учитываются длительность записи
+    и объем, записанный текущим потоком за весь блок: журнал binlog пишется сразу при изменении, база sqlite -
+    в основном при фиксации транзакции, а потоки серверов статистики и метрик в объем не попадают
+    """
+    written = metrics.written_bytes()
+    yield
+    with COMMIT_SECONDS.time():
+        storage.commit()
+
+    if written is not None:
+        BYTES_WRITTEN.inc(metrics.written_bytes() - written)
+
+
+class _NoHeartbeat:
+    """
+    Заглушка для Heartbeat, когда текущий период пишется сразу в базу
+    """
+
+    def __enter__(self) -> '_NoHeartbeat':
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        pass
+
+    def write(self, begin: datetime, end: datetime):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _load_statistics():
+    """
+    :return: WorkStatistics с индексом всего журнала
+    """
+    from work_statistics import WorkStatistics
+
+    if BINLOG_FILE is None:
+        return WorkStatistics.from_db(index=True)
+
+    from binlog import BinLog
+
+    if not BINLOG_FILE.is_file():
+        return WorkStatistics.from_periods((), index=True)
+
+    with BinLog(BINLOG_FILE) as journal:
+        return WorkStatistics.from_periods(journal.rows(), index=True)
+
+
+def _start_stats_server():
+    """
+    Запускает сервер статистики, если указан SOCKET_FILE
+
+    :return: StatsServer или None, если сервер не используется или не смог запуститься
+    """
+    if SOCKET_FILE is None:
+        return None
+
+    from stats_server import StatsServer
+
+    # ошибка сервера статистики не должна останавливать запись журнала
+    try:
+        server = StatsServer(SOCKET_FILE, _load_statistics(), _load_statistics)
+        server.start()
+    except Exception as e:
+        logger.warning(f'не удалось запустить сервер статистики: {e}')
+        return None
+
+    return server
+
+
+def _start_metrics_server() -> Optional[metrics.MetricsServer]:
+    """
+    Запускает http сервер метрик, если указан METRICS_PORT
+
+    :return: MetricsServer или None, если сервер не используется или не смог запуститься
+    """
+    if not METRICS_PORT:
+        return None
+
+    server = metrics.MetricsServer(int(METRICS_PORT))
+    try:
+        server.start()
+    except OSError as e:
+        logger.warning(f'не удалось запустить сервер метрик: {e}')
+        return None
 
-                session.query(Period).filter(Period.begin == begin).update({'end': datetime.now()})
-                last_update = time()
-                session.commit()
-                logger.info('entry updated')
+    return server
 
 
 def start():
     try:
         logger.setLevel(logging.INFO)
         logger.info('демон запущен')
-        while main_loop():
-            logger.info('restarting the main loop')
+        configure_metrics()
+        metrics_server = _start_metrics_server()
+        recover()
+        apply_retention()
+        server = _start_stats_server()
+        try:
+            while main_loop(server):
+                logger.info('restarting the main loop')
+                apply_retention()
+        finally:
+            if server is not None:
+                server.close()
+            if metrics_server is not None:
+                metrics_server.close()
     except KeyboardInterrupt:
         logger.info('демон завершил работу')
     except Exception as e:
@@ -1,2 +1,4 @@
-from .orm import new_session, Period, init, create_tables
+from .orm import new_session, Period, DayRollup, MonthRollup, init, create_tables, add_to_rollups, \
+    rebuild_rollups, rollups_available, database_identity, schema_version, begin_seconds, end_seconds, SCHEMA_VERSION, \
+    SchemaVersionError
 from sqlalchemy.orm import Session
@@ -1,4 +1,4 @@
-import re
+import os
 from sqlalchemy import *
 from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session as SessionType, sessionmaker
@@ -6,18 +6,41 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime, date, timedelta
 from contextlib import contextmanager
+from period_parser import parse_period, format_period
+from schema import SCHEMA_VERSION, PERIODS_TABLE, DAYS_TABLE, MONTHS_TABLE, SchemaVersionError
 from typing import *
 
 Base = declarative_base()
 Session: Optional[SessionType]
 engine: Optional[Engine] = None
+_rollups_available: bool = False
+
+
+class Timestamp(TypeDecorator):
+    """
+    Время, хранящееся в базе как целое количество секунд от начала эпохи и представляемое в виде datetime
+    """
+    impl = Integer
+
+    def process_bind_param(self, value: Optional[Union[int, float, datetime, date]], dialect) -> Optional[int]:
+        if value is None:
+            return None
+        if type(value) in (int, float):
+            return int(value)
+        if not hasattr(value, 'timestamp'):
+            value = datetime.fromordinal(value.toordinal())
+        return int(value.timestamp())
+
+    def process_result_value(self, value: Optional[int], dialect) -> Optional[datetime]:
+        return datetime.fromtimestamp(value) if value is not None else None
 
 
 class Period(Base):
-    __tablename__ = 'work_periods'
+    __tablename__ = PERIODS_TABLE
+    __table_args__ = (Index('ix_work_periods_end_begin', 'end', 'begin'), )
 
-    begin = Column(DateTime, primary_key=True)
-    end = Column(DateTime)
+    begin = Column(Timestamp, primary_key=True, autoincrement=False)
+    end = Column(Timestamp)
 
     def __init__(self, begin: Union[int, float, datetime, date], end: Optional[Union[int, float, datetime, date]] = None):
         if type(begin) in (int, float):
@@ -42,67 +65,153 @@ class Period(Base):
         self.end = end
 
     def __repr__(self):
-        end = self.end.strftime('%Y.%m.%d %H:%M:%S') if self.end else 'now'
-        return f'{self.begin.strftime("%Y.%m.%d %H:%M:%S")} - {end}'
+        return format_period(self.begin, self.end)
 
     def __eq__(self, other: 'Period'):
         return self.begin == other.begin and self.end == other.end
 
     @staticmethod
     def from_string(s: str) -> 'Period':
-        assert s
-
-        dates: List[Union[str, datetime]] = s.split('-')
-        if len(dates) > 2:
-            raise ValueError('неверный формат периода')
-
-        date_reg = re.compile(r'(?:(?:(?P<day>\d{2})\.)?(?P<month>\d{2})\.)?(?P<year>\d{4})')
-        us_like_date_reg = re.compile(r'(?P<year>\d{4})?(?:\.(?P<month>\d{2})(?:\.(?P<day>\d{2}))?)?')
-
-        def parse_date(date_string: str) -> Tuple[Optional[datetime], int]:
-            """
-            :param date_string: строка с единственной датой
-            :return: представление указаной даты в виде обьекта datetime и "ранг" даты, равный 0, 1(если день не указан)
-            или 2(если месяц не указан). None - текущее время.
-            """
-
-            if date_string == 'now':
-                return None, 0
-
-            m = re.fullmatch(date_reg, date_string)
-            if not m:
-                m = re.fullmatch(us_like_date_reg, date_string)
-                if not m:
-                    raise ValueError
-
-            return datetime(
-                int(m.group('year')),
-                int(m.group('month')) if m.group('month') else 1,
-                int(m.group('day')) if m.group('day') else 1
-            ), 0 if m.group('day') is not None else (1 if m.group('month') is not None else 2)
-
-        if len(dates) == 2:
-            dates = [it[0] for it in map(parse_date, dates)]
-        else:
-            dates[0], rang = parse_date(dates[0])
-            if rang == 0:
-                dates.append(dates[0] + timedelta(days=1))
-            elif rang == 1:
-                tmp = dates[0].month == 12
-                dates.append(datetime(dates[0].year + tmp, 1 if tmp else dates[0].month + 1, 1))
-            elif rang == 2:
-                dates.append(datetime(dates[0].year + 1, 1, 1))
+        """
+        см. period_parser.parse_period
+        """
+        return Period(*parse_period(s))
+
+
+# границы записей журнала в виде секунд от начала эпохи для запросов, которым не нужны объекты datetime
+begin_seconds = type_coerce(Period.begin, Integer)
+end_seconds = type_coerce(Period.end, Integer)
+
+
+class DayRollup(Base):
+    """
+    Предрассчитанное активное время за день
+    """
+    __tablename__ = DAYS_TABLE
+
+    day = Column(Date, primary_key=True)
+    seconds = Column(Float, nullable=False)
+
+    def __init__(self, day: date, seconds: float = 0):
+        self.day = day
+        self.seconds = seconds
+
+
+class MonthRollup(Base):
+    """
+    Предрассчитанное активное время за месяц. month - первое число месяца
+    """
+    __tablename__ = MONTHS_TABLE
+
+    month = Column(Date, primary_key=True)
+    seconds = Column(Float, nullable=False)
+
+    def __init__(self, month: date, seconds: float = 0):
+        self.month = month
+        self.seconds = seconds
+
+
+def split_by_days(begin: datetime, end: datetime) -> Iterator[Tuple[date, float]]:
+    """
+    Разбивает промежуток времени по границам дней
+
+    :return: пары (день, количество секунд промежутка, пришедшееся на этот день)
+    """
+    day = begin.date()
+    while datetime.fromordinal(day.toordinal()) < end:
+        next_day = day + timedelta(days=1)
+        seconds = min(end.timestamp(), datetime.fromordinal(next_day.toordinal()).timestamp()) \
+            - max(begin.timestamp(), datetime.fromordinal(day.toordinal()).timestamp())
+        if seconds > 0:
+            yield day, seconds
+        day = next_day
+
+
+def add_to_rollups(session: SessionType, begin: datetime, end: datetime):
+    """
+    Добавляет промежуток активного времени в дневную и месячную сводки
+    """
+    adjust_rollups(session, split_by_days(begin, end))
+
+
+def adjust_rollups(session: SessionType, days: Iterable[Tuple[date, float]]):
+    """
+    Изменяет дневную и месячную сводки на переданное для каждого дня время (сек, может быть отрицательным)
+    """
+    days = list(days)
+    if not days:
+        return
+
+    # сводки за затронутые дни загружаются одним запросом, а не отдельным запросом на каждый день
+    first, last = min(it[0] for it in days), max(it[0] for it in days)
+    day_rollups = {it.day: it for it in session.query(DayRollup).filter(DayRollup.day.between(first, last))}
+    month_rollups = {it.month: it for it in session.query(MonthRollup).filter(
+        MonthRollup.month.between(first.replace(day=1), last))}
+
+    for day, seconds in days:
+        day_rollup = day_rollups.get(day)
+        if day_rollup is None:
+            day_rollup = day_rollups[day] = DayRollup(day)
+            session.add(day_rollup)
+        day_rollup.seconds += seconds
+
+        month = day.replace(day=1)
+        month_rollup = month_rollups.get(month)
+        if month_rollup is None:
+            month_rollup = month_rollups[month] = MonthRollup(month)
+            session.add(month_rollup)
+        month_rollup.seconds += seconds
 
-        if len(dates) == 2:
-            assert dates[0] is not None
-            if dates[1] is not None and dates[1] <= dates[0]:
-                raise ValueError('дата начала анализируемого промежутка времени обязана быть меньше даты конца')
 
-        return Period(dates[0], dates[1] if len(dates) == 2 else None)
+def rebuild_rollups(session: SessionType):
+    """
+    Пересчитывает дневную и месячную сводки по всем записям журнала
+    """
+    days: Dict[date, float] = {}
+    months: Dict[date, float] = {}
+    for begin, end in session.query(Period.begin, Period.end).filter(Period.end.isnot(None)):
+        for day, seconds in split_by_days(begin, end):
+            days[day] = days.get(day, 0) + seconds
+            month = day.replace(day=1)
+            months[month] = months.get(month, 0) + seconds
+
+    session.query(DayRollup).delete()
+    session.query(MonthRollup).delete()
+    session.add_all(DayRollup(*it) for it in days.items())
+    session.add_all(MonthRollup(*it) for it in months.items())
+
+
+def rollups_available() -> bool:
+    """
+    :return: есть ли в подключенной базе таблицы сводок
+    """
+    return _rollups_available
+
+
+def database_identity() -> Optional[Tuple[int, int]]:
+    """
+    :return: идентификатор файла подключенной базы (устройство, inode) или None если база не в файле
+    """
+    if engine is None or not engine.url.database:
+        return None
+
+    try:
+        st = os.stat(engine.url.database)
+    except OSError:
+        return None
+
+    return st.st_dev, st.st_ino
+
+
+def schema_version() -> int:
+    """
+    :return: версия схемы подключенной базы
+    """
+    return engine.execute('PRAGMA user_version').scalar()
 
 
 def init(database_url: str, *, check_exists=True):
-    global engine, Session
+    global engine, Session, _rollups_available
     engine = create_engine(database_url)
 
     if check_exists:
@@ -111,15 +220,34 @@ def init(database_url: str, *, check_exists=True):
         except OperationalError:
             raise ConnectionError("невозмбжно подключиться к базе данных")
 
+    if engine.dialect.has_table(engine, Period.__tablename__) and schema_version() != SCHEMA_VERSION:
+        raise SchemaVersionError(schema_version())
+
+    _rollups_available = engine.dialect.has_table(engine, DayRollup.__tablename__) \
+        and engine.dialect.has_table(engine, MonthRollup.__tablename__)
     Session = sessionmaker(bind=engine)
 
 
 def create_tables():
     """
-    Создает таблицу для хранения промежутков рабочего времени
+    Создает таблицу для хранения промежутков рабочего времени и таблицы сводок.
+    Если сводок в базе еще не было, они рассчитываются по уже имеющимся записям.
     """
+    global _rollups_available
+
+    if not engine.dialect.has_table(engine, Period.__tablename__):
+        engine.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     Base.metadata.create_all(engine)
 
+    if not _rollups_available:
+        session = Session()
+        try:
+            rebuild_rollups(session)
+            session.commit()
+        finally:
+            session.close()
+        _rollups_available = True
+
 
 @contextmanager
 def new_session() -> ContextManager[SessionType]:
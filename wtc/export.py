@@ -0,0 +1,133 @@
+"""
+Выгрузка записей журнала. Записи читаются из базы порциями по CHUNK_SIZE и сразу записываются в поток,
+поэтому расход памяти не зависит от размера выгружаемого промежутка
+"""
+import csv
+import io
+import json
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import *
+
+from database import Period, new_session, begin_seconds, end_seconds
+
+FORMATS = ('csv', 'jsonl', 'bin')
+CHUNK_SIZE = 1000  # количество записей, читаемых из базы за раз
+MAGIC = b'wtcexp\x00\x01'
+_HEADER = struct.Struct('<8s')
+_RECORD = struct.Struct('<qq')  # начало и конец записи в секундах от начала эпохи
+
+
+def periods(p: Optional[Period] = None) -> Iterator[Tuple[int, int]]:
+    """
+    :param p: промежуток времени, None - весь журнал
+    :return: пары (начало, конец) в секундах от начала эпохи для записей журнала, пересекающихся с промежутком,
+             в порядке возрастания начала. Записи не обрезаются по границам промежутка
+    """
+    with new_session() as session:
+        query = session.query(begin_seconds, end_seconds)
+        if p is not None:
+            query = query.filter(Period.end > p.begin)
+            if p.end is not None:
+                query = query.filter(Period.begin < p.end)
+
+        yield from query.order_by(Period.begin).yield_per(CHUNK_SIZE)
+
+
+def write_csv(rows: Iterable[Tuple[int, int]], f: BinaryIO) -> int:
+    """
+    Записывает строки begin, end (местное время в формате iso), seconds
+
+    :return: количество записанных записей
+    """
+    text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+    try:
+        writer = csv.writer(text)
+        writer.writerow(('begin', 'end', 'seconds'))
+        n = 0
+        for n, (begin, end) in enumerate(rows, 1):
+            writer.writerow((datetime.fromtimestamp(begin).isoformat(), datetime.fromtimestamp(end).isoformat(),
+                             end - begin))
+    finally:
+        text.flush()
+        text.detach()
+
+    return n
+
+
+def write_jsonl(rows: Iterable[Tuple[int, int]], f: BinaryIO) -> int:
+    """
+    Записывает по обьекту {"begin": ..., "end": ..., "seconds": ...} на строку, время - местное в формате iso
+
+    :return: количество записанных записей
+    """
+    n = 0
+    for n, (begin, end) in enumerate(rows, 1):
+        f.write(json.dumps({'begin': datetime.fromtimestamp(begin).isoformat(),
+                            'end': datetime.fromtimestamp(end).isoformat(),
+                            'seconds': end - begin}).encode() + b'\n')
+
+    return n
+
+
+def write_binary(rows: Iterable[Tuple[int, int]], f: BinaryIO) -> int:
+    """
+    Записывает сигнатуру и затем для каждой записи начало и конец в секундах от начала эпохи
+    (int64 little-endian), см. read_binary
+
+    :return: количество записанных записей
+    """
+    f.write(_HEADER.pack(MAGIC))
+    n = 0
+    for n, (begin, end) in enumerate(rows, 1):
+        f.write(_RECORD.pack(begin, end))
+
+    return n
+
+
+def read_binary(f: BinaryIO) -> Iterator[Tuple[int, int]]:
+    """
+    :return: пары (начало, конец) из файла, записанного write_binary
+    :raise ValueError: если файл имеет другой формат
+    """
+    if f.read(_HEADER.size) != MAGIC:
+        raise ValueError('неверный формат файла выгрузки')
+
+    while True:
+        chunk = f.read(_RECORD.size * CHUNK_SIZE)
+        if len(chunk) % _RECORD.size:
+            raise ValueError('файл выгрузки поврежден')
+        if not chunk:
+            return
+        yield from _RECORD.iter_unpack(chunk)
+
+
+WRITERS: Dict[str, Callable[[Iterable[Tuple[int, int]], BinaryIO], int]] = {
+    'csv': write_csv, 'jsonl': write_jsonl, 'bin': write_binary
+}
+
+
+def export(f: BinaryIO, fmt: str = 'csv', p: Optional[Period] = None,
+           rows: Optional[Iterable[Tuple[int, int]]] = None) -> int:
+    """
+    Выгружает записи журнала, пересекающиеся с промежутком p, в поток f в указанном формате
+
+    :param rows: выгружаемые записи, если журнал ведется не в базе, см. binlog
+    :return: количество выгруженных записей
+    """
+    return WRITERS[fmt](rows if rows is not None else periods(p), f)
+
+
+def export_columnar(directory: Path, p: Optional[Period] = None,
+                    rows: Optional[Iterable[Tuple[int, int]]] = None) -> int:
+    """
+    Выгружает записи журнала, пересекающиеся с промежутком p, в колоночный снимок, см. columnar.write
+
+    :param rows: выгружаемые записи, если журнал ведется не в базе, см. binlog
+    :return: количество выгруженных записей
+    """
+    import columnar
+
+    return columnar.write(rows if rows is not None else periods(p), directory, p.begin if p is not None else None,
+                          p.end if p is not None else None)
@@ -0,0 +1,224 @@
+"""
+Быстрый путь команд stat и stat <период>: статистика запрашивается у демона, а если он недоступен - считается
+запросами sqlite3 к базе, открытой только для чтения, или по журналу binlog, отображенному в память. Модуль
+не загружает sqlalchemy и orm, поэтому запуск занимает меньше времени, чем сам подсчет. Выражения и границы
+периодов общие с orm (см. schema), поэтому результаты совпадают с WorkStatistics.from_db и
+WorkStatistics.period_stat. Снимок статистики (WorkStatistics.save_snapshot) не используется: он нужен мониторингу
+stat -f, а здесь статистика за год считается одним запросом по индексу концов записей
+"""
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime
+from pathlib import Path
+from typing import *
+
+import binlog
+import heartbeat
+import stats_client
+from period_parser import TimeRange
+from schema import SCHEMA_VERSION, PERIODS_TABLE, DAYS_TABLE, MONTHS_TABLE, SchemaVersionError, clipped_sum, \
+    full_days, get_ymwd_begins_timestamps, rollup_ranges
+
+TEMPLATE = \
+    'в этом году: {year:.1f}h\n' \
+    'в этом месяце: {month:.1f}h\n' \
+    'на этой неделе: {week:.1f}h\n' \
+    'сегодня: {day:.1f}h'
+
+
+def format_statistics(year: float, month: float, week: float, day: float) -> List[str]:
+    """
+    :return: строки вывода статистики за год, месяц, неделю, день (сек)
+    """
+    return TEMPLATE.format(year=year / 3600, month=month / 3600, week=week / 3600, day=day / 3600).split('\n')
+
+
+def connect(database: Path) -> sqlite3.Connection:
+    """
+    Открывает базу только для чтения
+
+    :raise FileNotFoundError: если базы нет
+    :raise SchemaVersionError: если схема базы не поддерживается
+    """
+    if not database.is_file():
+        raise FileNotFoundError(f'база {database} не найдена, журнал ведется командой daemon')
+
+    connection = sqlite3.connect(f'file:{database}?mode=ro', uri=True)
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    if version != SCHEMA_VERSION and _has_table(connection, PERIODS_TABLE):
+        connection.close()
+        raise SchemaVersionError(version)
+
+    return connection
+
+
+def work_statistics(database: Path, socket: Optional[Path] = None,
+                    heartbeat_file: Optional[Path] = None) -> Tuple[float, float, float, float]:
+    """
+    :param database: база sqlite или журнал binlog
+    :param socket: сокет сервера статистики демона
+    :param heartbeat_file: файл с еще не сброшенным демоном в базу текущим периодом
+    :return: активное время за текущий год, месяц, неделю, день (сек)
+    """
+    if socket is not None:
+        response = stats_client.query(socket, {'query': 'stat'})
+        if response is not None:
+            return response['year'], response['month'], response['week'], response['day']
+
+    boundaries = get_ymwd_begins_timestamps()
+    if binlog.is_binlog(database):
+        with binlog.BinLog(database) as journal:
+            last_end = journal.last_end
+            totals = [it.total_seconds() for it in journal.period_stats(
+                TimeRange(datetime.fromtimestamp(it), None) for it in boundaries
+            )]
+    else:
+        last_end, totals = _sqlite_totals(database, boundaries)
+
+    pending = _pending(heartbeat_file, last_end)
+    if pending is not None:
+        begin, end = pending
+        totals = [total + max(end - max(begin, it), 0) for total, it in zip(totals, boundaries)]
+
+    return tuple(totals)
+
+
+def period_seconds(database: Path, begin: datetime, end: Optional[datetime], socket: Optional[Path] = None,
+                   heartbeat_file: Optional[Path] = None) -> float:
+    """
+    Для базы sqlite целые дни внутри периода берутся из сводок, записи журнала обрабатываются только для неполных
+    первого и последнего дней
+
+    :param database: база sqlite или журнал binlog
+    :param end: конец периода, None - до текущего момента
+    :return: активное время за период (сек)
+    """
+    if socket is not None:
+        response = stats_client.query(socket, {'query': 'period', 'begin': begin.timestamp(),
+                                               'end': end.timestamp() if end is not None else None})
+        if response is not None:
+            return response['seconds']
+
+    end = end if end is not None else datetime.now()
+    assert end > begin
+
+    if binlog.is_binlog(database):
+        with binlog.BinLog(database) as journal:
+            res = journal.period_stat(TimeRange(begin, end)).total_seconds()
+            last_end = journal.last_end
+    else:
+        res, last_end = _sqlite_period_seconds(database, begin, end)
+
+    pending = _pending(heartbeat_file, last_end)
+    if pending is not None:
+        res += max(min(pending[1], end.timestamp()) - max(pending[0], begin.timestamp()), 0)
+
+    return res
+
+
+def _has_table(connection: sqlite3.Connection, name: str) -> bool:
+    return connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name, )).fetchone() \
+        is not None
+
+
+def _sqlite_totals(database: Path, boundaries: Sequence[float]) -> Tuple[Optional[int], List[float]]:
+    """
+    :return: конец последней записи журнала и активное время начиная с каждой из границ boundaries
+    """
+    with closing(connect(database)) as connection:
+        if not _has_table(connection, PERIODS_TABLE):
+            return None, [0] * len(boundaries)
+
+        last_end, *totals = connection.execute(
+            f'SELECT max("end"), {", ".join(clipped_sum(it) for it in boundaries)} '
+            f'FROM {PERIODS_TABLE} WHERE "end" > ?',
+            (int(boundaries[0]), )
+        ).fetchone()
+
+    return last_end, totals
+
+
+def _sqlite_period_seconds(database: Path, begin: datetime, end: datetime) -> Tuple[float, Optional[int]]:
+    """
+    :return: активное время за период и конец последней записи журнала
+    """
+    with closing(connect(database)) as connection:
+        if not _has_table(connection, PERIODS_TABLE):
+            return 0, None
+
+        res = _period_seconds(connection, begin, end, _has_rollups(connection))
+        last_end = connection.execute(f'SELECT max("end") FROM {PERIODS_TABLE}').fetchone()[0]
+
+    return res, last_end
+
+
+def ranges_seconds(database: Path, ranges: Sequence[Tuple[float, float]]) -> List[float]:
+    """
+    Считает по базе sqlite так же, как period_seconds, но без обращения к демону и учета heartbeat
+
+    :param ranges: промежутки (начало, конец) в секундах от начала эпохи
+    :return: активное время за каждый из промежутков в порядке их передачи
+    """
+    with closing(connect(database)) as connection:
+        if not _has_table(connection, PERIODS_TABLE):
+            return [0.] * len(ranges)
+
+        rollups = _has_rollups(connection)
+        return [_period_seconds(connection, datetime.fromtimestamp(begin), datetime.fromtimestamp(end), rollups)
+                for begin, end in ranges]
+
+
+def _has_rollups(connection: sqlite3.Connection) -> bool:
+    return _has_table(connection, DAYS_TABLE) and _has_table(connection, MONTHS_TABLE)
+
+
+def _period_seconds(connection: sqlite3.Connection, begin: datetime, end: datetime, rollups: bool) -> float:
+    """
+    :param rollups: есть ли в базе сводки, из которых берутся целые дни периода
+    :return: активное время между begin и end
+    """
+    days = full_days(begin, end) if rollups else None
+    if days is None:
+        return _raw_seconds(connection, begin, end)
+
+    first_day, last_day = days
+    return _raw_seconds(connection, begin, first_day) \
+        + _rollup_seconds(connection, first_day.date(), last_day.date()) \
+        + _raw_seconds(connection, last_day, end)
+
+
+def _raw_seconds(connection: sqlite3.Connection, begin: datetime, end: datetime) -> float:
+    """
+    :return: активное время между begin и end, посчитанное по записям журнала
+    """
+    if end <= begin:
+        return 0
+
+    lower, upper = int(begin.timestamp()), int(end.timestamp())
+    return connection.execute(f'SELECT {clipped_sum(lower, upper)} FROM {PERIODS_TABLE} '
+                              f'WHERE "end" > ? AND "begin" < ?', (lower, upper)).fetchone()[0]
+
+
+def _rollup_seconds(connection: sqlite3.Connection, first_day: date, last_day: date) -> float:
+    """
+    :return: активное время за дни с first_day по last_day(не включительно), посчитанное по сводкам,
+             см. schema.rollup_ranges
+    """
+    res = 0
+    for unit, begin, end in rollup_ranges(first_day, last_day):
+        table = DAYS_TABLE if unit == 'day' else MONTHS_TABLE
+        res += connection.execute(f'SELECT coalesce(sum(seconds), 0) FROM {table} WHERE {unit} >= ? AND {unit} < ?',
+                                  (begin.isoformat(), end.isoformat())).fetchone()[0]
+
+    return res
+
+
+def _pending(heartbeat_file: Optional[Path], last_end: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    :return: часть текущего периода демона, еще не сброшенная в базу (сек от начала эпохи)
+    """
+    pending = heartbeat.read(heartbeat_file) if heartbeat_file is not None else None
+    if pending is None or last_end is not None and pending[1] <= last_end:
+        return None
+
+    return max(pending[0], last_end or 0), pending[1]
@@ -0,0 +1,106 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+from pathlib import Path
+from time import sleep, monotonic
+from typing import *
+
+logger = logging.getLogger('wtc.FileWatcher')
+
+# события inotify, означающие изменение содержимого файла
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+class FileWatcher:
+    """
+    Ожидание изменения файлов в одной директории (используется как контекстный мененджер).
+
+    На linux использует inotify и сообщает об изменении сразу. Если inotify недоступен, ожидание просто длится
+    до истечения таймаута, после чего файлы считаются измененными.
+    """
+
+    __slots__ = ('_directory', '_names', '_fd')
+
+    def __init__(self, paths: Iterable[Path]):
+        paths = [Path(it).absolute() for it in paths]
+        assert paths and all(it.parent == paths[0].parent for it in paths)
+
+        self._directory = paths[0].parent
+        self._names = {os.fsencode(it.name) for it in paths}
+        self._fd: Optional[int] = None
+
+    def __enter__(self) -> 'FileWatcher':
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1')
+
+            # следим за директорией, тк файлы журнала sqlite создаются и удаляются
+            if libc.inotify_add_watch(fd, os.fsencode(str(self._directory)), WATCH_MASK) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(errno, 'inotify_add_watch')
+
+            self._fd = fd
+        except (OSError, AttributeError) as e:
+            logger.info(f'inotify недоступен, используется периодическая проверка: {e}')
+
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Ожидает изменения отслеживаемых файлов не дольше timeout секунд
+
+        :return: True если файлы изменились. Без inotify всегда True по истечении timeout
+        """
+        if self._fd is None:
+            sleep(timeout)
+            return True
+
+        deadline = monotonic() + timeout
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+
+            if select.select([self._fd], [], [], remaining)[0] and self._read_events():
+                return True
+
+    def _read_events(self) -> bool:
+        """
+        :return: есть ли среди накопившихся событий изменения отслеживаемых файлов
+        """
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 4096)
+            except BlockingIOError:
+                return changed
+
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                changed = changed or name in self._names
@@ -0,0 +1,70 @@
+import mmap
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import *
+
+MAGIC = b'wtchb\x00\x00\x01'
+_RECORD = struct.Struct('<8sqq')  # сигнатура, начало и конец периода в секундах от начала эпохи
+
+
+class Heartbeat:
+    """
+    Файл, в который демон записывает текущий период между сбросами его в базу (используется как контекстный
+    мененджер). Файл отображается в память, поэтому обновление не требует ни системных вызовов, ни fsync,
+    а записанное переживает аварийное завершение демона.
+    """
+
+    __slots__ = ('_path', '_mmap')
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._mmap: Optional[mmap.mmap] = None
+
+    def __enter__(self) -> 'Heartbeat':
+        fd = os.open(str(self._path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < _RECORD.size:
+                os.ftruncate(fd, _RECORD.size)
+            self._mmap = mmap.mmap(fd, _RECORD.size)
+        finally:
+            os.close(fd)
+
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        self._mmap.close()
+        self._mmap = None
+
+    def write(self, begin: datetime, end: datetime):
+        """
+        Записывает текущий период
+        """
+        _RECORD.pack_into(self._mmap, 0, MAGIC, int(begin.timestamp()), int(end.timestamp()))
+
+    def clear(self):
+        """
+        Помечает, что несброшенного в базу периода нет
+        """
+        _RECORD.pack_into(self._mmap, 0, MAGIC, 0, 0)
+
+
+def read(path: Path) -> Optional[Tuple[int, int]]:
+    """
+    :return: несброшенный в базу период (начало, конец) в секундах от начала эпохи или None
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read(_RECORD.size)
+    except FileNotFoundError:
+        return None
+
+    if len(data) < _RECORD.size:
+        return None
+
+    magic, begin, end = _RECORD.unpack(data)
+    if magic != MAGIC or end <= begin:
+        return None
+
+    return begin, end
@@ -0,0 +1,157 @@
+"""
+Объединение журналов нескольких компьютеров. Журналы читаются потоком в порядке начала записей и сливаются
+через кучу (k-way merge), а пересекающиеся записи разных журналов объединяются по ходу слияния, поэтому
+одновременная работа на нескольких компьютерах учитывается один раз. Память расходуется только на текущие
+записи журналов, а не на сами журналы
+"""
+import heapq
+from contextlib import closing
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import *
+
+import binlog
+import fast_stat
+from schema import PERIODS_TABLE
+
+
+def source_rows(path: Path, lower: Optional[float] = None, upper: Optional[float] = None) -> Iterator[Tuple[int, int]]:
+    """
+    :param path: база sqlite или журнал binlog
+    :return: пары (начало, конец) в секундах от начала эпохи для записей журнала, пересекающихся с промежутком
+             [lower, upper), в порядке возрастания начала
+    """
+    if binlog.is_binlog(path):
+        with binlog.BinLog(path) as journal:
+            yield from journal.rows(lower, upper)
+        return
+
+    with closing(fast_stat.connect(path)) as connection:
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                              (PERIODS_TABLE, )).fetchone() is None:
+            return
+
+        yield from connection.execute(
+            f'SELECT "begin", "end" FROM {PERIODS_TABLE} '
+            f'WHERE "end" IS NOT NULL AND "end" > ? AND "begin" < ? ORDER BY "begin"',
+            (int(lower) if lower is not None else -2 ** 63, int(upper) if upper is not None else 2 ** 63 - 1)
+        )
+
+
+def union(sources: Iterable[Iterable[Tuple[int, int]]], max_gap: float = 0) -> Iterator[Tuple[int, int]]:
+    """
+    :param sources: потоки записей, каждый отсортирован по началу
+    :param max_gap: записи, между которыми не больше max_gap секунд, объединяются вместе с промежутком между ними
+    :return: отсортированные непересекающиеся записи, покрывающие то же время, что и записи всех потоков
+    """
+    current: Optional[List[int]] = None
+    for begin, end in heapq.merge(*sources):
+        if current is not None and begin - current[1] <= max_gap:
+            current[1] = max(current[1], end)
+            continue
+
+        if current is not None:
+            yield current[0], current[1]
+        current = [begin, end]
+
+    if current is not None:
+        yield current[0], current[1]
+
+
+def active_before(rows: Iterable[Tuple[float, float]], moments: Sequence[float]) -> List[float]:
+    """
+    Считает за один проход суммарное активное время до каждого из моментов. Активное время за промежуток [a, b) -
+    разность значений для b и a
+
+    :param rows: отсортированные непересекающиеся записи
+    :return: активное время до каждого из моментов в порядке их передачи (сек)
+    """
+    order = sorted(range(len(moments)), key=moments.__getitem__)
+    res = [0.] * len(moments)
+    total = 0.  # длительность записей, закончившихся до текущей
+    i = 0
+
+    for begin, end in rows:
+        # моменты до конца текущей записи: предыдущие записи учтены целиком, текущая - до момента
+        while i < len(order) and moments[order[i]] < end:
+            res[order[i]] = total + max(moments[order[i]] - begin, 0)
+            i += 1
+        if i == len(order):
+            break
+        total += end - begin
+
+    for it in order[i:]:
+        res[it] = total
+
+    return res
+
+
+class MergedJournal:
+    """
+    Объединение журналов (баз sqlite и журналов binlog), см. columnar.MappedJournal. Журналы перечитываются потоком
+    при каждом запросе
+    """
+
+    __slots__ = ('_paths', )
+
+    def __init__(self, paths: Sequence[Path]):
+        """
+        :raise FileNotFoundError: если одного из журналов нет
+        """
+        for it in paths:
+            if not it.is_file():
+                raise FileNotFoundError(f'журнал {it} не найден')
+
+        self._paths = list(paths)
+
+    def __enter__(self) -> 'MergedJournal':
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        pass
+
+    def rows(self, lower: Optional[float] = None, upper: Optional[float] = None) -> Iterator[Tuple[int, int]]:
+        """
+        :return: объединенные записи всех журналов, пересекающиеся с промежутком [lower, upper)
+        """
+        return union(source_rows(it, lower, upper) for it in self._paths)
+
+    def period_stat(self, p) -> timedelta:
+        """
+        :param p: промежуток с атрибутами begin и end, например database.Period
+        """
+        return self.period_stats((p, ))[0]
+
+    def period_stats(self, periods: Iterable) -> List[timedelta]:
+        """
+        :return: активное время за каждый из промежутков в порядке их передачи
+        """
+        now = datetime.now()
+        ranges = [(p.begin.timestamp(), (p.end if p.end is not None else now).timestamp()) for p in periods]
+        assert all(end > begin for begin, end in ranges)
+        if not ranges:
+            return []
+
+        return [timedelta(seconds=it) for it in self._ranges_seconds(ranges)]
+
+    def grouped_stat(self, p, unit: str) -> Iterator[Tuple[datetime, datetime, timedelta]]:
+        """
+        :return: активное время за каждый год, месяц, неделю или день промежутка, см. reports.grouped_stat
+        """
+        from reports import buckets
+
+        end = p.end if p.end is not None else datetime.now()
+        assert end > p.begin
+
+        groups = list(buckets(p.begin, end, unit))
+        totals = self._ranges_seconds([(it[0].timestamp(), it[1].timestamp()) for it in groups])
+        for (group_begin, group_end), seconds in zip(groups, totals):
+            yield group_begin, group_end, timedelta(seconds=seconds)
+
+    def _ranges_seconds(self, ranges: Sequence[Tuple[float, float]]) -> List[float]:
+        """
+        :return: активное время за каждый из промежутков
+        """
+        moments = [it for r in ranges for it in r]
+        res = active_before(self.rows(min(moments), max(moments)), moments)
+        return [upper - lower for lower, upper in zip(res[::2], res[1::2])]
@@ -0,0 +1,209 @@
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Thread
+from time import perf_counter
+from typing import *
+
+logger = logging.getLogger('wtc.metrics')
+
+DEFAULT_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)  # границы гистограмм длительностей (сек)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    """
+    Счетчик, значение которого только растет
+    """
+
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value: float = 0
+
+    def inc(self, value: float = 1):
+        self.value += value
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        yield f'{self.name} {_format(self.value)}'
+
+
+class Histogram:
+    """
+    Распределение наблюдаемых значений по заранее заданным интервалам
+    """
+
+    __slots__ = ('name', 'help', 'bounds', 'counts', 'sum')
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.reset(buckets)
+
+    def reset(self, buckets: Sequence[float]):
+        """
+        Задает новые границы интервалов и обнуляет гистограмму, например если границы зависят от настроек
+        """
+        assert list(buckets) == sorted(buckets)
+        self.bounds: Tuple[float, ...] = tuple(buckets)  # верхние границы интервалов, последний интервал - до +Inf
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)  # количество значений в каждом интервале
+        self.sum: float = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        """
+        Учитывает длительность выполнения блока with (сек)
+        """
+        begin = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - begin)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+
+        total = 0
+        for bound, count in zip((*map(_format, self.bounds), '+Inf'), self.counts):
+            total += count
+            yield f'{self.name}_bucket{{le="{bound}"}} {total}'
+
+        yield f'{self.name}_sum {_format(self.sum)}'
+        yield f'{self.name}_count {total}'
+
+
+class Registry:
+    """
+    Набор метрик процесса. Метрики изменяются без блокировок, поэтому каждую метрику должен изменять только один поток
+    """
+
+    __slots__ = ('_metrics', )
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Histogram]] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        """
+        :return: счетчик с указанным именем, при отсутствии он создается
+        """
+        return self._get(name, lambda: Counter(name, help), Counter)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """
+        :return: гистограмма с указанным именем, при отсутствии она создается
+        """
+        return self._get(name, lambda: Histogram(name, help, buckets), Histogram)
+
+    def render(self) -> str:
+        """
+        :return: значения всех метрик в текстовом формате prometheus
+        """
+        return ''.join(f'{line}\n' for metric in self._metrics.values() for line in metric.render())
+
+    def _get(self, name: str, factory: Callable[[], Any], kind: type):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = factory()
+
+        assert isinstance(metric, kind)
+        return metric
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+
+
+class MetricsServer:
+    """
+    Http сервер, отдающий метрики в формате prometheus на localhost (можно использовать как контекстный мененджер)
+    """
+
+    __slots__ = ('_port', '_registry', '_server', '_thread')
+
+    def __init__(self, port: int, registry: Registry = REGISTRY):
+        self._port = port
+        self._registry = registry
+        self._server = None
+        self._thread: Optional[Thread] = None
+
+    def __enter__(self) -> 'MetricsServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        self.close()
+
+    def start(self):
+        """
+        Начинает принимать запросы в отдельном потоке
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self._registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args):
+                logger.debug(format % args)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self._port), Handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, name='metrics-server', daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    @property
+    def port(self) -> int:
+        """
+        :return: порт, на котором работает сервер(если был указан 0 - выбранный системой)
+        """
+        return self._server.server_address[1]
+
+
+def written_bytes() -> Optional[int]:
+    """
+    :return: количество байт, переданных текущим потоком в системные вызовы записи (linux), или None, если неизвестно.
+             Запись остальных потоков процесса, например http сервера метрик, не учитывается
+    """
+    try:
+        with open('/proc/thread-self/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    return None
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
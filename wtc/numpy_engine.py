@@ -0,0 +1,66 @@
+from typing import *
+
+_NOT_LOADED = object()
+np: Any = _NOT_LOADED  # numpy импортируется при первой проверке available, тк его загрузка заметно замедляет запуск
+
+
+def available() -> bool:
+    """
+    :return: можно ли использовать векторизованный подсчет
+    """
+    global np
+
+    if np is _NOT_LOADED:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # numpy не является обязательной зависимостью, без него статистика считается средствами бд
+            np = None
+
+    return np is not None
+
+
+def clipped_sums(begins: 'np.ndarray', ends: 'np.ndarray', lowers: Sequence[float],
+                 upper: Optional[float] = None) -> List[int]:
+    """
+    Подсчет активного времени с нижними границами lowers и общей верхней границей upper обрезанием каждой записи.
+    Подходит для небольшого количества границ, например для начала года, месяца, недели и дня.
+
+    :return: активное время (сек) для каждой из нижних границ
+    """
+    if upper is not None:
+        ends = np.minimum(ends, int(upper))
+
+    return [int(np.maximum(ends - np.maximum(begins, int(it)), 0).sum()) for it in lowers]
+
+
+def bucket_totals(begins: 'np.ndarray', ends: 'np.ndarray', lowers: Sequence[float],
+                  uppers: Sequence[float]) -> 'np.ndarray':
+    """
+    Подсчет активного времени для произвольного количества промежутков [lowers[i], uppers[i]).
+    Каждая запись обрезается по промежутку отдельно, поэтому пересекающиеся записи учитываются, как в подсчете
+    средствами бд (schema.clipped_sum), дважды.
+
+    :return: массив активного времени (сек) для каждого промежутка
+    """
+    lowers = np.asarray(lowers, dtype=np.int64)
+    uppers = np.asarray(uppers, dtype=np.int64)
+    return active_before(begins, ends, uppers) - active_before(begins, ends, lowers)
+
+
+def active_before(begins: 'np.ndarray', ends: 'np.ndarray', moments: 'np.ndarray') -> 'np.ndarray':
+    """
+    Сумма по записям max(min(end, t) - begin, 0) для каждого момента t равна сумме (t - begin) по записям,
+    начавшимся до t, минус сумма (t - end) по записям, закончившимся до t, поэтому начала и концы сортируются
+    независимо и порядок и пересечения записей не важны
+
+    :return: суммарное активное время до каждого из моментов moments (сек)
+    """
+    begins = np.sort(begins)
+    ends = np.sort(ends)
+    begins_prefix = np.concatenate(([0], np.cumsum(begins)))
+    ends_prefix = np.concatenate(([0], np.cumsum(ends)))
+
+    started = np.searchsorted(begins, moments, side='left')  # количество записей, начавшихся до момента
+    finished = np.searchsorted(ends, moments, side='left')  # количество записей, закончившихся до момента
+    return (started - finished) * moments - begins_prefix[started] + ends_prefix[finished]
@@ -0,0 +1,93 @@
+"""
+Параллельный подсчет разбивки и статистики за множество промежутков (stat --by, stat --batch) для длинных периодов
+и нескольких журналов. Каждый процесс пула открывает журналы только для чтения. Журналы объединяются так же, как
+при последовательном подсчете: несколько журналов и binlog (см. ParallelJournal) - объединением записей, время
+делится на отрезки (shards), а активное время до каждого момента суммируется по отрезкам. База sqlite
+(см. ParallelDatabase) - как WorkStatistics, обрезая каждую запись отдельно, процессам раздаются промежутки, а целые
+дни в них берутся из сводок
+"""
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import *
+
+import fast_stat
+from merge import MergedJournal, active_before, source_rows, union
+
+SHARDS_PER_WORKER = 4  # отрезков на процесс, чтобы процессы с редкими записями не простаивали
+
+
+def shards(lower: float, upper: float, n: int) -> List[Tuple[float, float]]:
+    """
+    :return: n примыкающих друг к другу отрезков, покрывающих промежуток [lower, upper)
+    """
+    assert upper > lower and n > 0
+    bounds = [lower + (upper - lower) * i // n for i in range(n)] + [upper]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+def shard_active_before(paths: Sequence[Path], lower: float, upper: float, moments: Sequence[float]) -> List[float]:
+    """
+    Выполняется в процессе пула
+
+    :return: активное время журналов paths между lower и каждым из моментов, ограниченным отрезком [lower, upper)
+    """
+    rows = ((max(begin, lower), min(end, upper)) for begin, end in union(source_rows(it, lower, upper) for it in paths))
+    return active_before(rows, [min(max(it, lower), upper) for it in moments])
+
+
+class ParallelJournal(MergedJournal):
+    """
+    Объединение журналов, см. merge.MergedJournal, period_stats и grouped_stat которого считаются в пуле процессов.
+    Пересекающиеся записи, как и при объединении журналов, учитываются один раз
+    """
+
+    __slots__ = ('_workers', )
+
+    def __init__(self, paths: Sequence[Path], workers: int):
+        """
+        :param workers: количество процессов
+        :raise FileNotFoundError: если одного из журналов нет
+        """
+        super().__init__(paths)
+        self._workers = workers
+
+    def _ranges_seconds(self, ranges: Sequence[Tuple[float, float]]) -> List[float]:
+        moments = [it for r in ranges for it in r]
+        parts = shards(min(moments), max(moments), self._workers * SHARDS_PER_WORKER)
+
+        res = [0.] * len(moments)
+        with ProcessPoolExecutor(max_workers=min(self._workers, len(parts))) as executor:
+            futures = [executor.submit(shard_active_before, self._paths, lower, upper, moments)
+                       for lower, upper in parts]
+            for future in futures:
+                res = [a + b for a, b in zip(res, future.result())]
+
+        return [upper - lower for lower, upper in zip(res[::2], res[1::2])]
+
+
+class ParallelDatabase(ParallelJournal):
+    """
+    База sqlite, period_stats и grouped_stat которой считаются в пуле процессов так же, как WorkStatistics:
+    пересекающиеся записи учитываются каждая отдельно. Промежутки делятся между процессами, каждый считает их
+    sql-запросами fast_stat.ranges_seconds, поэтому по записям журнала проходят только неполные дни
+    """
+
+    __slots__ = ()
+
+    def __init__(self, database: Path, workers: int):
+        """
+        :param workers: количество процессов
+        :raise FileNotFoundError: если базы нет
+        """
+        super().__init__([database], workers)
+
+    def _ranges_seconds(self, ranges: Sequence[Tuple[float, float]]) -> List[float]:
+        n = min(self._workers * SHARDS_PER_WORKER, len(ranges))
+
+        res = [0.] * len(ranges)
+        with ProcessPoolExecutor(max_workers=min(self._workers, n)) as executor:
+            futures = [executor.submit(fast_stat.ranges_seconds, self._paths[0], ranges[i::n]) for i in range(n)]
+            for i, future in enumerate(futures):
+                res[i::n] = future.result()
+
+        return res
@@ -0,0 +1,85 @@
+"""
+Записи журнала для подсчета статистики: пары (начало, конец) в секундах от начала эпохи, прочитанные запросом
+Core select без создания объектов orm и datetime. PeriodArray хранит записи в двух массивах int64 (array('q')),
+поэтому на запись приходится 16 байт, а numpy получает массивы без копирования. Записи журнала изменяются через
+orm (database.Period)
+"""
+from array import array
+from typing import *
+
+from database import Period, begin_seconds, end_seconds
+from sqlalchemy import select
+import numpy_engine
+
+CHUNK_SIZE = 1000  # записей, получаемых от курсора за раз
+
+
+def select_periods(lower: Optional[float] = None, upper: Optional[float] = None):
+    """
+    :param lower: только записи, заканчивающиеся после lower
+    :param upper: только записи, начинающиеся до upper
+    :return: запрос начал и концов записей в секундах от начала эпохи в порядке возрастания начала
+    """
+    query = select([begin_seconds, end_seconds]).where(Period.end.isnot(None))
+    if lower is not None:
+        query = query.where(end_seconds > int(lower))
+    if upper is not None:
+        query = query.where(begin_seconds < int(upper))
+
+    return query.order_by(Period.begin)
+
+
+def iter_periods(session, lower: Optional[float] = None, upper: Optional[float] = None) -> Iterator[Tuple[int, int]]:
+    """
+    Читает записи потоком, см. select_periods
+    """
+    if session.autoflush:
+        session.flush()  # как и запросы orm, учитываем еще не записанные изменения сессии
+
+    result = session.execute(select_periods(lower, upper))
+    try:
+        while True:
+            rows = result.fetchmany(CHUNK_SIZE)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        result.close()
+
+
+class PeriodArray:
+    """
+    Записи журнала в двух массивах int64 начал и концов (сек от начала эпохи), отсортированные по началу
+    """
+
+    __slots__ = ('begins', 'ends')
+
+    def __init__(self):
+        self.begins = array('q')
+        self.ends = array('q')
+
+    @staticmethod
+    def load(session, lower: Optional[float] = None, upper: Optional[float] = None) -> 'PeriodArray':
+        """
+        :return: записи журнала, пересекающиеся с промежутком [lower, upper), см. select_periods
+        """
+        res = PeriodArray()
+        begins_append, ends_append = res.begins.append, res.ends.append
+        for begin, end in iter_periods(session, lower, upper):
+            begins_append(begin)
+            ends_append(end)
+
+        return res
+
+    def to_numpy(self) -> Tuple['np.ndarray', 'np.ndarray']:
+        """
+        :return: массивы numpy начал и концов, разделяющие память с массивами записей
+        """
+        return numpy_engine.np.frombuffer(self.begins, dtype=numpy_engine.np.int64), \
+            numpy_engine.np.frombuffer(self.ends, dtype=numpy_engine.np.int64)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.begins, self.ends)
+
+    def __len__(self) -> int:
+        return len(self.begins)
@@ -0,0 +1,122 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from database import Period, new_session
+from period_array import iter_periods
+from datetime import datetime, timedelta
+from typing import *
+
+
+class PeriodIndex:
+    """
+    Индекс промежутков журнала в памяти.
+
+    Хранит отдельно отсортированные начала и концы записей журнала и префиксные суммы каждого из массивов,
+    поэтому активное время за любой период считается четырьмя бинарными поисками без обращения к бд. Как и в
+    WorkStatistics.period_stat (см. schema.clipped_sum), каждая запись обрезается по границам периода отдельно, поэтому
+    пересечения записей учитываются дважды. Значения хранятся в массивах array('d') в секундах от начала первой
+    добавленной записи, чтобы префиксные суммы не теряли точность, по 32 байта на запись.
+    """
+
+    __slots__ = ('_origin', '_begins', '_ends', '_begins_prefix', '_ends_prefix', '_last')
+
+    def __init__(self):
+        self._origin = 0.  # начало первой добавленной записи (сек от начала эпохи)
+        self._begins = array('d')  # отсортированные начала записей (сек от _origin)
+        self._ends = array('d')  # отсортированные концы записей (сек от _origin)
+        self._begins_prefix = array('d', [0.])  # _begins_prefix[i] - сумма первых i начал
+        self._ends_prefix = array('d', [0.])  # _ends_prefix[i] - сумма первых i концов
+        self._last: Optional[Tuple[float, float]] = None  # начало и конец записи с наибольшим началом (сек от _origin)
+
+    @staticmethod
+    def from_db() -> 'PeriodIndex':
+        """
+        создание индекса по всем записям журнала
+        """
+        res = PeriodIndex()
+        with new_session() as session:
+            res.extend(iter_periods(session))
+
+        return res
+
+    def extend(self, periods: Iterable[Tuple[float, float]]):
+        """
+        Добавляет в индекс записи журнала (сек от начала эпохи), обычно по возрастанию начала. Запись с тем же началом,
+        что и последняя в индексе, считается ее продолжением (демон продлевает текущую запись), пустые записи
+        пропускаются.
+        """
+        for begin_timestamp, end_timestamp in periods:
+            if end_timestamp <= begin_timestamp:
+                continue
+
+            if not self._begins:
+                self._origin = begin_timestamp
+            begin, end = begin_timestamp - self._origin, end_timestamp - self._origin
+
+            if self._last is not None and begin == self._last[0]:
+                if end > self._last[1]:
+                    _remove(self._ends, self._ends_prefix, self._last[1])
+                    _insert(self._ends, self._ends_prefix, end)
+                    self._last = begin, end
+                continue
+
+            _insert(self._begins, self._begins_prefix, begin)
+            _insert(self._ends, self._ends_prefix, end)
+            if self._last is None or begin > self._last[0]:
+                self._last = begin, end
+
+    def seconds(self, begin: float, end: float) -> float:
+        """
+        :return: активное время между begin и end (сек от начала эпохи)
+        """
+        if end <= begin:
+            return 0
+
+        return self._active_before(end) - self._active_before(begin)
+
+    def _active_before(self, moment: float) -> float:
+        """
+        :return: суммарное время записей до moment: для начавшихся записей moment - начало, из которого вычитается
+                 moment - конец для уже закончившихся
+        """
+        moment -= self._origin
+        started = bisect_left(self._begins, moment)
+        finished = bisect_left(self._ends, moment)
+        return (started - finished) * moment - self._begins_prefix[started] + self._ends_prefix[finished]
+
+    def period_stat(self, p: Period) -> timedelta:
+        """
+        :return: активное время за указанный период
+        """
+        end = p.end if p.end is not None else datetime.now()
+        assert end > p.begin
+        return timedelta(seconds=self.seconds(p.begin.timestamp(), end.timestamp()))
+
+    @property
+    def last_end(self) -> Optional[datetime]:
+        return datetime.fromtimestamp(self._ends[-1] + self._origin) if self._ends else None
+
+    def __len__(self) -> int:
+        return len(self._begins)
+
+
+def _insert(values: array, prefix: array, value: float):
+    """
+    Вставляет value в отсортированный массив values и пересчитывает префиксные суммы после него. Записи обычно
+    добавляются в конец журнала, поэтому пересчитывается лишь несколько последних сумм
+    """
+    i = bisect_right(values, value)
+    values.insert(i, value)
+    prefix.append(0.)
+    for j in range(i, len(values)):
+        prefix[j + 1] = prefix[j] + values[j]
+
+
+def _remove(values: array, prefix: array, value: float):
+    """
+    Удаляет value из отсортированного массива values и пересчитывает префиксные суммы после него
+    """
+    i = bisect_left(values, value)
+    del values[i]
+    prefix.pop()
+    for j in range(i, len(values)):
+        prefix[j + 1] = prefix[j] + values[j]
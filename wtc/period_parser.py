@@ -0,0 +1,77 @@
+import re
+from datetime import datetime, timedelta
+from typing import *
+
+_DATE_REG = re.compile(r'(?:(?:(?P<day>\d{2})\.)?(?P<month>\d{2})\.)?(?P<year>\d{4})')
+_US_LIKE_DATE_REG = re.compile(r'(?P<year>\d{4})?(?:\.(?P<month>\d{2})(?:\.(?P<day>\d{2}))?)?')
+
+
+class TimeRange(NamedTuple):
+    """
+    Промежуток времени без привязки к бд, например указанный в командной строке. Совместим с database.Period по
+    атрибутам begin и end
+    """
+    begin: datetime
+    end: Optional[datetime]  # None - до текущего момента
+
+    def __repr__(self):
+        return format_period(self.begin, self.end)
+
+
+def format_period(begin: datetime, end: Optional[datetime]) -> str:
+    end = end.strftime('%Y.%m.%d %H:%M:%S') if end else 'now'
+    return f'{begin.strftime("%Y.%m.%d %H:%M:%S")} - {end}'
+
+
+def _parse_date(date_string: str) -> Tuple[Optional[datetime], int]:
+    """
+    :param date_string: строка с единственной датой
+    :return: представление указаной даты в виде обьекта datetime и "ранг" даты, равный 0, 1(если день не указан)
+    или 2(если месяц не указан). None - текущее время.
+    """
+
+    if date_string == 'now':
+        return None, 0
+
+    m = _DATE_REG.fullmatch(date_string)
+    if not m:
+        m = _US_LIKE_DATE_REG.fullmatch(date_string)
+        if not m:
+            raise ValueError
+
+    return datetime(
+        int(m.group('year')),
+        int(m.group('month')) if m.group('month') else 1,
+        int(m.group('day')) if m.group('day') else 1
+    ), 0 if m.group('day') is not None else (1 if m.group('month') is not None else 2)
+
+
+def parse_period(s: str) -> TimeRange:
+    """
+    Разбор промежутка времени вида "01.01.2019-01.01.2020", "2019", "07.2019", "01.09.2019-now" и т.п. без обращения
+    к orm, см. database.Period.from_string
+    """
+    assert s
+
+    dates: List[Union[str, datetime]] = s.split('-')
+    if len(dates) > 2:
+        raise ValueError('неверный формат периода')
+
+    if len(dates) == 2:
+        dates = [it[0] for it in map(_parse_date, dates)]
+    else:
+        dates[0], rang = _parse_date(dates[0])
+        if rang == 0:
+            dates.append(dates[0] + timedelta(days=1))
+        elif rang == 1:
+            tmp = dates[0].month == 12
+            dates.append(datetime(dates[0].year + tmp, 1 if tmp else dates[0].month + 1, 1))
+        elif rang == 2:
+            dates.append(datetime(dates[0].year + 1, 1, 1))
+
+    if len(dates) == 2:
+        assert dates[0] is not None
+        if dates[1] is not None and dates[1] <= dates[0]:
+            raise ValueError('дата начала анализируемого промежутка времени обязана быть меньше даты конца')
+
+    return TimeRange(dates[0], dates[1] if len(dates) == 2 else None)
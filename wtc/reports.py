@@ -0,0 +1,140 @@
+from collections import deque
+from database import Period, new_session
+from datetime import datetime, timedelta
+from period_array import PeriodArray, iter_periods
+from schema import unit_begin, next_unit_begin
+import numpy_engine
+import work_statistics
+from typing import *
+
+
+def buckets(begin: datetime, end: datetime, unit: str) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    :return: границы годов, месяцев, недель или дней, пересекающихся с промежутком [begin, end).
+             Первая и последняя группы обрезаются по границам промежутка
+    """
+    bucket = unit_begin(begin, unit)
+    while bucket < end:
+        next_bucket = next_unit_begin(bucket, unit)
+        yield max(bucket, begin), min(next_bucket, end)
+        bucket = next_bucket
+
+
+def group_periods(periods: Iterable[Tuple[float, float]], begin: datetime, end: datetime,
+                  unit: str) -> Iterator[Tuple[datetime, datetime, float]]:
+    """
+    Распределяет записи журнала по годам, месяцам, неделям или дням за один проход. Каждая запись обрезается по
+    границам всех групп, с которыми пересекается (как в WorkStatistics.period_stat, пересечения записей учитываются
+    дважды). Итог по группе отдается, как только очередная запись начинается после ее конца, поэтому в памяти
+    держатся только группы, которые еще может задеть запись.
+
+    :param periods: пары (начало, конец) в секундах от начала эпохи, отсортированные по началу
+    :return: тройки (начало группы, конец группы, активное время в группе в секундах) для всех групп промежутка
+    """
+    groups = ((b, e, b.timestamp(), e.timestamp()) for b, e in buckets(begin, end, unit))
+    pending: Deque[List] = deque()  # [начало, конец, начало и конец в секундах, итог] групп, еще не отданных
+
+    for period_begin, period_end in periods:
+        # следующие записи начинаются не раньше этой, поэтому группы, закончившиеся до ее начала, уже не изменятся
+        while True:
+            if not pending:
+                group = next(groups, None)
+                if group is None:
+                    break
+                pending.append([*group, 0])
+            if pending[0][3] > period_begin:
+                break
+            group_begin, group_end, _, _, total = pending.popleft()
+            yield group_begin, group_end, total
+
+        for group in pending:
+            group[4] += max(min(period_end, group[3]) - max(period_begin, group[2]), 0)
+        while pending and pending[-1][3] < period_end:
+            group = next(groups, None)
+            if group is None:
+                break
+            pending.append([*group, max(min(period_end, group[3]) - max(period_begin, group[2]), 0)])
+
+    for group_begin, group_end, _, _, total in pending:
+        yield group_begin, group_end, total
+    for group_begin, group_end, _, _ in groups:
+        yield group_begin, group_end, 0
+
+
+def grouped_stat(p: Period, unit: str) -> Iterator[Tuple[datetime, datetime, timedelta]]:
+    """
+    :return: активное время за каждый год, месяц, неделю или день указанного периода
+    """
+    end = p.end if p.end is not None else datetime.now()
+    assert end > p.begin
+
+    with new_session() as session:
+        periods = iter_periods(session, p.begin.timestamp(), end.timestamp())
+        for group_begin, group_end, seconds in group_periods(periods, p.begin, end, unit):
+            yield group_begin, group_end, timedelta(seconds=seconds)
+
+
+def hour_begin(timestamp: float) -> datetime:
+    """
+    :return: начало часа(по местному времени), в который попадает timestamp
+    """
+    return datetime.fromtimestamp(timestamp).replace(minute=0, second=0, microsecond=0)
+
+
+def hours(begin: float, end: float) -> Iterator[Tuple[float, float, datetime]]:
+    """
+    :return: тройки (начало, конец, начало часа по местному времени) для всех часов, пересекающихся с промежутком
+             [begin, end) в секундах от начала эпохи. Первый и последний часы обрезаются по границам промежутка
+    """
+    hour = hour_begin(begin)
+    while begin < end:
+        # при переводе часов несуществующее время переводится вперед, а повторяющийся час относится к первому
+        next_hour = (hour + timedelta(hours=1)).timestamp()
+        assert next_hour > begin
+
+        yield begin, min(next_hour, end), hour
+        begin = next_hour
+        hour = hour_begin(next_hour)
+
+
+def heatmap_periods(periods: Iterable[Tuple[float, float]], begin: datetime, end: datetime) -> List[List[float]]:
+    """
+    Распределяет записи журнала по дням недели и часам за один проход
+
+    :param periods: пары (начало, конец) в секундах от начала эпохи
+    :return: матрица 7x24 активного времени в секундах, строки - дни недели начиная с понедельника, столбцы - часы
+    """
+    res = [[0.] * 24 for _ in range(7)]
+    for period_begin, period_end in periods:
+        for b, e, hour in hours(max(period_begin, begin.timestamp()), min(period_end, end.timestamp())):
+            res[hour.weekday()][hour.hour] += e - b
+
+    return res
+
+
+def heatmap(p: Period) -> List[List[float]]:
+    """
+    :return: матрица 7x24 активного времени в секундах за указанный период, строки - дни недели начиная
+             с понедельника, столбцы - часы
+    """
+    end = p.end if p.end is not None else datetime.now()
+    assert end > p.begin
+
+    with new_session() as session:
+        if not (work_statistics.USE_NUMPY and numpy_engine.available()):
+            return heatmap_periods(iter_periods(session, p.begin.timestamp(), end.timestamp()), p.begin, end)
+
+        begins, ends = PeriodArray.load(session, p.begin.timestamp(), end.timestamp()).to_numpy()
+
+    # активное время считается сразу для всех часов промежутка и затем раскладывается по ячейкам
+    np = numpy_engine.np
+    lowers, uppers, weekdays, hours_of_day = [], [], [], []
+    for b, e, hour in hours(p.begin.timestamp(), end.timestamp()):
+        lowers.append(b)
+        uppers.append(e)
+        weekdays.append(hour.weekday())
+        hours_of_day.append(hour.hour)
+
+    res = np.zeros((7, 24), dtype=np.int64)
+    np.add.at(res, (weekdays, hours_of_day), numpy_engine.bucket_totals(begins, ends, lowers, uppers))
+    return res.tolist()
@@ -0,0 +1,63 @@
+"""
+Политика хранения журнала: записи старше заданного количества дней нужны только для итогов по дням, поэтому все
+записи каждого такого дня заменяются одной записью, начинающейся в полночь и длящейся столько, сколько активного
+времени пришлось на этот день. Итоги за целые дни (сводки, period_stat, разбивка --by, статистика демона и быстрого
+пути stat) не меняются, а время внутри дня, например в stat --heatmap, для старых дней больше не сохраняется
+"""
+from datetime import datetime, date
+from typing import *
+
+
+def fold_periods(session, before: datetime) -> int:
+    """
+    Заменяет записи, закончившиеся до before, записями по дням. Дни, уже сведенные к одной записи, не изменяются.
+    Изменения не фиксируются, транзакцию завершает вызывающий код
+
+    :param session: сессия orm
+    :return: на сколько уменьшилось количество записей
+    """
+    from database import Period, begin_seconds, end_seconds
+    from database.orm import split_by_days
+    from sqlalchemy import Integer, bindparam, func
+
+    # записи не сворачиваются дальше начала первой оставляемой записи, чтобы записи дней не пересекались с ней
+    bound = int(before.timestamp())
+    kept = session.query(func.min(begin_seconds)).filter(end_seconds > bound).scalar()
+    if kept is not None:
+        bound = min(bound, kept)
+
+    seconds: Dict[date, float] = {}  # активное время дня
+    rows: Dict[date, List[Tuple[int, int]]] = {}  # записи, начавшиеся в этот день (только первые две)
+    for begin, end in session.query(begin_seconds, end_seconds) \
+            .filter(end_seconds <= bound) \
+            .order_by(Period.begin) \
+            .yield_per(1000):
+        day_rows = rows.setdefault(date.fromtimestamp(begin), [])
+        if len(day_rows) < 2:
+            day_rows.append((begin, end))
+        for day, day_seconds in split_by_days(datetime.fromtimestamp(begin), datetime.fromtimestamp(end)):
+            seconds[day] = seconds.get(day, 0) + day_seconds
+
+    ranges, folded = [], []  # границы пересчитываемых дней и их новые записи
+    for day in sorted(seconds.keys() | rows.keys()):
+        midnight = int(datetime.fromordinal(day.toordinal()).timestamp())
+        row = (midnight, midnight + round(seconds.get(day, 0)))
+        if rows.get(day) == [row]:
+            continue
+
+        next_midnight = int(datetime.fromordinal(day.toordinal() + 1).timestamp())
+        ranges.append({'lower': midnight, 'upper': next_midnight})
+        if row[1] > row[0]:
+            folded.append({'begin': row[0], 'end': row[1]})
+
+    if not ranges:
+        return 0
+
+    table = Period.__table__
+    removed = session.execute(table.delete().where((table.c.begin >= bindparam('lower', type_=Integer))
+                                                   & (table.c.begin < bindparam('upper', type_=Integer))
+                                                   & (table.c.end <= bound)), ranges).rowcount
+    if folded:
+        session.execute(table.insert(), folded)
+
+    return removed - len(folded)
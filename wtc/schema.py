@@ -0,0 +1,106 @@
+"""
+Общее для orm (database, work_statistics) и быстрого пути stat (fast_stat): версия схемы базы, имена таблиц,
+sql-выражение активного времени и границы периодов и сводок. Модуль не загружает sqlalchemy, поэтому оба пути
+считают статистику одними и теми же выражениями
+"""
+from datetime import date, datetime, timedelta
+from typing import *
+
+SCHEMA_VERSION = 2  # версия схемы базы (PRAGMA user_version), см. tools/dbv0to1.py и tools/dbv1to2.py
+PERIODS_TABLE = 'work_periods'
+DAYS_TABLE = 'work_days'
+MONTHS_TABLE = 'work_months'
+UNITS = ('year', 'month', 'week', 'day')  # единицы, по которым группируется статистика
+
+
+class SchemaVersionError(Exception):
+    """
+    Версия схемы базы не поддерживается
+    """
+
+    def __init__(self, version: int):
+        super().__init__(f'версия схемы базы {version} не поддерживается (требуется {SCHEMA_VERSION}), '
+                         f'для обновления воспользуйтесь скриптами из tools')
+
+
+def clipped_sum(lower: float, upper: Optional[float] = None) -> str:
+    """
+    :return: sql-выражение суммарного активного времени записей журнала, обрезанных по границам lower и upper
+             (сек от начала эпохи). Каждая запись обрезается отдельно, поэтому пересечения записей учитываются дважды
+    """
+    end = '"end"' if upper is None else f'min("end", {int(upper)})'
+    return f'coalesce(sum(max({end} - max("begin", {int(lower)}), 0)), 0)'
+
+
+def unit_begin(d: date, unit: str) -> datetime:
+    """
+    :return: начало года, месяца, недели или дня, в который попадает d
+    """
+    if unit == 'year':
+        return datetime(d.year, 1, 1)
+    elif unit == 'month':
+        return datetime(d.year, d.month, 1)
+    elif unit == 'week':
+        return datetime.fromordinal((d - timedelta(d.weekday())).toordinal())
+    elif unit == 'day':
+        return datetime.fromordinal(d.toordinal())
+
+    raise ValueError(f'неизвестная единица времени {unit}')
+
+
+def next_unit_begin(begin: datetime, unit: str) -> datetime:
+    """
+    :param begin: начало года, месяца, недели или дня
+    :return: начало следующего года, месяца, недели или дня
+    """
+    if unit == 'year':
+        return datetime(begin.year + 1, 1, 1)
+    elif unit == 'month':
+        tmp = begin.month == 12
+        return datetime(begin.year + tmp, 1 if tmp else begin.month + 1, 1)
+    elif unit == 'week':
+        return begin + timedelta(days=7)
+    elif unit == 'day':
+        return begin + timedelta(days=1)
+
+    raise ValueError(f'неизвестная единица времени {unit}')
+
+
+def get_ymwd_begins_timestamps() -> Tuple[float, float, float, float]:
+    """
+    :return: кортеж со временем начала текущего года, месяца, недели, дня в секундах от начала эпохи
+    """
+    today = date.today()
+    return tuple(unit_begin(today, it).timestamp() for it in UNITS)
+
+
+def full_days(begin: datetime, end: datetime) -> Optional[Tuple[datetime, datetime]]:
+    """
+    :return: начало первого и конец последнего целого дня внутри периода или None, если целых дней в нем нет
+    """
+    first_day = datetime.fromordinal(begin.toordinal())
+    if first_day < begin:
+        first_day += timedelta(days=1)
+    last_day = datetime.fromordinal(end.toordinal())
+
+    return (first_day, last_day) if first_day < last_day else None
+
+
+def rollup_ranges(first_day: date, last_day: date) -> List[Tuple[str, date, date]]:
+    """
+    Целые месяцы берутся из месячной сводки, остальные дни - из дневной
+
+    :return: непустые промежутки (единица сводки 'day' или 'month', начало, конец не включительно), из которых
+             складывается время за дни с first_day по last_day(не включительно)
+    """
+    first_month = first_day.replace(day=1)
+    if first_month < first_day:
+        first_month = (first_month + timedelta(days=31)).replace(day=1)
+    last_month = last_day.replace(day=1)
+
+    if first_month >= last_month:
+        ranges = [('day', first_day, last_day)]
+    else:
+        ranges = [('day', first_day, first_month), ('day', last_month, last_day), ('month', first_month, last_month)]
+
+    return [it for it in ranges if it[2] > it[1]]
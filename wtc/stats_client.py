@@ -0,0 +1,41 @@
+import json
+import logging
+import socket
+from pathlib import Path
+from typing import *
+
+logger = logging.getLogger('wtc.StatsClient')
+
+CLIENT_TIMEOUT = 1.  # сек, после которых клиент перестает ждать ответа и обращается к бд сам
+RELOAD_TIMEOUT = 120.  # сек, сколько ждать, пока демон заново построит статистику по журналу
+
+
+def query(path: Path, request: Dict[str, Any], timeout: float = CLIENT_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    Отправляет запрос серверу статистики демона
+
+    :return: ответ сервера или None, если демон не запущен или не смог ответить
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(json.dumps(request).encode() + b'\n')
+
+            data = b''
+            while not data.endswith(b'\n'):
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                data += chunk
+
+        response = json.loads(data)
+    except (OSError, ValueError) as e:
+        logger.debug(f'сервер статистики недоступен: {e}')
+        return None
+
+    if 'error' in response:
+        logger.warning(f'сервер статистики: {response["error"]}')
+        return None
+
+    return response
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from threading import Thread
+from typing import *
+
+from database import Period
+from reports import buckets
+from stats_client import CLIENT_TIMEOUT, query
+from work_statistics import WorkStatistics
+
+logger = logging.getLogger('wtc.StatsServer')
+
+
+class StatsServer:
+    """
+    Сервер статистики демона (можно использовать как контекстный мененджер).
+
+    Держит в памяти WorkStatistics с индексом всего журнала, который демон продлевает при каждом обновлении записи,
+    и отвечает на запросы через unix сокет. Протокол: одна строка json с запросом и одна строка json с ответом,
+    см. answer, а запрос {"query": "reload"} заново строит статистику по журналу, например после его сжатия.
+    Сервер работает в цикле asyncio в отдельном потоке рядом с циклом обновления записи демона,
+    все обращения к статистике происходят в потоке цикла (новая статистика для reload строится в пуле потоков).
+    """
+
+    __slots__ = ('_path', '_stats', '_reload', '_loop', '_thread', '_server')
+
+    def __init__(self, path: Path, stats: WorkStatistics, reload: Optional[Callable[[], WorkStatistics]] = None):
+        """
+        :param stats: статистика, построенная с индексом (см. WorkStatistics.from_db)
+        :param reload: функция, заново строящая статистику с индексом по запросу reload
+        """
+        assert stats.index is not None
+        self._path = path
+        self._stats = stats
+        self._reload = reload
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def __enter__(self) -> 'StatsServer':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        self.close()
+
+    def start(self):
+        """
+        Запускает цикл asyncio в отдельном потоке и начинает принимать запросы
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, name='stats-server', daemon=True)
+        self._thread.start()
+
+        try:
+            asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        except BaseException:
+            self._close_loop()
+            raise
+
+    def close(self):
+        """
+        Останавливает сервер и удаляет сокет
+        """
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._close_loop()
+
+        try:
+            self._path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def record(self, begin: datetime, end: datetime):
+        """
+        Учитывает записываемый демоном период, см. WorkStatistics.record
+        """
+        self._loop.call_soon_threadsafe(self._stats.record, begin.timestamp(), end.timestamp())
+
+    async def reload(self) -> Dict[str, Any]:
+        """
+        Заново строит статистику в пуле потоков цикла, чтобы на время построения сервер продолжал отвечать по прежней
+        статистике, и подменяет ее в потоке цикла. Записи, переданные демоном во время построения, учитываются после
+        него: демон передает запись целиком при каждом обновлении
+
+        :return: {"rows": количество записей индекса} или {"error": ...}, если статистика не построена
+        """
+        if self._reload is None:
+            return {'error': 'сервер не поддерживает reload'}
+
+        try:
+            stats = await asyncio.get_event_loop().run_in_executor(None, self._reload)
+        except Exception as e:
+            logger.warning(f'не удалось заново построить статистику: {e}')
+            return {'error': f'не удалось заново построить статистику: {e}'}
+
+        self._stats = stats
+        return {'rows': len(stats.index)}
+
+    async def _start(self):
+        # сокет мог остаться после аварийного завершения демона
+        if self._path.is_socket():
+            self._path.unlink()
+
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self._path))
+        os.chmod(str(self._path), 0o600)
+
+    async def _stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _close_loop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            line = await asyncio.wait_for(reader.readline(), CLIENT_TIMEOUT)
+            try:
+                request = json.loads(line)
+                if request.get('query') == 'reload':
+                    response = await self.reload()
+                else:
+                    response = answer(self._stats, request)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                response = {'error': f'неверный запрос: {e}'}
+
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def answer(stats: WorkStatistics, request: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Ответ на запрос к серверу статистики. Время передается в секундах от начала эпохи.
+
+    Запросы:
+     - {"query": "stat"} - статистика за год, месяц, неделю, день, см. WorkStatistics.to_dict
+     - {"query": "period", "begin": ..., "end": ...} - {"seconds": активное время за период}.
+       end может быть null - до текущего момента
+     - {"query": "grouped", "begin": ..., "end": ..., "unit": "day"} - {"rows": [[начало, конец, активное время]]}
+       для каждого года, месяца, недели или дня периода, см. reports.grouped_stat
+    """
+    query = request['query']
+    if query == 'stat':
+        return stats.projected(0).to_dict()  # обнуляет значения, если с последней записи сменился день
+
+    begin = float(request['begin'])
+    end = float(request['end']) if request.get('end') is not None else datetime.now().timestamp()
+    if end <= begin:
+        raise ValueError('конец периода раньше начала')
+
+    if query == 'period':
+        return {'seconds': stats.index.seconds(begin, end)}
+    elif query == 'grouped':
+        return {'rows': [
+            [group_begin.timestamp(), group_end.timestamp(),
+             stats.index.seconds(group_begin.timestamp(), group_end.timestamp())]
+            for group_begin, group_end in
+            buckets(datetime.fromtimestamp(begin), datetime.fromtimestamp(end), request['unit'])
+        ]}
+
+    raise ValueError(f'неизвестный запрос {query}')
+
+
+def _period_request(p: Period) -> Dict[str, Any]:
+    return {'begin': p.begin.timestamp(), 'end': p.end.timestamp() if p.end is not None else None}
+
+
+def remote_statistics(path: Path) -> Optional[WorkStatistics]:
+    """
+    :return: статистика за год, месяц, неделю, день от демона или None, если он недоступен
+    """
+    response = query(path, {'query': 'stat'})
+    return WorkStatistics.from_dict(response) if response is not None else None
+
+
+def remote_period_stat(path: Path, p: Period) -> Optional[timedelta]:
+    """
+    :return: активное время за период от демона или None, если он недоступен
+    """
+    response = query(path, {'query': 'period', **_period_request(p)})
+    return timedelta(seconds=response['seconds']) if response is not None else None
+
+
+def remote_grouped_stat(path: Path, p: Period, unit: str) -> Optional[List[Tuple[datetime, datetime, timedelta]]]:
+    """
+    :return: активное время за каждый год, месяц, неделю или день периода от демона или None, если он недоступен
+    """
+    response = query(path, {'query': 'grouped', 'unit': unit, **_period_request(p)})
+    if response is None:
+        return None
+
+    return [(datetime.fromtimestamp(begin), datetime.fromtimestamp(end), timedelta(seconds=seconds))
+            for begin, end, seconds in response['rows']]
@@ -0,0 +1,111 @@
+"""
+Хранилища журнала, в которые пишет демон: база sqlite(по умолчанию) или файл записей фиксированного размера,
+см. binlog. Хранилища используются как контекстные мененджеры и имеют одинаковый набор методов
+"""
+from datetime import datetime
+from pathlib import Path
+from typing import *
+
+
+class SqliteStorage:
+    """
+    Запись журнала и сводок в базу через orm
+    """
+
+    __slots__ = ('_context', '_session')
+
+    def __init__(self):
+        self._context = None
+        self._session = None
+
+    def __enter__(self) -> 'SqliteStorage':
+        from database import new_session  # не загружаем orm при импорте ради настроек демона
+
+        self._context = new_session()
+        self._session = self._context.__enter__()
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        self._context.__exit__(exc_type, exc_val, exc_tb)
+        self._context = self._session = None
+
+    def add(self, begin: datetime, end: datetime):
+        """
+        Добавляет новую запись журнала
+        """
+        from database import Period, add_to_rollups
+
+        self._session.add(Period(begin, end))
+        add_to_rollups(self._session, begin, end)
+
+    def extend(self, begin: datetime, old_end: datetime, end: datetime):
+        """
+        Продлевает запись, начавшуюся в begin, с old_end до end
+        """
+        from database import Period, add_to_rollups
+
+        self._session.query(Period).filter(Period.begin == begin).update({'end': end})
+        add_to_rollups(self._session, old_end, end)
+
+    def restore(self, begin: datetime, end: datetime):
+        """
+        Добавляет запись или продлевает существующую запись с тем же началом, если она заканчивается раньше end
+        """
+        from database import Period, add_to_rollups
+
+        period = self._session.query(Period).filter(Period.begin == begin).one_or_none()
+        if period is None:
+            self.add(begin, end)
+        elif period.end < end:
+            add_to_rollups(self._session, period.end, end)
+            period.end = end
+
+    def commit(self):
+        self._session.commit()
+
+
+class BinlogStorage:
+    """
+    Запись журнала в файл записей фиксированного размера. Сводки не ведутся, обновление текущей записи - перезапись
+    ее конца на месте
+    """
+
+    __slots__ = ('_path', '_writer')
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._writer = None
+
+    def __enter__(self) -> 'BinlogStorage':
+        from binlog import BinLogWriter
+
+        self._writer = BinLogWriter(self._path).__enter__()
+        return self
+
+    def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        self._writer.__exit__(exc_type, exc_val, exc_tb)
+        self._writer = None
+
+    def add(self, begin: datetime, end: datetime):
+        self._writer.append(begin, end)
+
+    def extend(self, begin: datetime, old_end: datetime, end: datetime):
+        assert self._writer.last is not None and self._writer.last[0] == int(begin.timestamp())
+        self._writer.update_last(end)
+
+    def restore(self, begin: datetime, end: datetime):
+        last = self._writer.last
+        if last is None or last[1] <= begin.timestamp():
+            self.add(begin, end)
+        elif last[0] == int(begin.timestamp()) and last[1] < end.timestamp():
+            self._writer.update_last(end)
+
+    def commit(self):
+        pass  # изменения записываются сразу
+
+
+def open_storage(binlog: Optional[Path] = None) -> Union[SqliteStorage, BinlogStorage]:
+    """
+    :param binlog: файл журнала, если журнал ведется не в базе sqlite
+    """
+    return BinlogStorage(binlog) if binlog is not None else SqliteStorage()
@@ -1,13 +1,33 @@
+import json
 import logging
-from database import Period, new_session
+import os
+from copy import copy
+from database import Period, DayRollup, MonthRollup, new_session, rollups_available, database_identity, end_seconds, \
+    SCHEMA_VERSION
+from period_array import PeriodArray, iter_periods
+from period_index import PeriodIndex
+from schema import get_ymwd_begins_timestamps, clipped_sum, full_days, rollup_ranges
+import heartbeat
+import metrics
+import numpy_engine
+from sqlalchemy import Integer, func, literal_column
 from datetime import datetime, date, timedelta
+from pathlib import Path
 from typing import *
 
 logger = logging.getLogger('wtc.WorkStatistics')
 
+USE_NUMPY = False  # использовать ли векторизованный подсчет, если установлен numpy
+HEARTBEAT_FILE: Optional[Path] = None  # файл с еще не сброшенным демоном в базу текущим периодом
+
+UPDATE_SECONDS = metrics.histogram('wtc_statistics_update_seconds', 'Длительность WorkStatistics.update')
+FROM_DB_SECONDS = metrics.histogram('wtc_statistics_from_db_seconds', 'Длительность WorkStatistics.from_db')
+ROWS_SCANNED = metrics.counter('wtc_statistics_rows_scanned_total',
+                               'Записи журнала, обработанные при подсчете статистики')
+
 
 class WorkStatistics:
-    __slots__ = ('_cache_ymwd', '_year', '_month', '_week', '_day', '_last_update')
+    __slots__ = ('_cache_ymwd', '_year', '_month', '_week', '_day', '_last_update', '_index')
 
     def __init__(self):
         self._last_update: Optional[datetime] = None  # время конца последнего учтеного периода
@@ -16,50 +36,100 @@ class WorkStatistics:
         self._month: Optional[int] = None  # количество отработанного времени в месяце (сек)
         self._week: Optional[int] = None  # количество отработанного времени в неделе (сек)
         self._day: Optional[int] = None  # количество отработанного времени в дне (сек)
+        self._index: Optional[PeriodIndex] = None  # индекс всего журнала в памяти
 
     @staticmethod
-    def from_db() -> 'WorkStatistics':
+    @FROM_DB_SECONDS.time()
+    def from_db(index: bool = False, snapshot: Optional[Path] = None) -> 'WorkStatistics':
         """
         создание экземпляра WorkStatistics с кжшированными данными из базы
+
+        :param index: построить ли индекс всего журнала для ответа на запросы за произвольные периоды без бд.
+                      Индекс дополняется при каждом update
+        :param snapshot: файл снимка рассчитанных значений. Если снимок действителен, из базы подгружаются только
+                         записи, появившиеся после его создания. После расчета снимок перезаписывается
         """
-        year = 0
-        month = 0
-        week = 0
-        day = 0
-        last_update: Optional[datetime] = None
-        y, m, w, d = get_ymwd_begins_timestamps()
+        res = _load_snapshot(snapshot) if snapshot is not None else None
+        if res is not None:
+            res.update()
+        else:
+            res = _scan_db()
 
-        # кэшируем данные за день, месяц, год
-        with new_session() as session:
-            for period in session.query(Period) \
-                    .filter(Period.end > datetime(datetime.now().year, 1, 1).timestamp()) \
-                    .order_by(Period.begin).all():
-                assert period.end > period.begin
-
-                begin_timestamp = period.begin.timestamp()
-                end_timestamp = period.end.timestamp()
-                assert end_timestamp <= datetime.now().timestamp()
-                assert last_update is None or last_update <= period.begin
-
-                last_update = period.end
-                year += max(end_timestamp - max(begin_timestamp, y), 0)
-                month += max(end_timestamp - max(begin_timestamp, m), 0)
-                week += max(end_timestamp - max(begin_timestamp, w), 0)
-                day += max(end_timestamp - max(begin_timestamp, d), 0)
+        if index:
+            res._index = PeriodIndex.from_db()
+            ROWS_SCANNED.inc(len(res._index))
+        if snapshot is not None:
+            res.save_snapshot(snapshot)
 
+        return res
+
+    def save_snapshot(self, path: Path):
+        """
+        Сохраняет рассчитанные значения за год, месяц, неделю, день в файл снимка
+        """
+        if not self._cache_ymwd or self._last_update is None:
+            return
+
+        data = {'key': _snapshot_key(), **self.to_dict()}
+
+        tmp = path.with_name(path.name + '.tmp')
+        try:
+            with tmp.open('w') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)  # чтобы читатели не увидели недописанный снимок
+        except OSError as e:
+            logger.warning(f'не удалось сохранить снимок статистики: {e}')
+
+    def to_dict(self) -> Dict[str, float]:
+        """
+        :return: рассчитанные значения за год, месяц, неделю, день (сек) и время последнего обновления
+                 (сек от начала эпохи или None, если в этом году записей нет), см. from_dict
+        """
+        assert self._cache_ymwd
+        return {
+            'last_update': self._last_update.timestamp() if self._last_update is not None else None,
+            'year': self._year,
+            'month': self._month,
+            'week': self._week,
+            'day': self._day
+        }
+
+    @staticmethod
+    def from_dict(data: Dict[str, float]) -> 'WorkStatistics':
+        """
+        создание экземпляра WorkStatistics из значений, полученных через to_dict
+        """
         res = WorkStatistics()
-        res._last_update = last_update
+        res._last_update = datetime.fromtimestamp(data['last_update']) if data['last_update'] is not None else None
+        res._year, res._month, res._week, res._day = data['year'], data['month'], data['week'], data['day']
         res._cache_ymwd = True
-        res._year = year
-        res._month = month
-        res._week = week
-        res._day = day
+        return res
+
+    @staticmethod
+    def from_periods(periods: Iterable[Tuple[float, float]], index: bool = False) -> 'WorkStatistics':
+        """
+        создание экземпляра WorkStatistics по записям журнала без обращения к бд, например по журналу binlog
+
+        :param periods: пары (начало, конец) в секундах от начала эпохи, отсортированные по началу
+        :param index: построить ли индекс переданных записей, см. from_db
+        """
+        res = WorkStatistics.from_dict({'last_update': None, 'year': 0, 'month': 0, 'week': 0, 'day': 0})
+        if index:
+            res._index = PeriodIndex()
+
+        rows = 0
+        for rows, (begin, end) in enumerate(periods, 1):
+            res.record(begin, end)
+        ROWS_SCANNED.inc(rows)
 
         return res
 
     @staticmethod
     def period_stat(p: Period) -> timedelta:
         """
+        Целые дни внутри периода берутся из сводок, записи журнала обрабатываются только для неполных первого и
+        последнего дней
+
         :return: активное время за указанный период
         """
         if p.end is None:
@@ -67,15 +137,62 @@ class WorkStatistics:
 
         assert p.end > p.begin
         with new_session() as session:
-            return timedelta(seconds=sum(
-                min(p.end, it.end).timestamp() - max(p.begin, it.begin).timestamp()
-                if p.end is not None
-                else it.end.timestamp() - max(p.begin, it.begin).timestamp()
-                for it in session.query(Period)
-                    .filter((Period.end > p.begin) & (p.end > Period.begin))
-                    .order_by(Period.begin).all()
-            ))
+            if not rollups_available():
+                return timedelta(seconds=_raw_period_seconds(session, p.begin, p.end))
+
+            days = full_days(p.begin, p.end)
+            if days is None:
+                return timedelta(seconds=_raw_period_seconds(session, p.begin, p.end))
+
+            first_day, last_day = days
+            return timedelta(seconds=_raw_period_seconds(session, p.begin, first_day)
+                             + _rollup_seconds(session, first_day.date(), last_day.date())
+                             + _raw_period_seconds(session, last_day, p.end))
+
+    @staticmethod
+    def period_stats(periods: Iterable[Period]) -> List[timedelta]:
+        """
+        Считает активное время сразу для нескольких периодов за один отсортированный проход по журналу
+
+        :return: активное время за каждый из периодов в порядке их передачи
+        """
+        now = datetime.now()
+        ranges = [(p.begin.timestamp(), (p.end if p.end is not None else now).timestamp()) for p in periods]
+        if not ranges:
+            return []
+
+        assert all(end > begin for begin, end in ranges)
+        lower = min(it[0] for it in ranges)
+        upper = max(it[1] for it in ranges)
+
+        if _numpy_enabled():
+            with new_session() as session:
+                begins, ends = PeriodArray.load(session, lower, upper).to_numpy()
+
+            totals = numpy_engine.bucket_totals(begins, ends, [it[0] for it in ranges], [it[1] for it in ranges])
+            return [timedelta(seconds=int(it)) for it in totals]
 
+        totals = [0.] * len(ranges)
+        order = sorted(range(len(ranges)), key=lambda i: ranges[i][0])  # индексы периодов по возрастанию начала
+        next_range = 0
+        active: List[int] = []  # периоды, которые могут пересекаться с текущей записью
+
+        with new_session() as session:
+            for begin, end in iter_periods(session, lower, upper):
+                while next_range < len(order) and ranges[order[next_range]][0] < end:
+                    active.append(order[next_range])
+                    next_range += 1
+
+                # записи отсортированы, поэтому закончившиеся до начала текущей записи периоды больше не нужны
+                active = [i for i in active if ranges[i][1] > begin]
+
+                for i in active:
+                    range_begin, range_end = ranges[i]
+                    totals[i] += max(min(end, range_end) - max(begin, range_begin), 0)
+
+        return [timedelta(seconds=it) for it in totals]
+
+    @UPDATE_SECONDS.time()
     def update(self):
         """
         подгружает при необходимости новые данные из базы и обновляет изначально вычесленные значения если они были
@@ -88,36 +205,84 @@ class WorkStatistics:
         y, m, w, d = get_ymwd_begins_timestamps()  # получаем время начала текущего года, месяца, недели, дня
         today = datetime.fromtimestamp(d)
 
-        # обнуляем данные о времени в прошлом году, месяце, ...
-        if today.date() != self._last_update.date():
-            self._day = 0
+        _reset_outdated(self, today)
 
-            if today.year != self._last_update.year:
-                self._year = 0
-                self._month = 0
-            elif today.month != self._last_update.month:
-                self._month = 0
+        last_update = int(self._last_update.timestamp())
+        with new_session() as session:
+            if self._index is not None:
+                self._index.extend(iter_periods(session, last_update))
 
-            # проверяем изменилась ли неделя
-            if today.timestamp() - self._last_update.timestamp() > 60*60*24*7\
-                    or today.weekday() < self._last_update.weekday():
-                self._week = 0
+            # having отсекает строку агрегатов, если новых записей нет
+            for last_end, rows, year, month, week, day in session.query(
+                        func.max(end_seconds),
+                        func.count(),
+                        *(_clipped_sum(max(it, last_update)) for it in (y, m, w, d))
+                    ) \
+                    .filter(end_seconds > last_update) \
+                    .having(func.count() > 0):
+                assert last_end < datetime.now().timestamp()
+                ROWS_SCANNED.inc(rows)
 
-        with new_session() as session:
-            for period in session.query(Period) \
-                    .filter(Period.end > self._last_update) \
-                    .order_by(Period.begin).all():
-                period.begin = max(period.begin, self._last_update)
-                begin_timestamp = period.begin.timestamp()
-                end_timestamp = period.end.timestamp()
-                assert end_timestamp < datetime.now().timestamp()
-                assert self._last_update <= period.begin
-
-                self._last_update = period.end
-                self._year += max(end_timestamp - max(begin_timestamp, y), 0)
-                self._month += max(end_timestamp - max(begin_timestamp, m), 0)
-                self._week += max(end_timestamp - max(begin_timestamp, w), 0)
-                self._day += max(end_timestamp - max(begin_timestamp, d), 0)
+                self._last_update = datetime.fromtimestamp(last_end)
+                self._year += year
+                self._month += month
+                self._week += week
+                self._day += day
+
+        self.update_from_heartbeat()
+
+    def projected(self, heartbeat: float) -> 'WorkStatistics':
+        """
+        Оценка статистики на текущий момент без обращения к бд
+
+        :param heartbeat: если последний учтенный период обновлялся не позднее heartbeat секунд назад, считается,
+                          что демон продолжает его запись и он длится до сих пор
+        :return: копия статистики, продленная до текущего момента
+        """
+        res = copy(self)
+        if not self._cache_ymwd or self._last_update is None:
+            return res
+
+        y, m, w, d = get_ymwd_begins_timestamps()
+        _reset_outdated(res, datetime.fromtimestamp(d))
+
+        now = datetime.now()
+        if 0 < (now - self._last_update).total_seconds() <= heartbeat:
+            _extend(res, now.timestamp())
+
+        return res
+
+    def update_from_heartbeat(self):
+        """
+        учитывает текущий период, еще не сброшенный демоном в базу (см. daemon.FLUSH_DELAY), без обращения к бд
+        """
+        if HEARTBEAT_FILE is None:
+            return
+
+        pending = heartbeat.read(HEARTBEAT_FILE)
+        if pending is not None:
+            self.record(*pending)
+
+    def record(self, begin: float, end: float):
+        """
+        учитывает период журнала (сек от начала эпохи) без обращения к бд. Используется демоном для записываемого им
+        периода: период с тем же началом, что и последний учтенный, считается его продолжением
+        """
+        if not self._cache_ymwd or self._last_update is not None and end <= self._last_update.timestamp():
+            return
+
+        if self._index is not None:
+            self._index.extend(((begin, end), ))
+
+        if self._last_update is None:
+            self._last_update = datetime.fromtimestamp(begin)
+
+        _reset_outdated(self, datetime.fromtimestamp(get_ymwd_begins_timestamps()[3]))
+        _extend(self, end, begin)
+
+    @property
+    def index(self) -> Optional[PeriodIndex]:
+        return self._index
 
     @property
     def year(self) -> timedelta:
@@ -152,12 +317,229 @@ class WorkStatistics:
         return self.period_stat(Period(datetime(now.year, now.month, now.day), now))
 
 
-def get_ymwd_begins_timestamps() -> Tuple[float, float, float, float]:
+class RangeStatistics:
     """
-    :return: кортеж со временем начала текущего года, месяца, недели, дня в секундах от начала эпохи
+    Активное время за произвольный период с возможностью подгружать из базы только новые записи
     """
-    today = date.today()
-    return datetime(today.year, 1, 1).timestamp(), \
-        datetime(today.year, today.month, 1).timestamp(), \
-        datetime.fromordinal((today - timedelta(today.weekday())).toordinal()).timestamp(), \
-        datetime.fromordinal(today.toordinal()).timestamp()
+
+    __slots__ = ('_period', '_total', '_last_update')
+
+    def __init__(self, p: Period):
+        self._period = p
+        self._total: float = 0  # активное время за период до момента _last_update (сек)
+        self._last_update: Optional[int] = None  # время конца последней учтенной записи (сек от начала эпохи)
+
+    @staticmethod
+    def from_db(p: Period) -> 'RangeStatistics':
+        """
+        создание экземпляра RangeStatistics с подсчитанным по базе временем
+        """
+        res = RangeStatistics(p)
+        with new_session() as session:
+            res._last_update = session.query(func.max(end_seconds)).scalar()
+
+        if res._last_update is not None:
+            # время считается только до последней записи, более новые будут учтены в update
+            end = datetime.fromtimestamp(res._last_update)
+            if p.end is not None:
+                end = min(end, p.end)
+            if end > p.begin:
+                res._total = WorkStatistics.period_stat(Period(p.begin, end)).total_seconds()
+
+        return res
+
+    @UPDATE_SECONDS.time()
+    def update(self):
+        """
+        подгружает записи, появившиеся после последнего обновления, и добавляет приходящееся на период время
+        """
+        last_update = self._last_update or 0
+        lower = max(last_update, self._period.begin.timestamp())
+        upper = self._period.end.timestamp() if self._period.end is not None else None
+
+        with new_session() as session:
+            for last_end, seconds in session.query(func.max(end_seconds), _clipped_sum(lower, upper)) \
+                    .filter(end_seconds > last_update) \
+                    .having(func.count() > 0):
+                self._last_update = last_end
+                self._total += seconds
+
+        self.update_from_heartbeat()
+
+    def update_from_heartbeat(self):
+        """
+        учитывает текущий период, еще не сброшенный демоном в базу, без обращения к бд
+        """
+        pending = heartbeat.read(HEARTBEAT_FILE) if HEARTBEAT_FILE is not None else None
+        if pending is None or pending[1] <= (self._last_update or 0):
+            return
+
+        begin, end = pending
+        lower = max(begin, self._last_update or 0, self._period.begin.timestamp())
+        upper = min(end, self._period.end.timestamp()) if self._period.end is not None else end
+        self._total += max(upper - lower, 0)
+        self._last_update = end
+
+    def projected(self, heartbeat: float) -> timedelta:
+        """
+        Оценка активного времени за период на текущий момент без обращения к бд, см. WorkStatistics.projected
+        """
+        if self._last_update is None:
+            return self.total
+
+        now = datetime.now().timestamp()
+        if not 0 < now - self._last_update <= heartbeat:
+            return self.total
+
+        upper = min(now, self._period.end.timestamp()) if self._period.end is not None else now
+        return timedelta(seconds=self._total + max(upper - max(self._last_update, self._period.begin.timestamp()), 0))
+
+    @property
+    def period(self) -> Period:
+        return self._period
+
+    @property
+    def total(self) -> timedelta:
+        return timedelta(seconds=self._total)
+
+
+def _extend(stats: WorkStatistics, end: float, begin: Optional[float] = None):
+    """
+    Добавляет к статистике активное время с момента последнего обновления (или с begin, если он позже) до end
+    """
+    y, m, w, d = get_ymwd_begins_timestamps()
+    lower = stats._last_update.timestamp()
+    if begin is not None:
+        lower = max(lower, begin)
+
+    stats._year += max(end - max(lower, y), 0)
+    stats._month += max(end - max(lower, m), 0)
+    stats._week += max(end - max(lower, w), 0)
+    stats._day += max(end - max(lower, d), 0)
+    stats._last_update = datetime.fromtimestamp(end)
+
+
+def _reset_outdated(stats: WorkStatistics, today: datetime):
+    """
+    Обнуляет данные о времени в прошлом году, месяце, неделе, дне, если с момента последнего обновления они сменились
+    """
+    if today.date() == stats._last_update.date():
+        return
+
+    stats._day = 0
+
+    if today.year != stats._last_update.year:
+        stats._year = 0
+        stats._month = 0
+    elif today.month != stats._last_update.month:
+        stats._month = 0
+
+    # проверяем изменилась ли неделя
+    if today.timestamp() - stats._last_update.timestamp() > 60*60*24*7\
+            or today.weekday() < stats._last_update.weekday():
+        stats._week = 0
+
+
+def _scan_db() -> WorkStatistics:
+    """
+    рассчет значений за год, месяц, неделю, день по всем записям текущего года
+    """
+    y, m, w, d = get_ymwd_begins_timestamps()
+
+    # кэшируем данные за день, месяц, год
+    with new_session() as session:
+        if _numpy_enabled():
+            begins, ends = PeriodArray.load(session, y).to_numpy()
+            last_end = int(ends.max()) if len(ends) else None
+            rows = len(ends)
+            year, month, week, day = numpy_engine.clipped_sums(begins, ends, (y, m, w, d))
+        else:
+            last_end, rows, year, month, week, day = session.query(
+                func.max(end_seconds),
+                func.count(),
+                *(_clipped_sum(it) for it in (y, m, w, d))
+            ).filter(end_seconds > y).one()
+
+    ROWS_SCANNED.inc(rows)
+
+    assert last_end is None or last_end <= datetime.now().timestamp()
+    last_update = datetime.fromtimestamp(last_end) if last_end is not None else None
+
+    res = WorkStatistics()
+    res._last_update = last_update
+    res._cache_ymwd = True
+    res._year = year
+    res._month = month
+    res._week = week
+    res._day = day
+
+    return res
+
+
+def _snapshot_key() -> Dict[str, Any]:
+    """
+    :return: данные, при изменении которых снимок становится недействительным
+    """
+    identity = database_identity()
+    return {
+        'schema': SCHEMA_VERSION,
+        'database': list(identity) if identity else None,
+        'boundaries': list(get_ymwd_begins_timestamps())
+    }
+
+
+def _load_snapshot(path: Path) -> Optional[WorkStatistics]:
+    """
+    :return: экземпляр WorkStatistics, восстановленный из снимка, или None если снимок отсутствует или устарел
+    """
+    try:
+        with path.open() as f:
+            data = json.load(f)
+
+        if data['key'] != _snapshot_key():
+            logger.info('снимок статистики устарел')
+            return None
+
+        return WorkStatistics.from_dict(data)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f'не удалось прочитать снимок статистики: {e}')
+        return None
+
+
+def _numpy_enabled() -> bool:
+    return USE_NUMPY and numpy_engine.available()
+
+
+def _clipped_sum(lower: float, upper: Optional[float] = None):
+    """
+    :return: sql-выражение суммарного активного времени записей журнала, обрезанных по границам lower и upper
+             (сек от начала эпохи), см. schema.clipped_sum
+    """
+    return literal_column(clipped_sum(lower, upper), Integer)
+
+
+def _raw_period_seconds(session, begin: datetime, end: datetime) -> int:
+    """
+    :return: активное время между begin и end, посчитанное по записям журнала
+    """
+    if end <= begin:
+        return 0
+
+    return session.query(_clipped_sum(begin.timestamp(), end.timestamp())) \
+        .filter((Period.end > begin) & (end > Period.begin)).scalar()
+
+
+def _rollup_seconds(session, first_day: date, last_day: date) -> float:
+    """
+    :return: активное время за дни с first_day по last_day(не включительно), посчитанное по сводкам,
+             см. schema.rollup_ranges
+    """
+    res = 0
+    for unit, begin, end in rollup_ranges(first_day, last_day):
+        column, seconds = (DayRollup.day, DayRollup.seconds) if unit == 'day' else \
+            (MonthRollup.month, MonthRollup.seconds)
+        res += session.query(func.coalesce(func.sum(seconds), 0)).filter((column >= begin) & (column < end)).scalar()
+
+    return res
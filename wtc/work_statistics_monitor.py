@@ -1,11 +1,13 @@
-import curses
+from pathlib import Path
 from typing import *
-from work_statistics import WorkStatistics
+from database import Period
+from fast_stat import format_statistics
+from work_statistics import WorkStatistics, RangeStatistics
 
 
-class WorkStatisticsMonitor:
+class Monitor:
     """
-    Основной класс для вывода статистики.
+    Базовый класс для вывода статистики.
 
     Имеет 2 режима работы:
      - вывод информации в stdout
@@ -13,49 +15,127 @@ class WorkStatisticsMonitor:
        (используется как контекстный мененджер)
     """
 
-    __slots__ = ('_stats', '_scr', '_template')
+    __slots__ = ('_scr', '_heartbeat', '_lines')
 
-    def __init__(self):
-        self._stats = WorkStatistics.from_db()
-        self._template = \
-            'в этом году: {year_hours}h\n' \
-            'в этом месяце: {month_hours}h\n' \
-            'на этой неделе: {week_hours}h\n' \
-            'сегодня: {day_hours}h'
+    def __init__(self, heartbeat: Optional[float] = None):
+        """
+        :param heartbeat: максимальная пауза между обновлениями записи демоном (сек). Если указана, в режиме
+                          curses текущий период продлевается на экране каждую секунду без обращения к бд
+        """
+        self._heartbeat = heartbeat
+        self._lines: List[str] = []  # строки, выведенные на экран при последней отрисовке
         self._scr = None
 
-    def __enter__(self) -> 'WorkStatisticsMonitor':
-        self._scr: curses = curses.initscr()
+    def __enter__(self) -> 'Monitor':
+        import curses
+
+        self._scr = curses.initscr()
         curses.noecho()
         curses.curs_set(False)  # делаем курсор невидимым
         return self
 
     def __exit__(self, exc_type: type, exc_val: Exception, exc_tb):
+        import curses
+
         curses.endwin()
 
     def print_statistic(self):
         if self._scr:
             self._draw()
         else:
-            print(self._template.format(**self._work_statistics_dict()))
+            print('\n'.join(self._render()))
 
     def update(self):
         """
         Обновить данные на мониторе в соответствие с новыцми данными в бд
         """
-        self._stats.update()
+        raise NotImplementedError
+
+    def tick(self):
+        """
+        Обновить данные на мониторе без обращения к бд, продлив текущий период до настоящего момента
+        """
         self._draw()
 
+    def _render(self) -> List[str]:
+        """
+        :return: строки для вывода на экран
+        """
+        raise NotImplementedError
+
     def _draw(self):
-        for n, line in enumerate(self._template.format(**self._work_statistics_dict()).split('\n')):
-            self._scr.addstr(n, 0, line)
+        """
+        Перерисовывает только изменившиеся строки
+        """
+        lines = self._render()
+
+        for n, line in enumerate(lines):
+            if n >= len(self._lines) or self._lines[n] != line:
+                self._scr.addstr(n, 0, line)
+                self._scr.clrtoeol()
+
+        self._lines = lines
         self._scr.refresh()
-        self._scr.clear()
-
-    def _work_statistics_dict(self) -> Dict[str, str]:
-        return {
-            'year_hours': f'{self._stats.year.total_seconds() / (60*60):.1f}',
-            'month_hours': f'{self._stats.month.total_seconds() / (60*60):.1f}',
-            'week_hours': f'{self._stats.week.total_seconds() / (60*60):.1f}',
-            'day_hours': f'{self._stats.day.total_seconds() / (60*60):.1f}'
-        }
+
+
+class WorkStatisticsMonitor(Monitor):
+    """
+    Вывод статистики за год, месяц, неделю и день
+    """
+
+    __slots__ = ('_stats', )
+
+    def __init__(self, snapshot: Optional[Path] = None, heartbeat: Optional[float] = None,
+                 stats: Optional[WorkStatistics] = None):
+        """
+        :param snapshot: файл снимка статистики, см. WorkStatistics.from_db
+        :param stats: уже рассчитанная статистика(например, полученная от демона), тогда бд не используется
+        """
+        super().__init__(heartbeat)
+        self._stats = stats if stats is not None else WorkStatistics.from_db(snapshot=snapshot)
+
+    def update(self):
+        self._stats.update()
+        self._draw()
+
+    def tick(self):
+        self._stats.update_from_heartbeat()
+        self._draw()
+
+    def _render(self) -> List[str]:
+        stats = self._stats.projected(self._heartbeat) if self._scr and self._heartbeat else self._stats
+        return format_statistics(*(it.total_seconds() for it in (stats.year, stats.month, stats.week, stats.day)))
+
+
+class DashboardMonitor(Monitor):
+    """
+    Вывод статистики за несколько произвольных периодов. При обновлении из бд подгружаются только новые записи
+    """
+
+    __slots__ = ('_ranges', )
+
+    def __init__(self, periods: Sequence[Tuple[str, Period]], heartbeat: Optional[float] = None):
+        """
+        :param periods: пары (подпись, период)
+        """
+        super().__init__(heartbeat)
+        self._ranges = [(title, RangeStatistics.from_db(p)) for title, p in periods]
+
+    def update(self):
+        for _, stats in self._ranges:
+            stats.update()
+        self._draw()
+
+    def tick(self):
+        for _, stats in self._ranges:
+            stats.update_from_heartbeat()
+        self._draw()
+
+    def _render(self) -> List[str]:
+        width = max((len(title) for title, _ in self._ranges), default=0)
+        lines = []
+        for title, stats in self._ranges:
+            total = stats.projected(self._heartbeat) if self._scr and self._heartbeat else stats.total
+            lines.append(f'{title + ":":<{width + 1}} {total.total_seconds() / 3600:.1f}h')
+
+        return lines
@@ -1,16 +1,29 @@
 from pathlib import Path
-from typing import Callable
+from typing import *
 import logging
 
-from work_statistics_monitor import WorkStatisticsMonitor
+from period_parser import parse_period
+from schema import SchemaVersionError
 import daemon
 
 APP_ROOT: Path = Path(__file__).absolute().parent.parent
-DATABASE = 'sqlite:///' + str(APP_ROOT / 'stats.sqlite')
+DATABASE_FILE = APP_ROOT / 'stats.sqlite'
+DATABASE = 'sqlite:///' + str(DATABASE_FILE)
 CONFIGFILE = APP_ROOT / 'config.ini'
+SNAPSHOT_FILE = APP_ROOT / 'stats.snapshot'
+HEARTBEAT_FILE = APP_ROOT / 'stats.heartbeat'
+SOCKET_FILE = APP_ROOT / 'stats.sock'
+BINLOG_FILE = APP_ROOT / 'stats.binlog'
 LOGS_DIR = APP_ROOT / 'logs'
 VERSION = 'v1.1'
 STATISTIC_UPDATE_DELAY = 10
+NUMPY_ENGINE = False  # использовать ли numpy для подсчета статистики, см. work_statistics.USE_NUMPY
+STORAGE = 'sqlite'  # где ведется журнал: sqlite - база DATABASE_FILE, binlog - файл BINLOG_FILE, см. storage
+COMPACT_GAP = 60  # наибольший промежуток между записями, объединяемыми командой compact (сек), см. compaction
+DASHBOARD: List[str] = []  # периоды, выводимые командой stat --dashboard
+SOURCES: List[Path] = []  # журналы нескольких компьютеров, объединяемые командой stat --db, см. merge
+WORKERS = 1  # процессов для подсчета stat --by и --batch, больше 1 - параллельный подсчет, см. parallel
+MONITOR_TICK = 1  # период обновления счетчиков на экране без обращения к бд (сек)
 logger: logging.Logger
 main: Callable
 
@@ -23,25 +36,333 @@ def print_info():
     print('Author: MAndrey99')
 
 
+def journal_file() -> Path:
+    """
+    :return: файл, в котором ведется журнал
+    """
+    return BINLOG_FILE if STORAGE == 'binlog' else DATABASE_FILE
+
+
+def open_journal():
+    """
+    :return: журнал, читаемый без orm и поддерживающий period_stats, grouped_stat и rows: объединение журналов
+             SOURCES, журнал binlog или None, если журнал ведется в базе sqlite
+    """
+    if SOURCES:
+        from merge import MergedJournal
+        return MergedJournal(SOURCES)
+
+    if STORAGE == 'binlog':
+        from binlog import BinLog
+        return BinLog(BINLOG_FILE, NUMPY_ENGINE)
+
+    return None
+
+
+def report_journal():
+    """
+    :return: журнал для stat --by и --batch: при WORKERS > 1 - журнал, считающийся в пуле процессов так же, как
+             без него, иначе см. open_journal
+    """
+    if WORKERS > 1:
+        from parallel import ParallelJournal, ParallelDatabase
+        if SOURCES or STORAGE == 'binlog':
+            return ParallelJournal(SOURCES or [journal_file()], WORKERS)
+        return ParallelDatabase(DATABASE_FILE, WORKERS)
+
+    return open_journal()
+
+
 def print_statistics():
     """
-    Вывод статистики за год, месяц, неделю, день
+    Вывод статистики за год, месяц, неделю, день. Статистика запрашивается у демона, а если он недоступен -
+    считается по бд без загрузки orm
+    """
+    import fast_stat
+
+    if SOURCES:
+        from datetime import datetime
+        from period_parser import TimeRange
+        from schema import get_ymwd_begins_timestamps
+
+        with open_journal() as journal:
+            totals = [it.total_seconds() for it in journal.period_stats(
+                TimeRange(datetime.fromtimestamp(it), None) for it in get_ymwd_begins_timestamps()
+            )]
+    else:
+        totals = fast_stat.work_statistics(journal_file(), SOCKET_FILE, HEARTBEAT_FILE)
+
+    print('\n'.join(fast_stat.format_statistics(*totals)))
+
+
+def print_period_statistics(period):
+    """
+    Вывод статистики за указанный промежуток времени. Статистика запрашивается у демона, а если он недоступен -
+    считается по бд без загрузки orm
+    """
+    import fast_stat
+
+    if SOURCES:
+        with open_journal() as journal:
+            seconds = journal.period_stat(period).total_seconds()
+    else:
+        seconds = fast_stat.period_seconds(journal_file(), period.begin, period.end, SOCKET_FILE, HEARTBEAT_FILE)
+
+    print(f'{seconds / 3600:.1f}h')
+
+
+def print_batch_statistics():
+    """
+    Вывод статистики за промежутки времени, перечисленные построчно в stdin. Для каждого промежутка выводится
+    отдельная строка
+    """
+    from sys import stdin
+
+    periods = []
+    for n, line in enumerate(stdin, 1):
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            periods.append(parse_period(line))
+        except ValueError:
+            logger.error(f'строка {n}: неверный формат периода "{line}"')
+            return
+
+    journal = report_journal()
+    if journal is not None:
+        with journal:
+            stats = journal.period_stats(periods)
+    else:
+        from work_statistics import WorkStatistics
+        stats = WorkStatistics.period_stats(periods)
+
+    for it in stats:
+        print(f'{it.total_seconds() / 3600:.1f}h')
+
+
+def print_grouped_statistics(period, unit: str, as_csv: bool):
+    """
+    Вывод статистики за указанный промежуток времени с разбивкой по годам, месяцам, неделям или дням
+    в виде таблицы или csv. Статистика запрашивается у демона, а если он недоступен - считается по бд
+    """
+    from stats_server import remote_grouped_stat
+
+    rows = remote_grouped_stat(SOCKET_FILE, period, unit) if not SOURCES else None
+    journal = report_journal() if rows is None else None
+    if journal is not None:
+        with journal:
+            rows = list(journal.grouped_stat(period, unit))
+    elif rows is None:
+        from reports import grouped_stat
+        rows = grouped_stat(period, unit)
+
+    if as_csv:
+        import csv
+        from sys import stdout
+
+        writer = csv.writer(stdout)
+        writer.writerow(('begin', 'end', 'seconds'))
+        for begin, end, active in rows:
+            writer.writerow((begin.isoformat(), end.isoformat(), int(active.total_seconds())))
+    else:
+        for begin, end, active in rows:
+            print(f'{begin.strftime("%d.%m.%Y %H:%M")} - {end.strftime("%d.%m.%Y %H:%M")}  '
+                  f'{active.total_seconds() / 3600:6.1f}h')
+
+
+def print_heatmap(period, as_csv: bool):
+    """
+    Вывод активного времени (в часах) за указанный промежуток по дням недели и часам в виде таблицы или csv
+    """
+    from reports import heatmap, heatmap_periods
+
+    weekdays = ('пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс')
+    journal = open_journal()
+    if journal is not None:
+        from datetime import datetime
+
+        end = period.end if period.end is not None else datetime.now()
+        with journal:
+            matrix = heatmap_periods(journal.rows(period.begin.timestamp(), end.timestamp()), period.begin, end)
+    else:
+        matrix = heatmap(period)
+
+    if as_csv:
+        import csv
+        from sys import stdout
+
+        writer = csv.writer(stdout)
+        writer.writerow(('weekday', *range(24)))
+        for weekday, row in enumerate(matrix):
+            writer.writerow((weekday, *(int(it) for it in row)))
+    else:
+        print('    ' + ''.join(f'{it:>5}' for it in range(24)))
+        for weekday, row in zip(weekdays, matrix):
+            print(f'{weekday:<4}' + ''.join(f'{it / 3600:5.1f}' for it in row))
+
+
+def export_journal(period, fmt: str, output: Optional[Path], columnar: bool = False):
+    """
+    Выгрузка записей журнала за указанный промежуток(по умолчанию весь журнал) в stdout или файл. Колоночный снимок
+    записывается в каталог output
+    """
+    from contextlib import ExitStack
+    from sys import stdout
+    from export import export, export_columnar
+
+    if columnar and output is None:
+        logger.error('для колоночного снимка требуется указать каталог параметром -o')
+        return
+
+    with ExitStack() as stack:
+        rows = None
+        journal = open_journal()
+        if journal is not None:
+            stack.enter_context(journal)
+            rows = journal.rows(period.begin.timestamp() if period is not None else None,
+                                period.end.timestamp() if period is not None and period.end is not None else None)
+
+        if columnar:
+            n = export_columnar(output, period, rows)
+            logger.info(f'выгружено записей: {n}')
+        elif output is None:
+            export(stdout.buffer, fmt, period, rows)
+            stdout.buffer.flush()
+        else:
+            with output.open('wb') as f:
+                n = export(f, fmt, period, rows)
+            logger.info(f'выгружено записей: {n}')
+
+
+def convert_journal(target: str):
+    """
+    Переносит журнал из базы sqlite в файл binlog или обратно. Существующий файл назначения не перезаписывается
     """
-    monitor = WorkStatisticsMonitor()
-    monitor.print_statistic()
+    import binlog
 
+    destination = BINLOG_FILE if target == 'binlog' else DATABASE_FILE
+    if destination.exists():
+        logger.error(f'{destination} уже существует, удалите или переместите его перед преобразованием')
+        return
 
-def statistic_monitor():
+    if target == 'binlog':
+        n = binlog.from_sqlite(DATABASE, BINLOG_FILE)
+    else:
+        n = binlog.to_sqlite(BINLOG_FILE, DATABASE)
+
+    print(f'перенесено записей: {n} в {destination}, для использования укажите storage = {target} '
+          f'в секции [journal] файла {CONFIGFILE}')
+
+
+def compact_journal(max_gap: float):
     """
-    Вывод статистики за год, месяц, неделю, день с автоматическим обновлением раз в STATISTIC_UPDATE_DELAY секунд
+    Объединяет записи журнала, между которыми не больше max_gap секунд, и пересекающиеся записи. Промежутки между
+    объединенными записями становятся активным временем. Выводит, сколько записей и байт удалось сэкономить, и
+    просит запущенного демона заново построить статистику, которую он держит в памяти
     """
-    from time import sleep
+    import compaction
+
+    path = journal_file()
+    if not path.is_file():
+        logger.error(f'журнал {path} не найден, журнал ведется командой daemon')
+        return
+
+    size = path.stat().st_size
+    if STORAGE == 'binlog':
+        try:
+            removed = compaction.compact_binlog(BINLOG_FILE, max_gap)
+        except BlockingIOError as e:
+            logger.error(f'{e}, остановите демона перед сжатием журнала')
+            return
+    else:
+        from database import new_session
+        from database.orm import engine
+
+        with new_session() as session:
+            removed = compaction.compact_database(session, max_gap)
+            session.commit()
+
+        if removed:
+            engine.execute('VACUUM')  # без этого освободившиеся страницы остаются в файле базы
+            reload_daemon_statistics()
+
+    if removed and SNAPSHOT_FILE.exists():
+        SNAPSHOT_FILE.unlink()  # снимок статистики посчитан по записям до объединения
+
+    print(f'объединено записей: {removed}, размер журнала: {size} -> {path.stat().st_size} байт')
+
+
+def reload_daemon_statistics():
+    """
+    Просит запущенного демона заново построить статистику по журналу, см. stats_server.StatsServer.reload
+    """
+    import stats_client
+
+    if SOCKET_FILE is None or not SOCKET_FILE.is_socket():
+        return  # демон не запущен или не отдает статистику
+
+    if stats_client.query(SOCKET_FILE, {'query': 'reload'}, stats_client.RELOAD_TIMEOUT) is None:
+        logger.warning('демон не обновил статистику в памяти, перезапустите его, чтобы она совпадала с журналом')
 
-    with WorkStatisticsMonitor() as monitor:
+
+def storage_unsupported():
+    if SOURCES:
+        logger.error('мониторинг и --dashboard недоступны для объединения журналов --db')
+    else:
+        logger.error(f'команда доступна только для журнала в базе sqlite, журнал {BINLOG_FILE} можно преобразовать '
+                     f'командой convert sqlite')
+
+
+def statistic_monitor(monitor: Optional['Monitor'] = None):
+    """
+    Вывод статистики (по умолчанию за год, месяц, неделю, день) с автоматическим обновлением.
+    Пока демон ведет запись, счетчики каждую секунду продлеваются без обращения к бд. Данные из бд перечитываются
+    при ее изменении, а если изменения нельзя отследить - раз в STATISTIC_UPDATE_DELAY секунд
+    """
+    from datetime import date
+    from time import monotonic
+    from file_watcher import FileWatcher
+    from work_statistics_monitor import WorkStatisticsMonitor
+
+    database_files = (DATABASE_FILE, DATABASE_FILE.with_name(DATABASE_FILE.name + '-wal'),
+                      DATABASE_FILE.with_name(DATABASE_FILE.name + '-journal'))
+
+    # запись считается продолжающейся, если демон обновлял ее не позднее двух своих интервалов назад
+    if monitor is None:
+        monitor = WorkStatisticsMonitor(SNAPSHOT_FILE, heartbeat=2 * daemon.UPDATE_DELAY)
+
+    with monitor, FileWatcher(database_files) as watcher:
         monitor.print_statistic()
+        today = date.today()
+        last_update = monotonic()
         while True:
-            sleep(STATISTIC_UPDATE_DELAY)
-            monitor.update()
+            changed = watcher.wait(MONITOR_TICK)
+            if not watcher.uses_inotify:
+                changed = monotonic() - last_update >= STATISTIC_UPDATE_DELAY
+
+            # смена дня тоже требует обновления, даже если в базу ничего не записывалось
+            if changed or today != date.today():
+                today = date.today()
+                last_update = monotonic()
+                monitor.update()
+            else:
+                monitor.tick()
+
+
+def dashboard(periods: Sequence[Tuple[str, 'Period']], follow: bool):
+    """
+    Вывод статистики за несколько периодов. В режиме follow периоды обновляются вместе, при этом из бд
+    подгружаются только новые записи
+    """
+    from work_statistics_monitor import DashboardMonitor
+
+    monitor = DashboardMonitor(periods, heartbeat=2 * daemon.UPDATE_DELAY)
+    if follow:
+        statistic_monitor(monitor)
+    else:
+        monitor.print_statistic()
 
 
 def init_logging():
@@ -83,8 +404,8 @@ def parse_args_and_init_main():
     """
 
     import argparse
-    from database import Period, create_tables, init as init_orm
-    global main
+    from datetime import date
+    global main, SOURCES, WORKERS
 
     parser = argparse.ArgumentParser(description='Программа для учета рабочего времени')
     subparsers = parser.add_subparsers(dest='action')
@@ -92,7 +413,41 @@ def parse_args_and_init_main():
     stat_parser = subparsers.add_parser('stat', help='выводит подсчитаное время')
     stat_parser.add_argument('-f', dest='follow', action='store_true',
                              help='переводит в режим постоянного мониторинга')
-    stat_parser.add_argument(dest='period', type=Period.from_string, default=None, nargs='?')
+    stat_parser.add_argument('--batch', dest='batch', action='store_true',
+                             help='считывает промежутки времени построчно из stdin и выводит статистику для каждого')
+    stat_parser.add_argument('--by', dest='by', choices=('day', 'week', 'month', 'year'), default=None,
+                             help='выводит статистику за промежуток с разбивкой по дням, неделям, месяцам или годам')
+    stat_parser.add_argument('--heatmap', dest='heatmap', action='store_true',
+                             help='выводит статистику за промежуток по дням недели и часам')
+    stat_parser.add_argument('--dashboard', dest='dashboard', action='store_true',
+                             help='выводит статистику за периоды, перечисленные в параметре dashboard файла настроек')
+    stat_parser.add_argument('--csv', dest='csv', action='store_true', help='вывод разбивки в формате csv')
+    stat_parser.add_argument('--db', dest='databases', action='append', type=Path, default=None,
+                             help='база sqlite или журнал binlog другого компьютера, указывается несколько раз. '
+                                  'Статистика считается по объединению журналов без двойного учета')
+    stat_parser.add_argument('--workers', dest='workers', type=int, default=None,
+                             help='количество процессов для подсчета --by и --batch, по умолчанию workers из файла '
+                                  'настроек')
+    stat_parser.add_argument(dest='period', type=parse_period, default=None, nargs='?')
+
+    export_parser = subparsers.add_parser('export', aliases=['log'], help='выгружает записи журнала')
+    export_parser.add_argument('--format', dest='format', choices=('csv', 'jsonl', 'bin'), default='csv',
+                               help='формат выгрузки: csv, json lines или двоичный (пары int64 начала и конца)')
+    export_parser.add_argument('--columnar', dest='columnar', action='store_true',
+                               help='записывает колоночный снимок (begin.npy, end.npy, header.json) в каталог -o')
+    export_parser.add_argument('-o', dest='output', type=Path, default=None,
+                               help='файл(или каталог для --columnar) выгрузки, по умолчанию stdout')
+    export_parser.add_argument(dest='period', type=parse_period, default=None, nargs='?')
+
+    convert_parser = subparsers.add_parser('convert', help='переносит журнал между базой sqlite и файлом binlog')
+    convert_parser.add_argument(dest='target', choices=('sqlite', 'binlog'),
+                                help='формат, в который переносится журнал')
+
+    compact_parser = subparsers.add_parser('compact', help='объединяет близкие и пересекающиеся записи журнала, '
+                                                          'промежутки между ними учитываются как активное время')
+    compact_parser.add_argument('--gap', dest='gap', type=float, default=None,
+                                help='наибольший промежуток между объединяемыми записями в секундах, '
+                                     'по умолчанию compact_gap из файла настроек')
 
     subparsers.add_parser('daemon', help='производит подсчет времени и ведет журнал')
     subparsers.add_parser('about', help='информация о программе')
@@ -101,33 +456,122 @@ def parse_args_and_init_main():
 
     if args.action == 'daemon':
         main = daemon.start  # запускает демона для записи времени активности в базу
-        init_orm(DATABASE, check_exists=False)
-        create_tables()
+        configure_statistics()
+        if STORAGE == 'binlog':
+            daemon.BINLOG_FILE = BINLOG_FILE
+        else:
+            from database import create_tables, init as init_orm
+
+            init_orm(DATABASE, check_exists=False)
+            create_tables()
+    elif args.action == 'convert':
+        def convert():
+            convert_journal(args.target)
+
+        main = convert
+    elif args.action == 'compact':
+        def compact():
+            compact_journal(args.gap if args.gap is not None else COMPACT_GAP)
+
+        main = compact
+        if STORAGE != 'binlog':
+            from database import init as init_orm
+            init_orm(DATABASE)
+    elif args.action in ('export', 'log'):
+        def export_period():
+            export_journal(args.period, args.format, args.output, args.columnar)
+
+        main = export_period
+        if STORAGE != 'binlog':
+            from database import init as init_orm
+            init_orm(DATABASE)
     elif args.action == 'about':
         main = print_info  # выводит информацию о программе
     elif args.action == 'stat':
-        if args.period:
-            def print_period_statistics():
-                from work_statistics import WorkStatistics
-                print(f'{WorkStatistics.period_stat(args.period).total_seconds() / 3600:.1f}h')
-
-            main = print_period_statistics
+        if args.databases:
+            SOURCES = args.databases
+        if args.workers is not None:
+            if args.workers < 1:
+                parser.error('количество процессов --workers должно быть положительным')
+            WORKERS = args.workers
+
+        if args.batch:
+            main = print_batch_statistics
+            if args.follow or args.period:
+                print('при использовании --batch промежутки времени считываются только из stdin')
+        elif args.by or args.heatmap:
+            def print_grouped():
+                period = args.period or parse_period(str(date.today().year))  # по умолчанию текущий год
+                if args.heatmap:
+                    print_heatmap(period, args.csv)
+                else:
+                    print_grouped_statistics(period, args.by, args.csv)
+
+            main = print_grouped
+            if args.follow:
+                print('отображение в реальном времени для разбивки по времени недоступно')
+        elif args.dashboard:
+            def print_dashboard():
+                if not DASHBOARD:
+                    print(f'периоды для отображения не указаны в {CONFIGFILE}')
+                    return
+                try:
+                    periods = [(it, parse_period(it)) for it in DASHBOARD]
+                except ValueError:
+                    logger.error(f'неверный формат периодов dashboard в {CONFIGFILE}')
+                    return
+                dashboard(periods, args.follow)
+
+            main = print_dashboard
+        elif args.period:
             if args.follow:
-                print('отображение в реальном времени для временных промежутков пока недоступно(')
+                def print_period():
+                    dashboard([(repr(args.period), args.period)], follow=True)
+
+                main = print_period
+            else:
+                def print_period():
+                    print_period_statistics(args.period)
+
+                main = print_period
+                return  # быстрый путь без orm
         else:
             if args.follow:
                 main = statistic_monitor  # данные с автоматическим обновлением
             else:
                 main = print_statistics  # просто печать данных
+                return  # быстрый путь без orm
+
+        if STORAGE == 'binlog' or SOURCES:
+            # журнал binlog и объединение журналов читаются без orm, а монитор и dashboard работают только с базой
+            if (args.follow or args.dashboard) and not (args.batch or args.by or args.heatmap):
+                main = storage_unsupported
+            return
+        if WORKERS > 1 and (args.batch or args.by) and not args.heatmap:
+            return  # процессы пула читают базу без orm
+
+        from database import init as init_orm
 
+        configure_statistics()
         init_orm(DATABASE)
     else:
         main = parser.print_help  # печать инфы о передаваемых параметрах
 
 
+def configure_statistics():
+    """
+    Передает настройки модулю подсчета статистики. Вызывается только для команд, которым нужен orm, чтобы быстрый
+    путь команды stat не загружал sqlalchemy
+    """
+    import work_statistics
+
+    work_statistics.USE_NUMPY = NUMPY_ENGINE
+    work_statistics.HEARTBEAT_FILE = HEARTBEAT_FILE
+
+
 def apply_configfile():
     from configparser import ConfigParser
-    global STATISTIC_UPDATE_DELAY
+    global STATISTIC_UPDATE_DELAY, DASHBOARD, NUMPY_ENGINE, STORAGE, COMPACT_GAP, WORKERS
 
     config = ConfigParser()
     config.read(CONFIGFILE)
@@ -135,12 +579,30 @@ def apply_configfile():
     # client
     client_config = config['client']
     STATISTIC_UPDATE_DELAY = client_config.getfloat('statistic_update_delay', STATISTIC_UPDATE_DELAY)
+    NUMPY_ENGINE = client_config.getboolean('numpy_engine', NUMPY_ENGINE)
+    DASHBOARD = [it.strip() for it in client_config.get('dashboard', '').split(',') if it.strip()]
+    WORKERS = client_config.getint('workers', WORKERS)
+    if WORKERS < 1:
+        raise ValueError(f'количество процессов workers должно быть положительным в {CONFIGFILE}')
+
+    # journal
+    STORAGE = config.get('journal', 'storage', fallback=STORAGE)
+    if STORAGE not in ('sqlite', 'binlog'):
+        raise ValueError(f'неизвестное хранилище журнала {STORAGE} в {CONFIGFILE}')
+    COMPACT_GAP = config.getfloat('journal', 'compact_gap', fallback=COMPACT_GAP)
+    daemon.KEEP_RAW_DAYS = config.getint('journal', 'keep_raw_days', fallback=daemon.KEEP_RAW_DAYS)
+    if daemon.KEEP_RAW_DAYS < 0:
+        raise ValueError(f'keep_raw_days не может быть отрицательным в {CONFIGFILE}')
 
     # daemon
     daemon_config = config['daemon']
     daemon.MINIMUM_ACTIVE_TIME = daemon_config.getfloat('minimum_active_time', daemon.MINIMUM_ACTIVE_TIME)
     daemon.MAX_COUNTED_SLEEP = daemon_config.getfloat('max_counted_sleep', daemon.MAX_COUNTED_SLEEP)
     daemon.UPDATE_DELAY = daemon_config.getfloat('update_delay', daemon.UPDATE_DELAY)
+    daemon.FLUSH_DELAY = daemon_config.getfloat('flush_delay', daemon.FLUSH_DELAY)
+    if not daemon_config.getboolean('serve_statistics', True):
+        daemon.SOCKET_FILE = None
+    daemon.METRICS_PORT = daemon_config.getint('metrics_port', daemon.METRICS_PORT)
 
 
 def create_default_configfile():
@@ -158,21 +620,60 @@ max_counted_sleep = {daemon.MAX_COUNTED_SLEEP}
 # пауза после каждого обновления статистики
 update_delay = {daemon.UPDATE_DELAY}
 
+# как часто текущий период сбрасывается в базу. Если больше update_delay, то между сбросами он хранится
+# в файле stats.heartbeat, а в базу записывается реже и при завершении работы демона
+flush_delay = {daemon.FLUSH_DELAY}
+
+# отдавать ли статистику через сокет stats.sock, чтобы команда stat не считала ее по бд
+serve_statistics = {'yes' if daemon.SOCKET_FILE is not None else 'no'}
+
+# порт, на котором демон отдает метрики в формате prometheus по адресу http://127.0.0.1:<порт>/metrics,
+# 0 - метрики не отдаются
+metrics_port = {daemon.METRICS_PORT}
+
+[journal]
+# где ведется журнал: sqlite - база stats.sqlite, binlog - файл stats.binlog с записями фиксированного размера,
+# обновление которого дешевле транзакции sqlite. Журнал переносится между форматами командой convert
+storage = {STORAGE}
+
+# записи, между которыми не больше compact_gap секунд (например, после перезапуска демона), объединяются
+# командой compact, а промежутки между ними учитываются как активное время
+compact_gap = {COMPACT_GAP}
+
+# сколько дней хранятся записи журнала sqlite без изменений. Более старые записи демон заменяет одной записью
+# на день: итоги за дни, недели, месяцы и годы сохраняются, а время внутри дня - нет. 0 - хранить все записи
+keep_raw_days = {daemon.KEEP_RAW_DAYS}
+
 [client]
-# раз в какой промежуток времени будет обновляться информация в интерактивном режиме
+# раз в какой промежуток времени будет обновляться информация в интерактивном режиме,
+# если изменения базы нельзя отследить через inotify
 statistic_update_delay = {STATISTIC_UPDATE_DELAY}
+
+# использовать ли numpy(если установлен) для подсчета статистики
+numpy_engine = {'yes' if NUMPY_ENGINE else 'no'}
+
+# периоды через запятую, выводимые командой stat --dashboard, например: 2019, 09.2019, 01.09.2019-now
+dashboard = {', '.join(DASHBOARD)}
+
+# количество процессов, в которых считаются stat --by и --batch. При значении больше 1 промежутки считаются
+# параллельно с теми же результатами, что и в одном процессе
+workers = {WORKERS}
 ''')
 
 
 def init():
+    daemon.HEARTBEAT_FILE = HEARTBEAT_FILE
+    daemon.SOCKET_FILE = SOCKET_FILE
     init_logging()
-    parse_args_and_init_main()
 
+    # настройки читаются до разбора аргументов, тк от них зависит инициализация выбранной команды
     if CONFIGFILE.is_file():
         apply_configfile()
     else:
         create_default_configfile()
 
+    parse_args_and_init_main()
+
 
 if __name__ == '__main__':
     try:
@@ -180,5 +681,5 @@ if __name__ == '__main__':
         main()
     except KeyboardInterrupt:
         pass
-    except FileNotFoundError as e:  # например, если не найдена бд
+    except (FileNotFoundError, SchemaVersionError) as e:  # например, если не найдена бд или устарела ее схема
         logger.error(e)